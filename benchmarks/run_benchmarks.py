@@ -0,0 +1,196 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.synthetic_scores import generate_pair
+from core.score_tree import Node, create_simplified_tree
+from metrics.chord_metrics import calculate_chord_metrics, get_measure_alignment_from_chords
+from metrics.element_metrics import calculate_element_metrics
+from metrics.sequence_metrics import _calculate_sequence_metrics
+from metrics.tree_edit_distance import count_nodes, tree_edit_distance
+
+ELEMENT_TYPES = ['Rest', 'Tuplet', 'Clef', 'KeySig', 'TimeSig', 'Tempo', 'Instrument', 'Staff',
+                 'Dynamic', 'Spanner', 'Fermata', 'Text', 'Lyrics']
+STAGES = ['create_simplified_tree', 'create_simplified_tree_streaming',
+          'tree_edit_distance_apted', 'tree_edit_distance_numpy', 'tree_edit_distance_approximate',
+          'sequence_metrics', 'chord_metrics', 'measure_alignment', 'element_metrics']
+DEFAULT_MAX_APTED_NODES = 500
+DEFAULT_MAX_NUMPY_NODES = 5000
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def _element_metrics(gt_tree: Node, pred_tree: Node) -> None:
+    measure_mapping = get_measure_alignment_from_chords(gt_tree, pred_tree)
+    for element_type in ELEMENT_TYPES:
+        calculate_element_metrics(gt_tree, pred_tree, element_type, measure_mapping=measure_mapping)
+
+def stage_functions(gt_path: str, pred_path: str) -> Dict[str, Callable[[Node, Node], object]]:
+    return {
+        'create_simplified_tree': lambda gt_tree, pred_tree: create_simplified_tree(pred_path),
+        'create_simplified_tree_streaming': lambda gt_tree, pred_tree: create_simplified_tree(pred_path, streaming=True),
+        'tree_edit_distance_apted': lambda gt_tree, pred_tree: tree_edit_distance(gt_tree, pred_tree, engine='apted'),
+        'tree_edit_distance_numpy': lambda gt_tree, pred_tree: tree_edit_distance(gt_tree, pred_tree, engine='numpy'),
+        'tree_edit_distance_approximate': lambda gt_tree, pred_tree: tree_edit_distance(gt_tree, pred_tree,
+                                                                                       approximate=True),
+        'sequence_metrics': lambda gt_tree, pred_tree: _calculate_sequence_metrics(gt_tree, pred_tree),
+        'chord_metrics': lambda gt_tree, pred_tree: calculate_chord_metrics(gt_tree, pred_tree),
+        'measure_alignment': lambda gt_tree, pred_tree: get_measure_alignment_from_chords(gt_tree, pred_tree),
+        'element_metrics': _element_metrics,
+    }
+
+def benchmark_pair(gt_path: str, pred_path: str, stages: List[str], repeat: int = 3,
+                   max_apted_nodes: int = DEFAULT_MAX_APTED_NODES,
+                   max_numpy_nodes: int = DEFAULT_MAX_NUMPY_NODES) -> Dict:
+    functions = stage_functions(gt_path, pred_path)
+    gt_tree = create_simplified_tree(gt_path)
+    pred_tree = create_simplified_tree(pred_path)
+    gt_nodes = count_nodes(gt_tree)
+    pred_nodes = count_nodes(pred_tree)
+    node_limits = {'tree_edit_distance_apted': max_apted_nodes, 'tree_edit_distance_numpy': max_numpy_nodes}
+
+    timings = {}
+    skipped = {}
+    for stage in stages:
+        limit = node_limits.get(stage)
+        if limit is not None and max(gt_nodes, pred_nodes) > limit:
+            skipped[stage] = f"trees larger than {limit} nodes"
+            continue
+        timings[stage] = []
+    for _ in range(repeat):
+        gt_tree = create_simplified_tree(gt_path)
+        pred_tree = create_simplified_tree(pred_path)
+        for stage in timings:
+            start = time.perf_counter()
+            functions[stage](gt_tree, pred_tree)
+            timings[stage].append(time.perf_counter() - start)
+
+    return {
+        'nodes': {'ground_truth': gt_nodes, 'predicted': pred_nodes},
+        'stages': {
+            stage: {
+                'min': min(runs),
+                'median': statistics.median(runs),
+                'max': max(runs),
+                'runs': runs,
+            }
+            for stage, runs in timings.items()
+        },
+        'skipped': skipped,
+    }
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(measures: List[int], staves: List[int], chords_per_measure: List[int],
+                   stages: Optional[List[str]] = None, repeat: int = 3, seed: int = 0,
+                   measure_insertion_rate: float = 0.02,
+                   measure_deletion_rate: float = 0.02,
+                   pitch_substitution_rate: float = 0.05,
+                   max_apted_nodes: int = DEFAULT_MAX_APTED_NODES,
+                   max_numpy_nodes: int = DEFAULT_MAX_NUMPY_NODES,
+                   scores_dir: Optional[str] = None) -> Dict:
+    if stages is None:
+        stages = STAGES
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise ValueError(f"Unsupported benchmark stages: {', '.join(unknown)}")
+    temporary_dir = tempfile.TemporaryDirectory() if scores_dir is None else None
+    output_dir = scores_dir if scores_dir is not None else temporary_dir.name
+    results = []
+    try:
+        for measure_count in measures:
+            for staff_count in staves:
+                for chord_count in chords_per_measure:
+                    print(f"Benchmarking {measure_count} measures x {staff_count} staves x "
+                          f"{chord_count} chords per measure...", file=sys.stderr)
+                    gt_path, pred_path = generate_pair(
+                        output_dir, measure_count, staff_count, chord_count, seed=seed,
+                        measure_insertion_rate=measure_insertion_rate,
+                        measure_deletion_rate=measure_deletion_rate,
+                        pitch_substitution_rate=pitch_substitution_rate
+                    )
+                    result = benchmark_pair(gt_path, pred_path, stages, repeat=repeat,
+                                            max_apted_nodes=max_apted_nodes, max_numpy_nodes=max_numpy_nodes)
+                    result['size'] = {'measures': measure_count, 'staves': staff_count,
+                                      'chords_per_measure': chord_count}
+                    results.append(result)
+    finally:
+        if temporary_dir is not None:
+            temporary_dir.cleanup()
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'revision': _git_revision(),
+        },
+        'parameters': {
+            'repeat': repeat,
+            'seed': seed,
+            'measure_insertion_rate': measure_insertion_rate,
+            'measure_deletion_rate': measure_deletion_rate,
+            'pitch_substitution_rate': pitch_substitution_rate,
+        },
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Time the evaluator stages on synthetic score pairs of increasing size',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--measures', type=int, nargs='+', default=[16, 64, 256],
+                       help='Measure counts per staff (default: 16 64 256)')
+    parser.add_argument('--staves', type=int, nargs='+', default=[2],
+                       help='Staff counts (default: 2)')
+    parser.add_argument('--chords-per-measure', type=int, nargs='+', default=[4],
+                       help='Chords and rests per measure (default: 4)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None,
+                       help='Stages to time (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timed runs per stage and size (default: 3)')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Random seed of the generated scores (default: 0)')
+    parser.add_argument('--measure-insertion-rate', type=float, default=0.02,
+                       help='Probability of an extra measure before each predicted measure (default: 0.02)')
+    parser.add_argument('--measure-deletion-rate', type=float, default=0.02,
+                       help='Probability of dropping each predicted measure (default: 0.02)')
+    parser.add_argument('--pitch-substitution-rate', type=float, default=0.05,
+                       help='Probability of shifting each predicted pitch (default: 0.05)')
+    parser.add_argument('--max-apted-nodes', type=int, default=DEFAULT_MAX_APTED_NODES,
+                       help=f'Skip exact APTED above this tree size (default: {DEFAULT_MAX_APTED_NODES})')
+    parser.add_argument('--max-numpy-nodes', type=int, default=DEFAULT_MAX_NUMPY_NODES,
+                       help=f'Skip the numpy TED engine above this tree size (default: {DEFAULT_MAX_NUMPY_NODES})')
+    parser.add_argument('--scores-dir', default=None,
+                       help='Keep the generated .mscz pairs in this directory instead of a temporary one')
+    parser.add_argument('-o', '--output', dest='output_file', default=None,
+                       help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+    report = run_benchmarks(
+        args.measures, args.staves, args.chords_per_measure,
+        stages=args.stages,
+        repeat=args.repeat,
+        seed=args.seed,
+        measure_insertion_rate=args.measure_insertion_rate,
+        measure_deletion_rate=args.measure_deletion_rate,
+        pitch_substitution_rate=args.pitch_substitution_rate,
+        max_apted_nodes=args.max_apted_nodes,
+        max_numpy_nodes=args.max_numpy_nodes,
+        scores_dir=args.scores_dir
+    )
+    output = json.dumps(report, indent=2)
+    if args.output_file:
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,154 @@
+import copy
+import random
+import zipfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from xml.sax.saxutils import escape
+
+DURATIONS = ['quarter', 'eighth', 'half', '16th']
+ARTICULATIONS = ['articStaccatoAbove', 'articAccentBelow', 'articTenutoAbove']
+DYNAMICS = ['p', 'mp', 'mf', 'f']
+SYLLABLES = ['la', 'di', 'da', 'ooh', 'ah']
+CLEFS = ['G', 'F']
+
+def _random_chord(rng: random.Random, with_lyrics: bool) -> Dict:
+    return {
+        'duration': rng.choice(DURATIONS),
+        'dots': rng.random() < 0.15,
+        'pitches': sorted(rng.sample(range(40, 85), rng.choice([1, 1, 2, 3]))),
+        'articulation': rng.choice(ARTICULATIONS) if rng.random() < 0.15 else None,
+        'slur': rng.random() < 0.1,
+        'lyrics': rng.choice(SYLLABLES) if with_lyrics and rng.random() < 0.5 else None,
+    }
+
+def _random_measure(rng: random.Random, chords_per_measure: int, with_lyrics: bool) -> Dict:
+    events = []
+    for _ in range(chords_per_measure):
+        if rng.random() < 0.1:
+            events.append({'rest': rng.choice(DURATIONS)})
+        else:
+            events.append(_random_chord(rng, with_lyrics))
+    return {
+        'dynamic': rng.choice(DYNAMICS) if rng.random() < 0.1 else None,
+        'tuplet': rng.random() < 0.05,
+        'events': events,
+    }
+
+def generate_score(measures: int, staves: int, chords_per_measure: int, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    return {
+        'title': f"Synthetic score {seed}",
+        'staves': [
+            {
+                'instrument': f"Instrument {staff_index + 1}",
+                'clef': CLEFS[staff_index % len(CLEFS)],
+                'key': rng.randint(-4, 4),
+                'time_signature': rng.choice([(3, 4), (4, 4), (6, 8)]),
+                'tempo': 'Allegro' if staff_index == 0 else None,
+                'lyrics': staff_index == 0,
+                'measures': [_random_measure(rng, chords_per_measure, staff_index == 0) for _ in range(measures)],
+            }
+            for staff_index in range(staves)
+        ],
+    }
+
+def perturb_score(score: Dict, seed: int = 0,
+                  measure_insertion_rate: float = 0.0,
+                  measure_deletion_rate: float = 0.0,
+                  pitch_substitution_rate: float = 0.0) -> Dict:
+    rng = random.Random(seed)
+    perturbed = copy.deepcopy(score)
+    for staff in perturbed['staves']:
+        chords_per_measure = max((len(measure['events']) for measure in staff['measures']), default=1)
+        measures = []
+        for measure in staff['measures']:
+            if rng.random() < measure_insertion_rate:
+                measures.append(_random_measure(rng, chords_per_measure, staff['lyrics']))
+            if rng.random() < measure_deletion_rate and len(staff['measures']) > 1:
+                continue
+            for event in measure['events']:
+                if 'pitches' not in event:
+                    continue
+                event['pitches'] = [pitch + rng.choice([-2, -1, 1, 2]) if rng.random() < pitch_substitution_rate
+                                    else pitch for pitch in event['pitches']]
+            measures.append(measure)
+        staff['measures'] = measures or staff['measures'][:1]
+    return perturbed
+
+def _render_chord(chord: Dict) -> str:
+    parts = ['<Chord>']
+    if chord['dots']:
+        parts.append('<dots>1</dots>')
+    parts.append(f"<durationType>{chord['duration']}</durationType>")
+    if chord['slur']:
+        parts.append('<Spanner type="Slur"></Spanner>')
+    if chord['articulation'] is not None:
+        parts.append(f"<Articulation><subtype>{chord['articulation']}</subtype></Articulation>")
+    if chord['lyrics'] is not None:
+        parts.append(f"<Lyrics><text>{escape(chord['lyrics'])}</text></Lyrics>")
+    for pitch in chord['pitches']:
+        parts.append(f"<Note><pitch>{pitch}</pitch></Note>")
+    parts.append('</Chord>')
+    return ''.join(parts)
+
+def _render_measure(staff: Dict, measure: Dict, first: bool) -> str:
+    parts = ['<Measure><voice>']
+    if first:
+        parts.append(f"<Clef><concertClefType>{staff['clef']}</concertClefType></Clef>")
+        parts.append(f"<KeySig><concertKey>{staff['key']}</concertKey></KeySig>")
+        numerator, denominator = staff['time_signature']
+        parts.append(f"<TimeSig><sigN>{numerator}</sigN><sigD>{denominator}</sigD></TimeSig>")
+        if staff['tempo'] is not None:
+            parts.append(f"<Tempo><text>{escape(staff['tempo'])} <b>q</b> = 120</text></Tempo>")
+    if measure['dynamic'] is not None:
+        parts.append(f"<Dynamic><subtype>{measure['dynamic']}</subtype></Dynamic>")
+    if measure['tuplet']:
+        parts.append('<Tuplet><normalNotes>2</normalNotes><actualNotes>3</actualNotes>'
+                     '<baseNote>eighth</baseNote></Tuplet>')
+    for event in measure['events']:
+        if 'rest' in event:
+            parts.append(f"<Rest><durationType>{event['rest']}</durationType></Rest>")
+        else:
+            parts.append(_render_chord(event))
+    parts.append('</voice></Measure>')
+    return ''.join(parts)
+
+def render_mscx(score: Dict) -> str:
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<museScore version="4.20"><Score><Division>480</Division>']
+    for staff_index, staff in enumerate(score['staves'], 1):
+        parts.append(f'<Part><Staff id="{staff_index}"><defaultClef>{staff["clef"]}</defaultClef></Staff>'
+                     f'<trackName>{escape(staff["instrument"])}</trackName></Part>')
+    for staff_index, staff in enumerate(score['staves'], 1):
+        parts.append(f'<Staff id="{staff_index}">')
+        if staff_index == 1:
+            parts.append(f"<VBox><Text><style>title</style><text>{escape(score['title'])}</text></Text></VBox>")
+        for measure_index, measure in enumerate(staff['measures']):
+            parts.append(_render_measure(staff, measure, measure_index == 0))
+        parts.append('</Staff>')
+    parts.append('</Score></museScore>\n')
+    return ''.join(parts)
+
+def write_mscz(path: str, score: Dict) -> None:
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(f"{Path(path).stem}.mscx", render_mscx(score))
+
+def generate_pair(output_dir: str, measures: int, staves: int, chords_per_measure: int,
+                  seed: int = 0,
+                  measure_insertion_rate: float = 0.0,
+                  measure_deletion_rate: float = 0.0,
+                  pitch_substitution_rate: float = 0.0,
+                  name: Optional[str] = None) -> Tuple[str, str]:
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    if name is None:
+        name = f"synthetic_m{measures}_s{staves}_c{chords_per_measure}_seed{seed}"
+    ground_truth = generate_score(measures, staves, chords_per_measure, seed=seed)
+    predicted = perturb_score(ground_truth, seed=seed + 1,
+                              measure_insertion_rate=measure_insertion_rate,
+                              measure_deletion_rate=measure_deletion_rate,
+                              pitch_substitution_rate=pitch_substitution_rate)
+    gt_path = str(output_path / f"{name}_gt.mscz")
+    pred_path = str(output_path / f"{name}_pred.mscz")
+    write_mscz(gt_path, ground_truth)
+    write_mscz(pred_path, predicted)
+    return gt_path, pred_path
@@ -3,14 +3,36 @@ import sys
 import argparse
 import json
 from pathlib import Path
-from collections import defaultdict
-from typing import Dict, List
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import cProfile
 import csv
+import heapq
+import pickle
+import tempfile
 from calculate_metrics import calculate_all_metrics
+from metrics.tree_edit_distance import TED_ENGINES
+from metrics.ground_truth_bundle import GroundTruthBundle, GroundTruthFeatures
+from metrics.results_store import ResultsJournal, ResultsStore, metric_config_key
+from core.tree_cache import file_digest
+from core.score_tree import mscx_uncompressed_size
 from metrics.output import print_metrics
-import io
+from metrics.progress import (
+    LOG_LEVELS,
+    configure_logging,
+    get_logger,
+    pair_context,
+    report_progress,
+    worker_logging_arguments,
+)
 from contextlib import redirect_stdout
+import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+
+logger = get_logger('calculate_average_metrics')
 
 def get_filenames_from_dataset() -> List[str]:
     json_path = Path("./data/omr_benchmark/benchmark_dataset.json")
@@ -19,7 +41,7 @@ def get_filenames_from_dataset() -> List[str]:
             f"benchmark_dataset.json not found at {json_path}. "
             f"Please run download_dataset.py first to download it."
         )
-    print("Loading dataset from benchmark_dataset.json...")
+    logger.info("Loading dataset from benchmark_dataset.json...")
     with open(json_path, 'r') as f:
         dataset_json = json.load(f)
 
@@ -30,7 +52,7 @@ def get_filenames_from_dataset() -> List[str]:
             score_path = sample_data["score"]
             filename = Path(score_path).name
             filenames.append(filename)
-    print(f"Found {len(filenames)} files in dataset")
+    logger.info(f"Found {len(filenames)} files in dataset")
     return filenames
 
 def find_matching_files(true_dir: str, predicted_dir: str) -> List[tuple]:
@@ -61,16 +83,16 @@ def find_matching_files(true_dir: str, predicted_dir: str) -> List[tuple]:
                 missing_pred.append(filename)
 
     if missing_true:
-        print(f"Warning: {len(missing_true)} files from dataset not found in {true_dir}")
-        print(f"   Examples: {missing_true[:5]}")
+        logger.warning(f"Warning: {len(missing_true)} files from dataset not found in {true_dir}")
+        logger.warning(f"   Examples: {missing_true[:5]}")
     if missing_pred:
-        print(f"Warning: {len(missing_pred)} files from dataset not found in {predicted_dir}")
-        print(f"   Examples: {missing_pred[:5]}")
+        logger.warning(f"Warning: {len(missing_pred)} files from dataset not found in {predicted_dir}")
+        logger.warning(f"   Examples: {missing_pred[:5]}")
     
     if not pairs:
-        print(f"Warning: no matching files found")
-        print(f"   Files in {true_dir}: {list(true_files.keys())[:5]}...")
-        print(f"   Files in {predicted_dir}: {list(pred_files.keys())[:5]}...")
+        logger.warning(f"Warning: no matching files found")
+        logger.warning(f"   Files in {true_dir}: {list(true_files.keys())[:5]}...")
+        logger.warning(f"   Files in {predicted_dir}: {list(pred_files.keys())[:5]}...")
         return []
 
     return sorted(pairs, key=lambda x: x[2])
@@ -94,6 +116,25 @@ def format_metric_name(key: str) -> str:
             formatted_words.append(word.capitalize())
     return ' '.join(formatted_words)
 
+def estimate_pair_cost(true_path: str, pred_path: str) -> int:
+    try:
+        return mscx_uncompressed_size(true_path) * mscx_uncompressed_size(pred_path)
+    except Exception:
+        return 0
+
+def schedule_pairs(file_pairs: List[tuple], indices: List[int]) -> List[int]:
+    costs = {index: estimate_pair_cost(str(file_pairs[index][0]), str(file_pairs[index][1]))
+             for index in indices}
+    return sorted(indices, key=lambda index: (-costs[index], index))
+
+def budget_fallbacks(results: Dict) -> List[str]:
+    fallbacks = []
+    if results.get('tree_edit_distance', {}).get('approximate'):
+        fallbacks.append('approximate TED')
+    if results.get('chord_metrics', {}).get('alignment_fallback') or results.get('measure_alignment_fallback'):
+        fallbacks.append('reduced chord alignment')
+    return fallbacks
+
 def flatten_metrics(results: Dict, prefix: str = "") -> Dict[str, float]:
     flattened = {}
 
@@ -101,6 +142,10 @@ def flatten_metrics(results: Dict, prefix: str = "") -> Dict[str, float]:
         ted = results['tree_edit_distance']
         flattened['tree_edit_distance.accuracy'] = ted.get('accuracy', 0)
 
+    if 'tree_edit_distance_decomposed' in results:
+        decomposed = results['tree_edit_distance_decomposed']
+        flattened['tree_edit_distance_decomposed.accuracy'] = decomposed.get('accuracy', 0)
+
     if 'cer' in results:
         cer = results['cer']
         flattened['cer.accuracy'] = cer.get('accuracy', 0)
@@ -191,10 +236,146 @@ def flatten_metrics(results: Dict, prefix: str = "") -> Dict[str, float]:
                 flattened['element_metrics.lyrics.combined_accuracy'] = lyrics_metrics['combined_lyrics'].get('accuracy', 0)
     return flattened
 
+class MetricsAggregator:
+    def __init__(self, spill_details: bool = False):
+        self.metric_sums = defaultdict(float)
+        self.metric_counts = defaultdict(int)
+        self.processed_indices = []
+        self.detailed_indices = []
+        self._spill_file = tempfile.TemporaryFile() if spill_details else None
+        self._next_index = 0
+        self._waiting = {}
+
+    def __len__(self) -> int:
+        return len(self.processed_indices)
+
+    def add(self, index: int, results: Dict) -> Dict:
+        flat_metrics = flatten_metrics(results)
+        self.add_flattened(index, flat_metrics)
+        if self._spill_file is not None:
+            pickle.dump(results, self._spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.detailed_indices.append(index)
+        return flat_metrics
+
+    def add_flattened(self, index: int, flat_metrics: Dict) -> None:
+        self.processed_indices.append(index)
+        self._fold(index, flat_metrics)
+
+    def skip(self, index: int) -> None:
+        self._fold(index, None)
+
+    def _fold(self, index: int, flat_metrics: Optional[Dict]) -> None:
+        self._waiting[index] = flat_metrics
+        while self._next_index in self._waiting:
+            flat_metrics = self._waiting.pop(self._next_index)
+            self._next_index += 1
+            if flat_metrics is None:
+                continue
+            for key, value in flat_metrics.items():
+                if isinstance(value, (int, float)) and not (isinstance(value, float) and (value != value)):
+                    self.metric_sums[key] += value
+                    self.metric_counts[key] += 1
+
+    def average_metrics(self) -> Dict[str, float]:
+        if self._waiting:
+            raise ValueError(f"Results for pair {self._next_index} were never added or skipped")
+        average_metrics = {}
+        for key in self.metric_sums:
+            if self.metric_counts[key] > 0:
+                average_metrics[key] = self.metric_sums[key] / self.metric_counts[key]
+        return average_metrics
+
+    def iter_results(self) -> Iterator[Tuple[int, Dict]]:
+        if self._spill_file is None:
+            raise ValueError("Per-file results were not kept; create the aggregator with spill_details=True")
+        self._spill_file.seek(0)
+        for index in self.detailed_indices:
+            yield index, pickle.load(self._spill_file)
+
+    def close(self) -> None:
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+class InstrumentationAggregator:
+    def __init__(self):
+        self.pairs = 0
+        self.elapsed_total = 0.0
+        self.sections = {'phases': defaultdict(float), 'timings': defaultdict(float), 'counters': defaultdict(int)}
+        self.pair_elapsed = []
+
+    def add(self, filename: str, instrumentation: Optional[Dict]) -> None:
+        if not instrumentation:
+            return
+        self.pairs += 1
+        self.elapsed_total += instrumentation.get('elapsed', 0.0)
+        self.pair_elapsed.append((instrumentation.get('elapsed', 0.0), filename))
+        for section, totals in self.sections.items():
+            for name, value in instrumentation.get(section, {}).items():
+                totals[name] += value
+
+    def slowest(self, limit: int) -> List[Tuple[str, float]]:
+        return [(filename, elapsed) for elapsed, filename in heapq.nlargest(limit, self.pair_elapsed)]
+
+    def summary(self, slowest_limit: int = 10) -> Dict:
+        if not self.pairs:
+            return {}
+        summary = {
+            'pairs': self.pairs,
+            'elapsed': {'total': self.elapsed_total, 'mean': self.elapsed_total / self.pairs,
+                        'max': max(elapsed for elapsed, _ in self.pair_elapsed)},
+            'slowest_pairs': self.slowest(slowest_limit)
+        }
+        for section, totals in self.sections.items():
+            summary[section] = {name: {'total': total, 'mean': total / self.pairs}
+                                for name, total in sorted(totals.items())}
+        return summary
+
+class SlowestPairProfiles:
+    def __init__(self, profile_dir: str, limit: int):
+        self.profile_dir = Path(profile_dir)
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self.limit = limit
+        self._kept = []
+
+    def path(self, filename: str) -> str:
+        return str(self.profile_dir / f"{Path(filename).stem}.prof")
+
+    def keep(self, filename: str, elapsed: Optional[float]) -> None:
+        if elapsed is None:
+            self._remove(filename)
+            return
+        heapq.heappush(self._kept, (elapsed, filename))
+        if len(self._kept) > self.limit:
+            _, evicted = heapq.heappop(self._kept)
+            self._remove(evicted)
+
+    def _remove(self, filename: str) -> None:
+        try:
+            os.remove(self.path(filename))
+        except FileNotFoundError:
+            pass
+
+    def kept(self) -> List[Tuple[str, str]]:
+        return [(filename, self.path(filename)) for _, filename in sorted(self._kept, reverse=True)]
+
+def save_instrumentation_to_csv(summary: Dict, output_dir: Path) -> None:
+    rows = []
+    for section in ('phases', 'timings', 'counters'):
+        for name, values in summary.get(section, {}).items():
+            rows.append({'Section': section, 'Name': name,
+                         'Total': f"{values['total']:.6f}", 'Mean': f"{values['mean']:.6f}"})
+    if rows:
+        with open(output_dir / 'instrumentation.csv', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['Section', 'Name', 'Total', 'Mean'])
+            writer.writeheader()
+            writer.writerows(rows)
+        logger.info(f"Saved instrumentation.csv ({len(rows)} rows)")
+
 def save_metrics_to_csv(average_metrics: Dict[str, float], output_dir: Path) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
     csv_categories = {
-        'tree_level_metrics.csv': ['tree_edit_distance.accuracy'],
+        'tree_level_metrics.csv': ['tree_edit_distance.accuracy', 'tree_edit_distance_decomposed.accuracy'],
         'sequence_metrics.csv': ['cer.accuracy', 'ser.accuracy'],
         'musical_structure_metrics.csv': ['chord_metrics.', 'element_metrics.rest.', 'element_metrics.tuplet.'],
         'score_structure_metrics.csv': ['element_metrics.clef.', 'element_metrics.keysig.',
@@ -221,116 +402,407 @@ def save_metrics_to_csv(average_metrics: Dict[str, float], output_dir: Path) ->
                 writer = csv.DictWriter(f, fieldnames=['Metric', 'Value'])
                 writer.writeheader()
                 writer.writerows(rows)
-            print(f"Saved {csv_filename} ({len(rows)} metrics)")
+            logger.info(f"Saved {csv_filename} ({len(rows)} metrics)")
 
-def save_detailed_reports(all_metrics: List[Dict], file_pairs: List[tuple], output_dir: Path) -> None:
+def save_detailed_reports(all_metrics: Iterable[Dict], file_pairs: List[tuple], output_dir: Path) -> None:
     reports_dir = output_dir / 'detailed_reports'
     reports_dir.mkdir(parents=True, exist_ok=True)
 
     for metrics, (true_path, pred_path, filename) in zip(all_metrics, file_pairs):
         report_path = reports_dir / f"{Path(filename).stem}.txt"
-        output_buffer = io.StringIO()
-        with redirect_stdout(output_buffer):
+        with open(report_path, 'w', encoding='utf-8') as f, redirect_stdout(f):
             print(f"File: {filename}")
             print(f"Ground truth: {true_path}")
             print(f"Predicted: {pred_path}")
             print("\n" + "="*80 + "\n")
             print_metrics(metrics, show_detailed_errors=True)
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(output_buffer.getvalue())
-        print(f"Saved detailed report: {report_path.name}")
+        logger.info(f"Saved detailed report: {report_path.name}")
+
+_ground_truth_bundles = {}
+
+def open_ground_truth_bundle(bundle_path: str) -> GroundTruthBundle:
+    bundle = _ground_truth_bundles.get(bundle_path)
+    if bundle is None:
+        bundle = GroundTruthBundle(bundle_path)
+        _ground_truth_bundles[bundle_path] = bundle
+    return bundle
+
+def close_ground_truth_bundles() -> None:
+    while _ground_truth_bundles:
+        _, bundle = _ground_truth_bundles.popitem()
+        bundle.close()
+
+def init_batch_worker(logging_arguments: Optional[Tuple[str, Optional[str]]]) -> None:
+    if logging_arguments is not None:
+        configure_logging(*logging_arguments)
+    Finalize(None, close_ground_truth_bundles, exitpriority=0)
+
+def load_ground_truth_features(bundle_path: str, true_path: str,
+                                digest: Optional[str] = None) -> Optional[GroundTruthFeatures]:
+    if digest is None:
+        digest = file_digest(true_path)
+    return open_ground_truth_bundle(bundle_path).get(Path(true_path).name, digest)
+
+def process_file_pair(true_path: str, pred_path: str,
+                      ted_approximate: bool = False,
+                      chord_use_alignment: bool = True,
+                      metric_groups: List[str] = None,
+                      streaming_parser: bool = False,
+                      measure_band: Optional[int] = None,
+                      ted_engine: str = 'apted',
+                      ted_decomposed: bool = False,
+                      ted_jobs: int = 1,
+                      tree_cache_dir: Optional[str] = None,
+                      ground_truth_bundle: Optional[str] = None,
+                      time_budget: Optional[float] = None,
+                      memory_budget_mb: Optional[int] = None,
+                      profile_path: Optional[str] = None,
+                      ground_truth_digest: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+    start = time.perf_counter()
+    profiler = cProfile.Profile() if profile_path is not None else None
+    with pair_context(Path(true_path).name):
+        if profiler is not None:
+            profiler.enable()
+        try:
+            ground_truth_features = None
+            if ground_truth_bundle is not None:
+                ground_truth_features = load_ground_truth_features(ground_truth_bundle, true_path,
+                                                                   ground_truth_digest)
+            results = calculate_all_metrics(
+                true_path,
+                pred_path,
+                ted_approximate=ted_approximate,
+                chord_use_alignment=chord_use_alignment,
+                metric_groups=metric_groups,
+                streaming_parser=streaming_parser,
+                measure_band=measure_band,
+                ted_engine=ted_engine,
+                ted_decomposed=ted_decomposed,
+                ted_jobs=ted_jobs,
+                tree_cache_dir=tree_cache_dir,
+                ground_truth_features=ground_truth_features,
+                time_budget=time_budget,
+                memory_budget_mb=memory_budget_mb
+            )
+        except Exception as e:
+            report_progress('pair', time.perf_counter() - start, status='error', error=str(e))
+            return None, str(e)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+        report_progress('pair', time.perf_counter() - start, status='ok')
+        return results, None
 
 def calculate_average_metrics(true_dir: str, predicted_dir: str,
                              ted_approximate: bool = False,
                              chord_use_alignment: bool = True,
                              output_file: str = None,
                              detailed_errors: bool = False,
-                             metric_groups: List[str] = None) -> Dict:
-    print("="*80)
-    print("COMPUTING AVERAGE METRICS ACROSS FILES")
-    print("="*80)
-    print(f"Ground truth folder: {true_dir}")
-    print(f"Predicted folder: {predicted_dir}")
-    print()
+                             metric_groups: List[str] = None,
+                             jobs: int = 1,
+                             streaming_parser: bool = False,
+                             measure_band: Optional[int] = None,
+                             ted_engine: str = 'apted',
+                             ted_decomposed: bool = False,
+                             ted_jobs: int = 1,
+                             tree_cache_dir: Optional[str] = None,
+                             ground_truth_bundle: Optional[str] = None,
+                             results_store: Optional[str] = None,
+                             journal: Optional[str] = None,
+                             resume: bool = False,
+                             time_budget: Optional[float] = None,
+                             memory_budget_mb: Optional[int] = None,
+                             profile_dir: Optional[str] = None,
+                             profile_slowest: int = 5) -> Dict:
+    logger.info("="*80)
+    logger.info("COMPUTING AVERAGE METRICS ACROSS FILES")
+    batch_start = time.perf_counter()
+    logger.info("="*80)
+    logger.info(f"Ground truth folder: {true_dir}")
+    logger.info(f"Predicted folder: {predicted_dir}")
+    logger.info("")
     
     file_pairs = find_matching_files(true_dir, predicted_dir)
     
     if not file_pairs:
-        print("No files found for processing")
+        logger.info("No files found for processing")
         return {}
     
-    print(f"Found {len(file_pairs)} file pairs for processing")
-    print()
-    
-    all_metrics = []
-    failed_files = []
-    
-    for i, (true_path, pred_path, filename) in enumerate(file_pairs, 1):
-        print(f"[{i}/{len(file_pairs)}] Processing {filename}...")
-        try:
-            results = calculate_all_metrics(
-                str(true_path),
-                str(pred_path),
-                ted_approximate=ted_approximate,
-                chord_use_alignment=chord_use_alignment,
-                metric_groups=metric_groups
-            )
-            all_metrics.append(results)
-            print(f"Successfully processed")
-        except Exception as e:
-            print(f"Error processing: {e}")
-            failed_files.append((filename, str(e)))
-            continue
+    logger.info(f"Found {len(file_pairs)} file pairs for processing")
+    if ground_truth_bundle is not None:
+        bundle = open_ground_truth_bundle(ground_truth_bundle)
+        covered = sum(1 for _, _, filename in file_pairs if filename in bundle)
+        logger.info(f"Using ground truth bundle {ground_truth_bundle} ({covered}/{len(file_pairs)} files)")
+    logger.info("")
 
-    if not all_metrics:
-        print("Failed to process any files")
+    failed_files = []
+    fallback_files = []
+    store = None
+    pair_digests = None
+    stored = set()
+    config_key = metric_config_key(
+        ted_approximate=ted_approximate,
+        chord_use_alignment=chord_use_alignment,
+        metric_groups=sorted(metric_groups) if metric_groups else None,
+        measure_band=measure_band,
+        ted_engine=ted_engine,
+        ted_decomposed=ted_decomposed,
+        time_budget=time_budget,
+        memory_budget_mb=memory_budget_mb
+    )
+    run_journal = None
+    journaled = {}
+    if resume and journal is None:
+        raise ValueError("resume requires a journal file")
+    if results_store is not None or journal is not None:
+        pair_digests = [(file_digest(str(true_path)), file_digest(str(pred_path)))
+                        for true_path, pred_path, _ in file_pairs]
+    if journal is not None:
+        run_journal = ResultsJournal(journal, config_key, resume=resume)
+        for index, (_, _, filename) in enumerate(file_pairs):
+            flat_metrics = run_journal.get(filename, *pair_digests[index])
+            if flat_metrics is not None:
+                journaled[index] = flat_metrics
+        if resume:
+            logger.info(f"Resuming from journal {journal}: {len(journaled)}/{len(file_pairs)} pairs completed")
+            logger.info("")
+    if results_store is not None:
+        store = ResultsStore(results_store)
+        stored = {index for index, (gt_digest, pred_digest) in enumerate(pair_digests)
+                  if store.contains(gt_digest, pred_digest, config_key)}
+        logger.info(f"Results store {results_store}: {len(stored)}/{len(file_pairs)} pairs up to date")
+        logger.info("")
+    stored -= set(journaled)
+
+    def ground_truth_digest(index: int) -> Optional[str]:
+        return pair_digests[index][0] if pair_digests is not None else None
+    pending = [index for index in range(len(file_pairs)) if index not in stored and index not in journaled]
+    aggregator = MetricsAggregator(spill_details=bool(output_file and detailed_errors))
+    instrumentation = InstrumentationAggregator()
+    profiles = SlowestPairProfiles(profile_dir, profile_slowest) if profile_dir is not None else None
+
+    def finish_pair(index: int, results: Optional[Dict], error: Optional[str]) -> None:
+        filename = file_pairs[index][2]
+        if error is not None:
+            logger.error(f"Error processing: {error}")
+            failed_files.append((filename, error))
+            aggregator.skip(index)
+            if profiles is not None:
+                profiles.keep(filename, None)
+            return
+        instrumentation.add(filename, results.get('instrumentation'))
+        if profiles is not None:
+            profiles.keep(filename, results.get('instrumentation', {}).get('elapsed', 0.0))
+        fallbacks = budget_fallbacks(results)
+        if fallbacks:
+            logger.warning(f"Budget exceeded, used {' and '.join(fallbacks)}")
+            fallback_files.append((filename, fallbacks))
+        if store is not None:
+            store.put(pair_digests[index][0], pair_digests[index][1], config_key, filename, results)
+        flat_metrics = aggregator.add(index, results)
+        if run_journal is not None:
+            run_journal.record(filename, *pair_digests[index], flat_metrics)
+        logger.info(f"Successfully processed")
+
+    for index in sorted(journaled):
+        aggregator.add_flattened(index, journaled[index])
+    for index in sorted(stored):
+        flat_metrics = aggregator.add(index, store.get(pair_digests[index][0], pair_digests[index][1], config_key))
+        if run_journal is not None:
+            run_journal.record(file_pairs[index][2], *pair_digests[index], flat_metrics)
+
+    executor = None
+    try:
+        if jobs > 1 and pending:
+            logger.info(f"Processing with {jobs} worker processes, largest pairs first")
+            worker_logging = worker_logging_arguments()
+
+            def start_executor() -> ProcessPoolExecutor:
+                return ProcessPoolExecutor(
+                    max_workers=jobs,
+                    initializer=init_batch_worker,
+                    initargs=(worker_logging,)
+                )
+
+            executor = start_executor()
+            queue = deque(schedule_pairs(file_pairs, pending))
+            running = {}
+
+            def submit_next() -> None:
+                index = queue.popleft()
+                true_path, pred_path, filename = file_pairs[index]
+                try:
+                    future = executor.submit(
+                        process_file_pair, str(true_path), str(pred_path),
+                        ted_approximate, chord_use_alignment, metric_groups, streaming_parser,
+                        measure_band, ted_engine, ted_decomposed, ted_jobs, tree_cache_dir,
+                        ground_truth_bundle, time_budget, memory_budget_mb,
+                        profiles.path(filename) if profiles is not None else None,
+                        ground_truth_digest(index)
+                    )
+                except BrokenProcessPool:
+                    queue.appendleft(index)
+                    raise
+                running[future] = index
+
+            completed = 0
+            while running or queue:
+                try:
+                    while queue and len(running) < jobs * 2:
+                        submit_next()
+                except BrokenProcessPool:
+                    if not running:
+                        logger.warning("Worker pool stopped unexpectedly, restarting it")
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = start_executor()
+                        continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    completed += 1
+                    logger.info(f"[{completed}/{len(pending)}] Finished {file_pairs[index][2]}")
+                    try:
+                        results, error = future.result()
+                    except BrokenProcessPool as e:
+                        results, error = None, f"worker process stopped unexpectedly: {e}"
+                    except Exception as e:
+                        results, error = None, str(e)
+                    finish_pair(index, results, error)
+                    del results
+        else:
+            for index in pending:
+                true_path, pred_path, filename = file_pairs[index]
+                logger.info(f"[{index + 1}/{len(file_pairs)}] Processing {filename}...")
+                results, error = process_file_pair(
+                    str(true_path),
+                    str(pred_path),
+                    ted_approximate=ted_approximate,
+                    chord_use_alignment=chord_use_alignment,
+                    metric_groups=metric_groups,
+                    streaming_parser=streaming_parser,
+                    measure_band=measure_band,
+                    ted_engine=ted_engine,
+                    ted_decomposed=ted_decomposed,
+                    ted_jobs=ted_jobs,
+                    tree_cache_dir=tree_cache_dir,
+                    ground_truth_bundle=ground_truth_bundle,
+                    time_budget=time_budget,
+                    memory_budget_mb=memory_budget_mb,
+                    profile_path=profiles.path(filename) if profiles is not None else None,
+                    ground_truth_digest=ground_truth_digest(index)
+                )
+                finish_pair(index, results, error)
+                del results
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if store is not None:
+            store.close()
+        if run_journal is not None:
+            run_journal.close()
+        close_ground_truth_bundles()
+    failed_files.sort()
+    fallback_files.sort()
+    report_progress('batch', time.perf_counter() - batch_start, total=len(file_pairs),
+                    processed=len(aggregator), failed=len(failed_files))
+
+    if not len(aggregator):
+        logger.error("Failed to process any files")
+        aggregator.close()
         return {}
 
-    print()
-    print("="*80)
-    print("COMPUTING AVERAGE VALUES")
-    print("="*80)
-
-    flattened_metrics_list = [flatten_metrics(m) for m in all_metrics]
-
-    metric_sums = defaultdict(float)
-    metric_counts = defaultdict(int)
-
-    for flat_metrics in flattened_metrics_list:
-        for key, value in flat_metrics.items():
-            if isinstance(value, (int, float)) and not (isinstance(value, float) and (value != value)):
-                metric_sums[key] += value
-                metric_counts[key] += 1
+    logger.info("")
+    logger.info("="*80)
+    logger.info("COMPUTING AVERAGE VALUES")
+    logger.info("="*80)
 
-    average_metrics = {}
-    for key in metric_sums:
-        if metric_counts[key] > 0:
-            average_metrics[key] = metric_sums[key] / metric_counts[key]
+    average_metrics = aggregator.average_metrics()
+    instrumentation_summary = instrumentation.summary()
+    if profiles is not None:
+        instrumentation_summary['profiles'] = profiles.kept()
 
     result = {
         'summary': {
             'total_files': len(file_pairs),
-            'processed_files': len(all_metrics),
+            'processed_files': len(aggregator),
             'failed_files': len(failed_files),
+            'fallback_files': len(fallback_files),
             'true_dir': true_dir,
             'predicted_dir': predicted_dir
         },
         'average_metrics': average_metrics,
-        'failed_files': failed_files
+        'failed_files': failed_files,
+        'fallback_files': fallback_files,
+        'instrumentation': instrumentation_summary
     }
 
-    print(f"\nProcessed files: {len(all_metrics)}/{len(file_pairs)}")
+    if instrumentation_summary:
+        logger.info("\n" + "="*80)
+        logger.info("PHASE TIMINGS")
+        logger.info("="*80)
+        elapsed = instrumentation_summary['elapsed']
+        logger.info(f"Computed pairs: {instrumentation_summary['pairs']} "
+                    f"(mean {elapsed['mean']:.2f}s, max {elapsed['max']:.2f}s per pair)")
+        for section, title in (('phases', 'Phases'), ('timings', 'Steps')):
+            logger.info(f"\n{title} (mean seconds per pair):")
+            for name, values in sorted(instrumentation_summary[section].items(),
+                                       key=lambda item: -item[1]['mean']):
+                logger.info(f"  {name}: {values['mean']:.4f}")
+        logger.info("\nCounters (mean per pair):")
+        for name, values in instrumentation_summary['counters'].items():
+            logger.info(f"  {name}: {values['mean']:.1f}")
+        logger.info("\nSlowest pairs:")
+        for filename, seconds in instrumentation_summary['slowest_pairs'][:5]:
+            logger.info(f"  - {filename}: {seconds:.2f}s")
+        if profiles is not None:
+            logger.info(f"\nProfiles of the {len(instrumentation_summary['profiles'])} slowest pairs "
+                        f"saved to {profile_dir}")
+
+    if output_file:
+        output_path = Path(output_file)
+        output_path.mkdir(parents=True, exist_ok=True)
+        logger.info("\n" + "="*80)
+        logger.info("SAVING CSV REPORTS")
+        logger.info("="*80)
+        save_metrics_to_csv(average_metrics, output_path)
+        save_instrumentation_to_csv(instrumentation_summary, output_path)
+        if detailed_errors:
+            logger.info("\n" + "="*80)
+            logger.info("SAVING DETAILED REPORTS")
+            logger.info("="*80)
+            if len(aggregator.detailed_indices) < len(aggregator):
+                logger.info(f"Note: {len(aggregator) - len(aggregator.detailed_indices)} pairs restored from the "
+                      f"journal have no detailed results and are skipped")
+            save_detailed_reports((results for _, results in aggregator.iter_results()),
+                                  [file_pairs[index] for index in aggregator.detailed_indices],
+                                  output_path)
+    aggregator.close()
+    logger.info("\n" + "="*80 + "\n")
+
+    return result
+
+
+def print_average_metrics(result: Dict) -> None:
+    summary = result['summary']
+    print(f"\nProcessed files: {summary['processed_files']}/{summary['total_files']}")
+    failed_files = result['failed_files']
+    fallback_files = result['fallback_files']
     if failed_files:
         print(f"\nFiles with errors ({len(failed_files)}):")
         for filename, error in failed_files:
             print(f"  - {filename}: {error}")
+    if fallback_files:
+        print(f"\nFiles computed with fallbacks after exceeding the budget ({len(fallback_files)}):")
+        for filename, fallbacks in fallback_files:
+            print(f"  - {filename}: {', '.join(fallbacks)}")
 
     print("\n" + "="*80)
     print("AVERAGE ACCURACY METRICS")
     print("="*80)
 
     categories = {
-        '1. TREE-LEVEL METRICS': ['tree_edit_distance.accuracy'],
+        '1. TREE-LEVEL METRICS': ['tree_edit_distance.accuracy', 'tree_edit_distance_decomposed.accuracy'],
         '2. SEQUENCE METRICS': ['cer.accuracy', 'ser.accuracy'],
         '3. MUSICAL STRUCTURE METRICS': ['chord_metrics.', 'element_metrics.rest.', 'element_metrics.tuplet.'],
         '4. SCORE STRUCTURE METRICS': ['element_metrics.clef.', 'element_metrics.keysig.', 'element_metrics.timesig.',
@@ -342,7 +814,7 @@ def calculate_average_metrics(true_dir: str, predicted_dir: str,
     for category_name, prefixes in categories.items():
         print(f"\n{category_name}:")
         found_any = False
-        for key, value in sorted(average_metrics.items()):
+        for key, value in sorted(result['average_metrics'].items()):
             for prefix in prefixes:
                 if key.startswith(prefix):
                     display_key = format_metric_name(key)
@@ -352,22 +824,6 @@ def calculate_average_metrics(true_dir: str, predicted_dir: str,
         if not found_any:
             print("  (no data)")
 
-    if output_file:
-        output_path = Path(output_file)
-        output_path.mkdir(parents=True, exist_ok=True)
-        print("\n" + "="*80)
-        print("SAVING CSV REPORTS")
-        print("="*80)
-        save_metrics_to_csv(average_metrics, output_path)
-        if detailed_errors:
-            print("\n" + "="*80)
-            print("SAVING DETAILED REPORTS")
-            print("="*80)
-            save_detailed_reports(all_metrics, file_pairs, output_path)
-    print("\n" + "="*80 + "\n")
-
-    return result
-
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -380,6 +836,13 @@ if __name__ == "__main__":
     
     parser.add_argument('--ted-approximate', action='store_true',
                        help='Use approximate algorithm for large trees')
+    parser.add_argument('--ted-engine', choices=list(TED_ENGINES), default='apted',
+                       help='Exact Tree Edit Distance implementation: apted (default) or numpy '
+                            '(vectorized Zhang-Shasha, much faster on large trees)')
+    parser.add_argument('--ted-decomposed', action='store_true',
+                       help='Also compute exact TED per aligned measure and report the sum next to the global TED')
+    parser.add_argument('--ted-jobs', type=int, default=1,
+                       help='Number of worker processes for per-measure TED (default: 1)')
     parser.add_argument('--no-chord-alignment', action='store_true',
                        help='Disable chord sequence alignment (use strict position matching)')
     parser.add_argument('-o', '--output', dest='output_file',
@@ -392,7 +855,40 @@ if __name__ == "__main__":
                        default='all',
                        help='Metric group to calculate: all (default), tree, sequence, chord, '
                             'musical_structure, score_structure, performance_instructions, texts, other_elements')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of worker processes for file pairs (default: 1)')
+    parser.add_argument('--streaming-parser', action='store_true',
+                       help='Build score trees with the single-pass streaming parser')
+    parser.add_argument('--measure-band', type=int, default=None,
+                       help='Restrict measure alignment to a diagonal band of this width '
+                            '(widened automatically when needed)')
+    parser.add_argument('--tree-cache-dir', default=None,
+                       help='Directory for cached ground truth trees, keyed by file hash and parser version')
+    parser.add_argument('--ground-truth-bundle', default=None,
+                       help='Bundle of precomputed ground truth features built by precompute.py')
+    parser.add_argument('--time-budget', type=float, default=None,
+                       help='Seconds allowed per pair for exact TED and chord alignment together before falling back '
+                            'to approximate TED / banded alignment')
+    parser.add_argument('--memory-budget', type=int, default=None,
+                       help='Additional memory in MB allowed per pair for exact TED and for chord alignment')
+    parser.add_argument('--journal', default=None,
+                       help='Append the flattened metrics of every finished pair to this JSONL file')
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip pairs already recorded in --journal and include them in the averages')
+    parser.add_argument('--results-store', default=None,
+                       help='SQLite file with per-pair results; only pairs whose ground truth, prediction '
+                            'or metric settings changed are recomputed')
+    parser.add_argument('--profile-dir', default=None,
+                       help='Run every pair under cProfile and keep the profiles of the slowest pairs in this directory')
+    parser.add_argument('--profile-slowest', type=int, default=5,
+                       help='Number of slowest pairs whose profiles are kept with --profile-dir (default: 5)')
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='info',
+                       help='Verbosity of progress messages: quiet, error, warning, info (default), debug')
+    parser.add_argument('--progress-json', default=None,
+                       help='Append machine-readable progress events (JSON lines with pair, phase and '
+                            'elapsed seconds) to this file, or "-" for stdout')
     args = parser.parse_args()
+    configure_logging(args.log_level, args.progress_json)
     metric_groups = [args.metric] if args.metric != 'all' else ['all']
     try:
         result = calculate_average_metrics(
@@ -402,11 +898,27 @@ if __name__ == "__main__":
             chord_use_alignment=not args.no_chord_alignment,
             output_file=args.output_file,
             detailed_errors=args.detailed_errors,
-            metric_groups=metric_groups
+            metric_groups=metric_groups,
+            jobs=args.jobs,
+            streaming_parser=args.streaming_parser,
+            measure_band=args.measure_band,
+            ted_engine=args.ted_engine,
+            ted_decomposed=args.ted_decomposed,
+            ted_jobs=args.ted_jobs,
+            tree_cache_dir=args.tree_cache_dir,
+            ground_truth_bundle=args.ground_truth_bundle,
+            results_store=args.results_store,
+            journal=args.journal,
+            resume=args.resume,
+            time_budget=args.time_budget,
+            memory_budget_mb=args.memory_budget,
+            profile_dir=args.profile_dir,
+            profile_slowest=args.profile_slowest
         )
 
         if not result:
             sys.exit(1)
+        print_average_metrics(result)
 
     except KeyboardInterrupt:
         print("\n\nInterrupted by user")
@@ -1,11 +1,14 @@
 from core.score_tree import create_simplified_tree, Node
-from typing import List, Dict, Tuple
+from core.tree_cache import load_simplified_tree
+from typing import List, Dict, Tuple, Optional
 import argparse
+import os
 import time
 from metrics.tree_edit_distance import (
     tree_edit_distance,
-    convert_to_apted_node,
     count_nodes,
+    measure_decomposed_ted,
+    TED_ENGINES,
 )
 from metrics.sequence_metrics import (
     character_error_rate,
@@ -16,72 +19,189 @@ from metrics.output import print_metrics
 from metrics.chord_metrics import (
     calculate_chord_metrics,
     print_chord_metrics,
-    get_measure_alignment_from_chords
+    positional_measure_mapping,
+    MeasureAlignmentContext
 )
 from metrics.element_metrics import (
     calculate_element_metrics,
     print_element_metrics
 )
+from metrics.element_common import set_element_index
+from metrics.budget import BudgetExceeded, PairBudget
+from core.instrumentation import instrumented, timed
+from metrics.progress import LOG_LEVELS, configure_logging, get_logger, pair_context, phase, report_progress
 
+logger = get_logger('calculate_metrics')
+
+FALLBACK_MEASURE_BAND = 8
+
+def _chord_alignment_stage(context: MeasureAlignmentContext, use_alignment: bool,
+                           measure_band: Optional[int], with_chord_metrics: bool) -> Tuple[Optional[Dict], Dict, Dict]:
+    chord_metrics = None
+    if with_chord_metrics:
+        chord_metrics = calculate_chord_metrics(
+            context.gt_tree, context.pred_tree, use_alignment=use_alignment,
+            measure_band=measure_band, context=context
+        )
+    return chord_metrics, context.measure_mapping(measure_band), context.alignment_cache()
+
+def chord_alignment_with_budget(context: MeasureAlignmentContext, use_alignment: bool = True,
+                                measure_band: Optional[int] = None, with_chord_metrics: bool = True,
+                                budget: Optional[PairBudget] = None) -> Tuple[Optional[Dict], Dict, Optional[Dict]]:
+    if budget is None:
+        budget = PairBudget()
+    bands = [measure_band]
+    if measure_band is None or measure_band > FALLBACK_MEASURE_BAND:
+        bands.append(FALLBACK_MEASURE_BAND)
+    fallback = None
+    for band in bands:
+        try:
+            chord_metrics, measure_mapping, alignment_cache = budget.run(
+                _chord_alignment_stage, (context, use_alignment, band, with_chord_metrics)
+            )
+        except BudgetExceeded as e:
+            logger.warning(f"   Measure alignment (band {band}) stopped: {e}")
+            fallback = {'reason': str(e)}
+            continue
+        context.merge_alignment_cache(alignment_cache)
+        if fallback is not None:
+            fallback.update({'measure_band': band, 'use_alignment': use_alignment})
+        break
+    else:
+        logger.warning("   Falling back to position matching")
+        chord_metrics = None
+        if with_chord_metrics:
+            chord_metrics = calculate_chord_metrics(context.gt_tree, context.pred_tree,
+                                                    use_alignment=False, context=context)
+        measure_mapping = positional_measure_mapping(context.gt_tree, context.pred_tree)
+        fallback.update({'measure_band': None, 'use_alignment': False})
+    context.set_measure_mapping(measure_mapping, measure_band)
+    return chord_metrics, measure_mapping, fallback
+
+@instrumented
 def calculate_all_metrics(ground_truth_path, predicted_path,
                           ted_approximate=False, chord_use_alignment=True,
-                          metric_groups=None):
+                          metric_groups=None, streaming_parser=False,
+                          measure_band=None, ted_engine='apted',
+                          ted_decomposed=False, ted_jobs=1, tree_cache_dir=None,
+                          ground_truth_features=None, time_budget=None, memory_budget_mb=None):
     if metric_groups is None:
         metric_groups = ['all']
     if 'all' in metric_groups:
         metric_groups = ['tree', 'sequence', 'chord', 'musical_structure',
                         'score_structure', 'performance_instructions', 'texts', 'other_elements']
-    print(f"Loading ground truth from {ground_truth_path}...")
-    gt_tree = create_simplified_tree(ground_truth_path)
+    with phase('load_ground_truth'):
+        if ground_truth_features is not None:
+            logger.info(f"Loading ground truth for {ground_truth_path} from bundle...")
+            gt_tree = ground_truth_features.tree
+            set_element_index(gt_tree, ground_truth_features.elements)
+        else:
+            logger.info(f"Loading ground truth from {ground_truth_path}...")
+            gt_tree = load_simplified_tree(ground_truth_path, cache_dir=tree_cache_dir, streaming=streaming_parser)
 
-    print(f"Loading prediction from {predicted_path}...")
-    pred_tree = create_simplified_tree(predicted_path)
+    with phase('load_prediction'):
+        logger.info(f"Loading prediction from {predicted_path}...")
+        pred_tree = create_simplified_tree(predicted_path, streaming=streaming_parser)
 
-    gt_size = count_nodes(convert_to_apted_node(gt_tree))
-    pred_size = count_nodes(convert_to_apted_node(pred_tree))
-    print(f"Tree sizes: GT={gt_size}, Pred={pred_size}")
+    with phase('count_nodes'):
+        if ground_truth_features is not None:
+            gt_size = ground_truth_features.node_count
+        else:
+            gt_size = count_nodes(gt_tree)
+        pred_size = count_nodes(pred_tree)
+    logger.info(f"Tree sizes: GT={gt_size}, Pred={pred_size}")
 
     if gt_size > 500 or pred_size > 500:
-        if not ted_approximate:
-            print("  Large trees detected. Consider using --ted-approximate")
+        if not ted_approximate and ted_engine == 'apted':
+            logger.info("  Large trees detected. Consider using --ted-engine numpy or --ted-approximate")
 
-    print("Computing metrics...")
+    logger.info("Computing metrics...")
 
     results = {}
     measure_mapping = None
+    budget = PairBudget(time_budget, memory_budget_mb)
+    alignment_context = MeasureAlignmentContext(
+        gt_tree, pred_tree,
+        gt_chords=ground_truth_features.chords if ground_truth_features is not None else None,
+        gt_measures=ground_truth_features.measures if ground_truth_features is not None else None
+    )
     if 'tree' in metric_groups:
-        print("1. Tree Edit Distance...")
+        logger.info("1. Tree Edit Distance...")
         ted_start = time.time()
-        ted, ted_error, ted_accuracy = tree_edit_distance(
-            gt_tree, pred_tree,
-            approximate=ted_approximate
-        )
+        ted_fallback = None
+        try:
+            ted_arguments = (gt_tree, pred_tree, ted_approximate, ted_engine)
+            if ted_approximate:
+                ted, ted_error, ted_accuracy = tree_edit_distance(*ted_arguments)
+            else:
+                ted, ted_error, ted_accuracy = budget.run(tree_edit_distance, ted_arguments)
+        except BudgetExceeded as e:
+            logger.warning(f"   Exact TED stopped: {e}; falling back to approximate TED")
+            ted_fallback = str(e)
+            ted, ted_error, ted_accuracy = tree_edit_distance(gt_tree, pred_tree, approximate=True)
         ted_elapsed = time.time() - ted_start
 
-        print(f"   TED computed in {ted_elapsed:.2f} seconds")
+        logger.info(f"   TED computed in {ted_elapsed:.2f} seconds")
+        report_progress('tree_edit_distance', ted_elapsed, fallback=ted_fallback is not None)
         results['tree_edit_distance'] = {
             'distance': ted,
             'normalized_error': ted_error,
             'accuracy': ted_accuracy,
             'computation_time': ted_elapsed
         }
+        if ted_fallback is not None:
+            results['tree_edit_distance']['approximate'] = True
+            results['tree_edit_distance']['fallback_reason'] = ted_fallback
 
     if 'sequence' in metric_groups:
-        print("2. Sequence metrics (CER, SER)...")
-        cer_result, ser_result = _calculate_sequence_metrics(gt_tree, pred_tree)
+        logger.info("2. Sequence metrics (CER, SER)...")
+        with phase('sequence'):
+            cer_result, ser_result = _calculate_sequence_metrics(
+                gt_tree, pred_tree,
+                gt_tokens=ground_truth_features.tokens if ground_truth_features is not None else None
+            )
         results['cer'] = cer_result
         results['ser'] = ser_result
 
     if 'chord' in metric_groups or 'musical_structure' in metric_groups:
-        print("3. Chord-level metrics...")
-        chord_metrics = calculate_chord_metrics(gt_tree, pred_tree, use_alignment=chord_use_alignment)
+        logger.info("3. Chord-level metrics...")
+        with phase('chord'):
+            chord_metrics, measure_mapping, alignment_fallback = chord_alignment_with_budget(
+                alignment_context, use_alignment=chord_use_alignment, measure_band=measure_band, budget=budget
+            )
+        if alignment_fallback is not None:
+            chord_metrics['alignment_fallback'] = alignment_fallback
         results['chord_metrics'] = chord_metrics
-        print("   Computing measure alignment from chords...")
-        measure_mapping = get_measure_alignment_from_chords(gt_tree, pred_tree)
+
+    def budgeted_measure_mapping() -> Dict:
+        logger.info("   Computing measure alignment from chords...")
+        with phase('measure_alignment'):
+            _, mapping, alignment_fallback = chord_alignment_with_budget(
+                alignment_context, measure_band=measure_band, with_chord_metrics=False, budget=budget
+            )
+        if alignment_fallback is not None:
+            results['measure_alignment_fallback'] = alignment_fallback
+        return mapping
+
+    if 'tree' in metric_groups and ted_decomposed:
+        if measure_mapping is None:
+            measure_mapping = budgeted_measure_mapping()
+        logger.info("   Measure-decomposed TED...")
+        decomposed_start = time.time()
+        decomposed = measure_decomposed_ted(
+            gt_tree, pred_tree,
+            measure_mapping=measure_mapping,
+            engine=ted_engine,
+            jobs=ted_jobs
+        )
+        decomposed['computation_time'] = time.time() - decomposed_start
+        logger.info(f"   Decomposed TED computed in {decomposed['computation_time']:.2f} seconds")
+        report_progress('tree_edit_distance_decomposed', decomposed['computation_time'])
+        results['tree_edit_distance_decomposed'] = decomposed
 
     if any(group in metric_groups for group in ['musical_structure', 'score_structure',
                                                  'performance_instructions', 'texts', 'other_elements']):
-        print("4. Other element metrics...")
+        logger.info("4. Other element metrics...")
         results['element_metrics'] = {}
         element_groups = {}
         if 'other_elements' in metric_groups or 'musical_structure' in metric_groups:
@@ -93,12 +213,16 @@ def calculate_all_metrics(ground_truth_path, predicted_path,
         if 'texts' in metric_groups:
             element_groups['Texts'] = ['Text', 'Lyrics']
         if measure_mapping is None:
-            print("   Computing measure alignment from chords...")
-            measure_mapping = get_measure_alignment_from_chords(gt_tree, pred_tree)
-        for group_name, element_types in element_groups.items():
-            for element_type in element_types:
-                element_metrics = calculate_element_metrics(gt_tree, pred_tree, element_type, measure_mapping=measure_mapping)
-                results['element_metrics'][element_type.lower()] = element_metrics
+            measure_mapping = budgeted_measure_mapping()
+        with phase('elements'):
+            for group_name, element_types in element_groups.items():
+                for element_type in element_types:
+                    with timed(f'element_matching.{element_type.lower()}'):
+                        element_metrics = calculate_element_metrics(
+                            gt_tree, pred_tree, element_type,
+                            measure_mapping=measure_mapping, context=alignment_context, measure_band=measure_band
+                        )
+                    results['element_metrics'][element_type.lower()] = element_metrics
 
     return results
 
@@ -114,6 +238,13 @@ if __name__ == "__main__":
     parser.add_argument('predicted', help='Path to predicted .mscz file')
     parser.add_argument('--ted-approximate', action='store_true',
                        help='Use approximate algorithm for large trees (much faster)')
+    parser.add_argument('--ted-engine', choices=list(TED_ENGINES), default='apted',
+                       help='Exact Tree Edit Distance implementation: apted (default) or numpy '
+                            '(vectorized Zhang-Shasha, much faster on large trees)')
+    parser.add_argument('--ted-decomposed', action='store_true',
+                       help='Also compute exact TED per aligned measure and report the sum next to the global TED')
+    parser.add_argument('--ted-jobs', type=int, default=1,
+                       help='Number of worker processes for per-measure TED (default: 1)')
     parser.add_argument('--detailed-errors', action='store_true',
                        help='Show detailed error analysis for note pitches')
     parser.add_argument('--no-chord-alignment', action='store_true',
@@ -124,13 +255,40 @@ if __name__ == "__main__":
                        default='all',
                        help='Metric group to calculate: all (default), tree, sequence, chord, '
                             'musical_structure, score_structure, performance_instructions, texts, other_elements')
+    parser.add_argument('--streaming-parser', action='store_true',
+                       help='Build score trees with the single-pass streaming parser')
+    parser.add_argument('--measure-band', type=int, default=None,
+                       help='Restrict measure alignment to a diagonal band of this width '
+                            '(widened automatically when needed)')
+    parser.add_argument('--tree-cache-dir', default=None,
+                       help='Directory for cached ground truth trees, keyed by file hash and parser version')
+    parser.add_argument('--time-budget', type=float, default=None,
+                       help='Seconds allowed per pair for exact TED and chord alignment together before falling back '
+                            'to approximate TED / banded alignment')
+    parser.add_argument('--memory-budget', type=int, default=None,
+                       help='Additional memory in MB allowed for exact TED and for chord alignment')
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='info',
+                       help='Verbosity of progress messages: quiet, error, warning, info (default), debug')
+    parser.add_argument('--progress-json', default=None,
+                       help='Append machine-readable progress events (JSON lines with pair, phase and '
+                            'elapsed seconds) to this file, or "-" for stdout')
     args = parser.parse_args()
+    configure_logging(args.log_level, args.progress_json)
     metric_groups = [args.metric] if args.metric != 'all' else ['all']
-    results = calculate_all_metrics(
-        args.ground_truth,
-        args.predicted,
-        ted_approximate=args.ted_approximate,
-        chord_use_alignment=not args.no_chord_alignment,
-        metric_groups=metric_groups
-    )
+    with pair_context(os.path.basename(args.predicted)):
+        results = calculate_all_metrics(
+            args.ground_truth,
+            args.predicted,
+            ted_approximate=args.ted_approximate,
+            chord_use_alignment=not args.no_chord_alignment,
+            metric_groups=metric_groups,
+            streaming_parser=args.streaming_parser,
+            measure_band=args.measure_band,
+            ted_engine=args.ted_engine,
+            ted_decomposed=args.ted_decomposed,
+            ted_jobs=args.ted_jobs,
+            tree_cache_dir=args.tree_cache_dir,
+            time_budget=args.time_budget,
+            memory_budget_mb=args.memory_budget
+        )
     print_metrics(results, show_detailed_errors=args.detailed_errors)
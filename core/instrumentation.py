@@ -0,0 +1,78 @@
+import contextvars
+import functools
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+class Instrumentation:
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] += seconds
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timings[name] += seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def merge(self, snapshot: Dict) -> None:
+        for name, seconds in snapshot.get('phases', {}).items():
+            self.phases[name] += seconds
+        for name, seconds in snapshot.get('timings', {}).items():
+            self.timings[name] += seconds
+        for name, amount in snapshot.get('counters', {}).items():
+            self.counters[name] += amount
+
+    def as_dict(self) -> Dict:
+        return {'phases': dict(self.phases), 'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+_active_instrumentation = contextvars.ContextVar('instrumentation', default=None)
+
+def active_instrumentation() -> Optional[Instrumentation]:
+    return _active_instrumentation.get()
+
+@contextmanager
+def instrumentation() -> Iterator[Instrumentation]:
+    recorder = Instrumentation()
+    token = _active_instrumentation.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _active_instrumentation.reset(token)
+
+def instrumented(func: Callable[..., Dict]) -> Callable[..., Dict]:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> Dict:
+        start = time.perf_counter()
+        with instrumentation() as recorder:
+            results = func(*args, **kwargs)
+        results['instrumentation'] = dict(recorder.as_dict(), elapsed=time.perf_counter() - start)
+        return results
+    return wrapper
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    recorder = _active_instrumentation.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_time(name, time.perf_counter() - start)
+
+def record_phase(name: str, seconds: float) -> None:
+    recorder = _active_instrumentation.get()
+    if recorder is not None:
+        recorder.add_phase(name, seconds)
+
+def count(name: str, amount: int = 1) -> None:
+    recorder = _active_instrumentation.get()
+    if recorder is not None:
+        recorder.count(name, amount)
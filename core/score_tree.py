@@ -1,10 +1,12 @@
 import zipfile
 import os
+import sys
 from lxml import etree
-import tempfile
-import shutil
 from typing import Optional, List
 from core.tempo_markings import contains_tempo_marking
+from core.instrumentation import active_instrumentation, count, timed
+
+PARSER_VERSION = 1
 
 ELEMENT_TO_INT_MAP = {
     'Score': 0,
@@ -33,14 +35,17 @@ ELEMENT_TO_INT_MAP = {
 }
 
 class Node:
+    __slots__ = ('label', 'int_label', 'id', 'children', 'value', '__weakref__')
+
     def __init__(self, label: str, id: Optional[int] = None, children: Optional[List['Node']] = None, value: Optional[str] = None) -> None:
-        self.label = label
-        if label not in ELEMENT_TO_INT_MAP:
+        int_label = ELEMENT_TO_INT_MAP.get(label)
+        if int_label is None:
             raise ValueError(f"Unknown label '{label}'. Valid labels are: {list(ELEMENT_TO_INT_MAP.keys())}")
-        self.int_label = ELEMENT_TO_INT_MAP[label]
+        self.label = label
+        self.int_label = int_label
         self.id = id
         self.children = children or []
-        self.value = value
+        self.value = sys.intern(value) if type(value) is str else value
 
     def add_child(self, node: 'Node') -> None:
         self.children.append(node)
@@ -65,41 +70,240 @@ class Node:
         return "\n".join(lines)
 
 
+def find_mscx_member(zip_file: zipfile.ZipFile) -> Optional[str]:
+    for member_name in zip_file.namelist():
+        if '/' not in member_name and member_name.endswith('.mscx'):
+            return member_name
+    return None
+
+def mscx_uncompressed_size(mscz_path: str) -> int:
+    with zipfile.ZipFile(mscz_path, 'r') as zip_file:
+        mscx_filename = find_mscx_member(zip_file)
+        return zip_file.getinfo(mscx_filename).file_size if mscx_filename is not None else 0
+
 def extract_xml_tree_from_mscz(mscz_path: str) -> etree._Element:
-    temp_directory = tempfile.mkdtemp()
+    if not os.path.exists(mscz_path):
+        raise FileNotFoundError(f"File not found: {mscz_path}")
     try:
-        if not os.path.exists(mscz_path):
-            raise FileNotFoundError(f"File not found: {mscz_path}")
-        try:
-            with zipfile.ZipFile(mscz_path, 'r') as zip_file:
-                zip_file.extractall(temp_directory)
-        except zipfile.BadZipFile:
-            raise ValueError(f"Invalid zip file: {mscz_path}")
-        extracted_files = os.listdir(temp_directory)
-        mscx_filename = None
-        for file in extracted_files:
-            if file.endswith('.mscx'):
-                mscx_filename = file
-                break
-
-        if mscx_filename is None:
-            raise ValueError(f".mscx file not found in archive {mscz_path}")
-
-        mscx_file_path = os.path.join(temp_directory, mscx_filename)
-        try:
-            xml_tree = etree.parse(mscx_file_path)
-        except etree.XMLSyntaxError as e:
-            raise ValueError(f"Invalid XML in file {mscx_file_path}: {e}")
-        root = xml_tree.getroot()
-        return root
-    finally:
-        try:
-            shutil.rmtree(temp_directory)
-        except OSError:
-            pass
-
-def create_simplified_tree(mscz_path: str) -> Node:
-    xml_root = extract_xml_tree_from_mscz(mscz_path)
+        with zipfile.ZipFile(mscz_path, 'r') as zip_file:
+            mscx_filename = find_mscx_member(zip_file)
+            if mscx_filename is None:
+                raise ValueError(f".mscx file not found in archive {mscz_path}")
+            with zip_file.open(mscx_filename) as mscx_file:
+                try:
+                    xml_tree = etree.parse(mscx_file)
+                except etree.XMLSyntaxError as e:
+                    raise ValueError(f"Invalid XML in file {mscz_path}:{mscx_filename}: {e}")
+    except zipfile.BadZipFile:
+        raise ValueError(f"Invalid zip file: {mscz_path}")
+    root = xml_tree.getroot()
+    return root
+
+def _count_tree_nodes(root: Node) -> int:
+    total = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        total += 1
+        stack.extend(node.children)
+    return total
+
+def create_simplified_tree(mscz_path: str, streaming: bool = False) -> Node:
+    if streaming:
+        with timed('build_tree'):
+            root_node = create_simplified_tree_streaming(mscz_path)
+    else:
+        with timed('parse_xml'):
+            xml_root = extract_xml_tree_from_mscz(mscz_path)
+        with timed('build_tree'):
+            root_node = _build_simplified_tree(xml_root)
+    if active_instrumentation() is not None:
+        count('nodes_built', _count_tree_nodes(root_node))
+    return root_node
+
+TEXT_TAGS = ('Text', 'StaffText', 'SystemText')
+
+def _is_visible(element: etree._Element) -> bool:
+    return element.find('visible') is None
+
+def _text_node(text_element: etree._Element) -> Optional[Node]:
+    if not _is_visible(text_element):
+        return None
+    text_node = text_element.find("text")
+    if text_node is None:
+        return None
+    text_content = "".join(text_node.itertext()).strip()
+    if not text_content:
+        return None
+    is_tempo, tempo_marking = contains_tempo_marking(text_content)
+    return Node("Tempo" if is_tempo else "Text", value=text_content)
+
+def _part_node(part: etree._Element, part_id: int, instrument_id: int) -> Node:
+    part_node = Node("Part", id=part_id)
+    track_name_element = part.find("trackName")
+    instrument_name = track_name_element.text if track_name_element is not None else None
+    part_node.add_child(Node("Instrument", id=instrument_id, value=instrument_name))
+    return part_node
+
+def _default_clef(staff: etree._Element) -> str:
+    clef_element = staff.find("defaultClef")
+    return clef_element.text if clef_element is not None else 'G'
+
+class _StaffTreeBuilder:
+    def __init__(self, staff_node: Node, default_clef: str) -> None:
+        self.staff_node = staff_node
+        self.current_clef = default_clef
+        self.measure_counter = 0
+        self.chord_counter = 0
+        self.rest_counter = 0
+
+    def finish(self) -> None:
+        if self.measure_counter == 0:
+            self.staff_node.add_child(Node("Clef", value=self.current_clef))
+
+    def add_measure(self, measure: etree._Element) -> None:
+        staff_node = self.staff_node
+        if self.measure_counter == 0:
+            first_clef = measure.find("voice/Clef")
+            if first_clef is not None:
+                concert_clef_element = first_clef.find('concertClefType')
+                if concert_clef_element is not None and concert_clef_element.text is not None:
+                    self.current_clef = concert_clef_element.text
+            staff_node.add_child(Node("Clef", value=self.current_clef))
+
+        measure_node = Node("Measure", id=self.measure_counter)
+        self.measure_counter += 1
+        staff_node.add_child(measure_node)
+
+        for key_sig in measure.iterfind('voice/KeySig'):
+            if _is_visible(key_sig):
+                accidental_element = key_sig.find('accidental')
+                concert_key_element = key_sig.find('concertKey')
+                key_value = None
+                if accidental_element is not None:
+                    key_value = accidental_element.text
+                elif concert_key_element is not None:
+                    key_value = concert_key_element.text
+                if key_value is not None:
+                    measure_node.add_child(Node("KeySig", value=key_value))
+
+        for time_sig in measure.iterfind('voice/TimeSig'):
+            if _is_visible(time_sig):
+                numerator_element = time_sig.find('sigN')
+                denominator_element = time_sig.find('sigD')
+                if numerator_element is not None and denominator_element is not None:
+                    numerator = numerator_element.text
+                    denominator = denominator_element.text
+                    if numerator is not None and denominator is not None:
+                        measure_node.add_child(Node("TimeSig", value=f"{numerator}/{denominator}"))
+
+        for dynamic in measure.iterfind('voice/Dynamic'):
+            if _is_visible(dynamic):
+                subtype_element = dynamic.find('subtype')
+                if subtype_element is not None and subtype_element.text is not None:
+                    measure_node.add_child(Node("Dynamic", value=subtype_element.text))
+
+        for tempo in measure.iterfind('voice/Tempo'):
+            if _is_visible(tempo):
+                text_element = tempo.find('text')
+                if text_element is not None:
+                    tempo_text = "".join(text_element.itertext()).strip()
+                    staff_node.add_child(Node("Tempo", value=tempo_text))
+
+        for measure_clef in measure.iterfind('voice/Clef'):
+            if _is_visible(measure_clef):
+                concert_clef_element = measure_clef.find('concertClefType')
+                if concert_clef_element is not None and concert_clef_element.text is not None:
+                    clef_value = concert_clef_element.text
+                    if clef_value != self.current_clef:
+                        measure_node.add_child(Node("Clef", value=clef_value))
+                        self.current_clef = clef_value
+
+        for voice in measure.iterfind('voice'):
+            for element in voice:
+                tag = element.tag
+                if tag == "Chord":
+                    if _is_visible(element):
+                        measure_node.add_child(self.build_chord(element))
+                elif tag == "Rest":
+                    if _is_visible(element):
+                        rest_node = Node("Rest", id=self.rest_counter)
+                        measure_node.add_child(rest_node)
+                        duration_element = element.find('durationType')
+                        if duration_element is not None and duration_element.text is not None:
+                            rest_node.add_child(Node("Duration", value=duration_element.text))
+                        self.rest_counter += 1
+                elif tag == 'Spanner':
+                    if _is_visible(element):
+                        spanner_type = element.get('type')
+                        if spanner_type is not None:
+                            measure_node.add_child(Node("Spanner", value=spanner_type))
+                elif tag == 'Fermata':
+                    if _is_visible(element):
+                        subtype_element = element.find('subtype')
+                        if subtype_element is not None and subtype_element.text is not None:
+                            measure_node.add_child(Node("Fermata", value=subtype_element.text))
+                elif tag == 'HairPin':
+                    if _is_visible(element):
+                        measure_node.add_child(Node("Spanner", value='HairPin'))
+                elif tag == 'Tuplet':
+                    if _is_visible(element):
+                        normal_notes_element = element.find('normalNotes')
+                        actual_notes_element = element.find('actualNotes')
+                        base_notes_element = element.find('baseNote')
+                        if (normal_notes_element is not None and normal_notes_element.text is not None and
+                            actual_notes_element is not None and actual_notes_element.text is not None and
+                            base_notes_element is not None and base_notes_element.text is not None):
+                            tuplet_value = f"{normal_notes_element.text}/{actual_notes_element.text}/{base_notes_element.text}"
+                            measure_node.add_child(Node("Tuplet", value=tuplet_value))
+
+    def build_chord(self, element: etree._Element) -> Node:
+        chord_node = Node("Chord", id=self.chord_counter)
+        self.chord_counter += 1
+        duration_element = element.find('durationType')
+        if duration_element is not None and duration_element.text is not None:
+            chord_node.add_child(Node("Duration", value=duration_element.text))
+        if element.find('dots') is not None:
+            chord_node.add_child(Node("Dot"))
+        for spanner in element.iterfind('Spanner'):
+            if _is_visible(spanner):
+                spanner_type = spanner.get('type')
+                if spanner_type is not None:
+                    chord_node.add_child(Node("Spanner", value=spanner_type))
+        for articulation_tag in ('Articulation', 'Ornament'):
+            for articulation in element.iterfind(articulation_tag):
+                if _is_visible(articulation):
+                    subtype_element = articulation.find('subtype')
+                    if subtype_element is not None and subtype_element.text is not None:
+                        chord_node.add_child(Node("Articulation", value=subtype_element.text))
+        for lyric in element.iterfind('Lyrics'):
+            if _is_visible(lyric):
+                text_element = lyric.find('text')
+                if text_element is not None and text_element.text is not None:
+                    chord_node.add_child(Node("Lyrics", value=text_element.text))
+        for arpeggio in element.iterfind('Arpeggio'):
+            if _is_visible(arpeggio):
+                subtype_element = arpeggio.find('subtype')
+                if subtype_element is not None and subtype_element.text is not None:
+                    chord_node.add_child(Node("Arpeggio", value=subtype_element.text))
+        for note in element.iterfind('Note'):
+            pitch_element = note.find('pitch')
+            if pitch_element is not None and pitch_element.text is not None:
+                note_node = Node("Note", value=pitch_element.text)
+                chord_node.add_child(note_node)
+                accidental_element = note.find('Accidental')
+                if accidental_element is not None and _is_visible(accidental_element):
+                    subtype_element = accidental_element.find('subtype')
+                    if subtype_element is not None and subtype_element.text is not None:
+                        note_node.add_child(Node("Accidental", value=subtype_element.text))
+                for note_spanner in note.iterfind('Spanner'):
+                    if _is_visible(note_spanner):
+                        spanner_type = note_spanner.get('type')
+                        if spanner_type is not None:
+                            note_node.add_child(Node("Spanner", value=spanner_type))
+        return chord_node
+
+def _build_simplified_tree(xml_root: etree._Element) -> Node:
     parts = xml_root.findall("./Score/Part")
     staffs = xml_root.findall("./Score/Staff")
     root_node = Node("Score", id=0)
@@ -107,24 +311,15 @@ def create_simplified_tree(mscz_path: str) -> Node:
     part_counter = 0
     staff_counter = 0
     instrument_counter = 0
-    default_clef_type = 'G'
 
     for part in parts:
-        part_node = Node("Part", id=part_counter)
+        part_node = _part_node(part, part_counter, instrument_counter)
         root_node.add_child(part_node)
         part_counter += 1
-        part_staffs = part.findall("./Staff")
-
-        track_name_elements = part.xpath("./trackName")
-        if len(track_name_elements) == 0:
-            instrument_name = None
-        else:
-            instrument_name = track_name_elements[0].text
-        part_node.add_child(Node("Instrument", id=instrument_counter, value=instrument_name))
         instrument_counter += 1
 
-        for staff in part_staffs:
-            if len(staff.xpath('isStaffVisible')) != 0:
+        for staff in part.findall("./Staff"):
+            if staff.find('isStaffVisible') is not None:
                 staff_counter += 1
                 continue
             staff_node = Node("Staff", id=staff_counter)
@@ -134,215 +329,107 @@ def create_simplified_tree(mscz_path: str) -> Node:
                 continue
 
             if staff_counter == 0:
-                for text_element in (xml_root.findall(".//Text") + xml_root.findall(".//StaffText") + xml_root.findall(".//SystemText")):
-                    if len(text_element.xpath('visible')) == 0:
-                        style_element = text_element.find("style")
-                        text_node = text_element.find("text")
+                for tag in TEXT_TAGS:
+                    for text_element in xml_root.iterfind(f".//{tag}"):
+                        text_node = _text_node(text_element)
                         if text_node is not None:
-                            text_content = "".join(text_node.itertext()).strip()
-                            if text_content:
-                                is_tempo, tempo_marking = contains_tempo_marking(text_content)
-                                if is_tempo:
-                                    staff_node.add_child(Node("Tempo", value=text_content))
-                                else:
-                                    staff_node.add_child(Node("Text", value=text_content))
-
-            measures = staffs[staff_counter].xpath("Measure")
+                            staff_node.add_child(text_node)
+
+            staff_builder = _StaffTreeBuilder(staff_node, _default_clef(staff))
+            for measure in staffs[staff_counter].iterfind("Measure"):
+                staff_builder.add_measure(measure)
+            staff_builder.finish()
             staff_counter += 1
-            measure_counter = 0
-            chord_counter = 0
-            rest_counter = 0
-
-            clef_elements = staff.xpath("./defaultClef")
-            if len(clef_elements) > 0:
-                current_clef = clef_elements[0].text
-            else:
-                current_clef = default_clef_type
-
-            if len(measures) > 0:
-                first_measure_clefs = measures[0].xpath("./voice/Clef")
-                if len(first_measure_clefs) > 0:
-                    concert_clef_element = first_measure_clefs[0].find('concertClefType')
-                    if concert_clef_element is not None and concert_clef_element.text is not None:
-                        first_clef = concert_clef_element.text
-                        if current_clef != first_clef:
-                            current_clef = first_clef
-            staff_node.add_child(Node("Clef", value=current_clef))
-
-            for measure in measures:
-                measure_node = Node("Measure", id=measure_counter)
-                measure_counter += 1
-                staff_node.add_child(measure_node)
-
-                key_signatures = measure.xpath('voice/KeySig')
-                if len(key_signatures) > 0:
-                    for key_sig in key_signatures:
-                        if len(key_sig.xpath('visible')) == 0:
-                            accidental_elements = key_sig.xpath('accidental')
-                            concert_key_elements = key_sig.xpath('concertKey')
-                            key_value = None
-                            if len(accidental_elements) > 0:
-                                key_value = accidental_elements[0].text
-                            elif len(concert_key_elements) > 0:
-                                key_value = concert_key_elements[0].text
-                            if key_value is not None:
-                                key_node = Node("KeySig", value=key_value)
-                                measure_node.add_child(key_node)
-
-                time_signatures = measure.xpath('voice/TimeSig')
-                if len(time_signatures) > 0:
-                    for time_sig in time_signatures:
-                        if len(time_sig.xpath('visible')) == 0:
-                            numerator_element = time_sig.find('sigN')
-                            denominator_element = time_sig.find('sigD')
-                            if numerator_element is not None and denominator_element is not None:
-                                numerator = numerator_element.text
-                                denominator = denominator_element.text
-                                if numerator is not None and denominator is not None:
-                                    time_node = Node("TimeSig", value=f"{numerator}/{denominator}")
-                                    measure_node.add_child(time_node)
-
-                dynamics = measure.xpath('voice/Dynamic')
-                if len(dynamics) > 0:
-                    for dynamic in dynamics:
-                        if len(dynamic.xpath('visible')) == 0:
-                            subtype_element = dynamic.find('subtype')
-                            if subtype_element is not None and subtype_element.text is not None:
-                                dynamic_value = subtype_element.text
-                                dynamic_node = Node("Dynamic", value=dynamic_value)
-                                measure_node.add_child(dynamic_node)
-
-                tempo_elements = measure.xpath('voice/Tempo')
-                if len(tempo_elements) > 0:
-                    for tempo in tempo_elements:
-                        if len(tempo.xpath('visible')) == 0:
-                            text_element = tempo.find('text')
-                            if text_element is not None:
-                                tempo_text = "".join(text_element.itertext()).strip()
-                                tempo_node = Node("Tempo", value=tempo_text)
-                                staff_node.add_child(tempo_node)
-
-                measure_clefs = measure.xpath("./voice/Clef")
-                if len(measure_clefs) > 0:
-                    for measure_clef in measure_clefs:
-                        if len(measure_clef.xpath('visible')) == 0:
-                            concert_clef_element = measure_clef.find('concertClefType')
-                            if concert_clef_element is not None and concert_clef_element.text is not None:
-                                clef_value = concert_clef_element.text
-                                if clef_value != current_clef:
-                                    clef_node = Node("Clef", value=clef_value)
-                                    measure_node.add_child(clef_node)
-                                    current_clef = clef_value
-
-                voices = measure.xpath("./voice")
-                for voice in voices:
-                    for element in voice:
-                        if element.tag == "Chord" and len(element.xpath('visible')) == 0:
-                            chord_node = Node("Chord", id=chord_counter)
-                            measure_node.add_child(chord_node)
-                            duration_element = element.find('durationType')
-                            if duration_element is not None and duration_element.text is not None:
-                                duration_value = duration_element.text
-                                chord_node.add_child(Node("Duration", value=duration_value))
-                            if len(element.xpath('dots')) > 0:
-                                chord_node.add_child(Node("Dot"))
-                            spanner_elements = element.xpath('Spanner')
-                            if len(spanner_elements) > 0:
-                                for spanner in spanner_elements:
-                                    if len(spanner.xpath('visible')) == 0:
-                                        spanner_type = spanner.attrib.get('type')
-                                        if spanner_type is not None:
-                                            spanner_node = Node("Spanner", value=spanner_type)
-                                            chord_node.add_child(spanner_node)
-                            articulation_elements = element.xpath('Articulation')
-                            if len(articulation_elements) > 0:
-                                for articulation in articulation_elements:
-                                    if len(articulation.xpath('visible')) == 0:
-                                        subtype_element = articulation.find('subtype')
-                                        if subtype_element is not None and subtype_element.text is not None:
-                                            articulation_type = subtype_element.text
-                                            articulation_node = Node("Articulation", value=articulation_type)
-                                            chord_node.add_child(articulation_node)
-                            ornament_elements = element.xpath('Ornament')
-                            if len(ornament_elements) > 0:
-                                for ornament in ornament_elements:
-                                    if len(ornament.xpath('visible')) == 0:
-                                        subtype_element = ornament.find('subtype')
-                                        if subtype_element is not None and subtype_element.text is not None:
-                                            ornament_type = subtype_element.text
-                                            ornament_node = Node("Articulation", value=ornament_type)
-                                            chord_node.add_child(ornament_node)
-                            lyric_elements = element.xpath('Lyrics')
-                            if len(lyric_elements) > 0:
-                                for lyric in lyric_elements:
-                                    if len(lyric.xpath('visible')) == 0:
-                                        text_element = lyric.find('text')
-                                        if text_element is not None and text_element.text is not None:
-                                            lyric_text = text_element.text
-                                            lyric_node = Node("Lyrics", value=lyric_text)
-                                            chord_node.add_child(lyric_node)
-                            arpeggio_elements = element.xpath('Arpeggio')
-                            if len(arpeggio_elements) > 0:
-                                for arpeggio in arpeggio_elements:
-                                    if len(arpeggio.xpath('visible')) == 0:
-                                        subtype_element = arpeggio.find('subtype')
-                                        if subtype_element is not None and subtype_element.text is not None:
-                                            arpeggio_type = subtype_element.text
-                                            arpeggio_node = Node("Arpeggio", value=arpeggio_type)
-                                            chord_node.add_child(arpeggio_node)
-                            chord_counter += 1
-                            note_elements = element.xpath('Note')
-                            for note in note_elements:
-                                pitch_element = note.find('pitch')
-                                if pitch_element is not None and pitch_element.text is not None:
-                                    note_node = Node("Note", value=pitch_element.text)
-                                    chord_node.add_child(note_node)
-                                    accidental_elements = note.xpath('Accidental')
-                                    if len(accidental_elements) > 0:
-                                        if len(accidental_elements[0].xpath('visible')) == 0:
-                                            subtype_element = accidental_elements[0].find('subtype')
-                                            if subtype_element is not None and subtype_element.text is not None:
-                                                note_node.add_child(Node("Accidental", value=subtype_element.text))
-                                    note_spanner_elements = note.xpath('Spanner')
-                                    if len(note_spanner_elements) > 0:
-                                        for note_spanner in note_spanner_elements:
-                                            if len(note_spanner.xpath('visible')) == 0:
-                                                spanner_type = note_spanner.attrib.get('type')
-                                                if spanner_type is not None:
-                                                    spanner_node = Node("Spanner", value=spanner_type)
-                                                    note_node.add_child(spanner_node)
-                        if element.tag == "Rest" and len(element.xpath('visible')) == 0:
-                            rest_node = Node("Rest", id=rest_counter)
-                            measure_node.add_child(rest_node)
-                            duration_element = element.find('durationType')
-                            if duration_element is not None and duration_element.text is not None:
-                                duration_value = duration_element.text
-                                rest_node.add_child(Node("Duration", value=duration_value))
-                            rest_counter += 1
-                        if element.tag == 'Spanner' and len(element.xpath('visible')) == 0:
-                            spanner_type = element.attrib.get('type')
-                            if spanner_type is not None:
-                                spanner_node = Node("Spanner", value=spanner_type)
-                                measure_node.add_child(spanner_node)
-                        if element.tag == 'Fermata' and len(element.xpath('visible')) == 0:
-                            subtype_element = element.find('subtype')
-                            if subtype_element is not None and subtype_element.text is not None:
-                                fermata_type = subtype_element.text
-                                fermata_node = Node("Fermata", value=fermata_type)
-                                measure_node.add_child(fermata_node)
-                        if element.tag == 'HairPin' and len(element.xpath('visible')) == 0:
-                            spanner_node = Node("Spanner", value='HairPin')
-                            measure_node.add_child(spanner_node)
-                        if element.tag == 'Tuplet' and len(element.xpath('visible')) == 0:
-                            normal_notes_element = element.find('normalNotes')
-                            actual_notes_element = element.find('actualNotes')
-                            base_notes_element = element.find('baseNote')
-                            if (normal_notes_element is not None and normal_notes_element.text is not None and
-                                actual_notes_element is not None and actual_notes_element.text is not None and
-                                base_notes_element is not None and base_notes_element.text is not None):
-                                normal_notes = normal_notes_element.text
-                                actual_notes = actual_notes_element.text
-                                base_notes = base_notes_element.text
-                                tuplet_node = Node("Tuplet", value=f"{normal_notes}/{actual_notes}/{base_notes}")
-                                measure_node.add_child(tuplet_node)
     return root_node
+
+def _release_element(element: etree._Element) -> None:
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+class _StreamingTreeBuilder:
+    def __init__(self) -> None:
+        self.root_node = Node("Score", id=0)
+        self.part_counter = 0
+        self.instrument_counter = 0
+        self.part_staffs = []
+        self.text_nodes = {tag: [] for tag in TEXT_TAGS}
+        self.score_staff_count = 0
+        self.staff_builder = None
+
+    def build(self, events) -> Node:
+        stack = []
+        for event, element in events:
+            if event == 'start':
+                stack.append(element.tag)
+                if len(stack) == 3 and stack[1] == 'Score' and element.tag == 'Staff':
+                    self.start_staff()
+                continue
+            depth = len(stack)
+            tag = stack.pop()
+            if tag in TEXT_TAGS:
+                text_node = _text_node(element)
+                if text_node is not None:
+                    self.text_nodes[tag].append(text_node)
+            if depth == 3 and stack[1] == 'Score':
+                if tag == 'Part':
+                    self.add_part(element)
+                elif tag == 'Staff':
+                    self.end_staff()
+                _release_element(element)
+            elif depth == 4 and tag == 'Measure' and stack[1] == 'Score' and stack[2] == 'Staff':
+                if self.staff_builder is not None:
+                    self.staff_builder.add_measure(element)
+                _release_element(element)
+        if self.score_staff_count > 0 and self.part_staffs and self.part_staffs[0][0] is not None:
+            first_staff_node = self.part_staffs[0][0]
+            texts = [node for tag in TEXT_TAGS for node in self.text_nodes[tag]]
+            first_staff_node.children[0:0] = texts
+        return self.root_node
+
+    def add_part(self, part: etree._Element) -> None:
+        if self.score_staff_count > 0:
+            raise ValueError("Streaming parser requires Part definitions to precede staff data")
+        part_node = _part_node(part, self.part_counter, self.instrument_counter)
+        self.root_node.add_child(part_node)
+        self.part_counter += 1
+        self.instrument_counter += 1
+        for staff in part.findall("Staff"):
+            staff_counter = len(self.part_staffs)
+            if staff.find('isStaffVisible') is not None:
+                self.part_staffs.append((None, None))
+                continue
+            staff_node = Node("Staff", id=staff_counter)
+            part_node.add_child(staff_node)
+            self.part_staffs.append((staff_node, _default_clef(staff)))
+
+    def start_staff(self) -> None:
+        staff_index = self.score_staff_count
+        self.score_staff_count += 1
+        if staff_index < len(self.part_staffs) and self.part_staffs[staff_index][0] is not None:
+            self.staff_builder = _StaffTreeBuilder(*self.part_staffs[staff_index])
+        else:
+            self.staff_builder = None
+
+    def end_staff(self) -> None:
+        if self.staff_builder is not None:
+            self.staff_builder.finish()
+        self.staff_builder = None
+
+def create_simplified_tree_streaming(mscz_path: str) -> Node:
+    if not os.path.exists(mscz_path):
+        raise FileNotFoundError(f"File not found: {mscz_path}")
+    try:
+        with zipfile.ZipFile(mscz_path, 'r') as zip_file:
+            mscx_filename = find_mscx_member(zip_file)
+            if mscx_filename is None:
+                raise ValueError(f".mscx file not found in archive {mscz_path}")
+            with zip_file.open(mscx_filename) as mscx_file:
+                try:
+                    return _StreamingTreeBuilder().build(etree.iterparse(mscx_file, events=('start', 'end')))
+                except etree.XMLSyntaxError as e:
+                    raise ValueError(f"Invalid XML in file {mscz_path}:{mscx_filename}: {e}")
+    except zipfile.BadZipFile:
+        raise ValueError(f"Invalid zip file: {mscz_path}")
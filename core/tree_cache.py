@@ -0,0 +1,153 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import List, Optional
+from core.score_tree import ELEMENT_TO_INT_MAP, PARSER_VERSION, Node, create_simplified_tree
+from metrics.progress import get_logger
+
+TREE_CACHE_MAGIC = b'OMRT'
+TREE_CACHE_FORMAT_VERSION = 1
+TREE_CACHE_SUFFIX = '.tree'
+
+_HEADER = struct.Struct('<4sHHIII')
+INT_TO_ELEMENT = {value: label for label, value in ELEMENT_TO_INT_MAP.items()}
+
+logger = get_logger('tree_cache')
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def tree_cache_path(cache_dir: str, digest: str) -> str:
+    return os.path.join(cache_dir, f"{digest}.p{PARSER_VERSION}{TREE_CACHE_SUFFIX}")
+
+def _to_little_endian(arrays: List[array]) -> None:
+    if sys.byteorder == 'big':
+        for values in arrays:
+            values.byteswap()
+
+def encode_tree(root: Node) -> bytes:
+    labels = array('B')
+    child_counts = array('I')
+    ids = array('i')
+    values = array('i')
+    string_ids = {}
+    string_offsets = array('I', [0])
+    string_data = bytearray()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        labels.append(node.int_label)
+        child_counts.append(len(node.children))
+        ids.append(-1 if node.id is None else node.id)
+        if node.value is None:
+            values.append(-1)
+        else:
+            value = str(node.value)
+            value_id = string_ids.get(value)
+            if value_id is None:
+                value_id = len(string_ids)
+                string_ids[value] = value_id
+                string_data += value.encode('utf-8')
+                string_offsets.append(len(string_data))
+            values.append(value_id)
+        stack.extend(reversed(node.children))
+    _to_little_endian([child_counts, ids, values, string_offsets])
+    header = _HEADER.pack(TREE_CACHE_MAGIC, TREE_CACHE_FORMAT_VERSION, PARSER_VERSION,
+                          len(labels), len(string_ids), len(string_data))
+    return b''.join([header, child_counts.tobytes(), ids.tobytes(), values.tobytes(),
+                     string_offsets.tobytes(), labels.tobytes(), bytes(string_data)])
+
+def decode_tree(buffer) -> Node:
+    magic, format_version, parser_version, node_count, string_count, string_size = _HEADER.unpack_from(buffer, 0)
+    if magic != TREE_CACHE_MAGIC:
+        raise ValueError("Not a tree cache entry")
+    if format_version != TREE_CACHE_FORMAT_VERSION or parser_version != PARSER_VERSION:
+        raise ValueError(f"Unsupported tree cache entry: format {format_version}, parser {parser_version}")
+    if len(buffer) != (_HEADER.size + 13 * node_count + 4 * (string_count + 1) + string_size):
+        raise ValueError("Truncated tree cache entry")
+
+    position = _HEADER.size
+    with memoryview(buffer) as view:
+        sections = []
+        for typecode, count in (('I', node_count), ('i', node_count), ('i', node_count),
+                                ('I', string_count + 1), ('B', node_count)):
+            section = array(typecode)
+            end = position + count * section.itemsize
+            with view[position:end] as chunk:
+                section.frombytes(chunk)
+            sections.append(section)
+            position = end
+        string_data = bytes(view[position:position + string_size])
+    _to_little_endian(sections[:4])
+    child_counts, ids, values, string_offsets, labels = (section.tolist() for section in sections)
+    strings = [string_data[string_offsets[index]:string_offsets[index + 1]].decode('utf-8')
+               for index in range(string_count)]
+    if any(label not in INT_TO_ELEMENT for label in set(labels)):
+        raise ValueError("Unknown element label in tree cache entry")
+    if node_count and not -1 <= min(values) <= max(values) < string_count:
+        raise ValueError("Invalid string reference in tree cache entry")
+
+    root = None
+    stack = []
+    for index in range(node_count):
+        value_id = values[index]
+        node = Node(INT_TO_ELEMENT[labels[index]],
+                    id=ids[index] if ids[index] >= 0 else None,
+                    value=strings[value_id] if value_id >= 0 else None)
+        if stack:
+            parent = stack[-1]
+            parent[0].add_child(node)
+            parent[1] -= 1
+            if parent[1] == 0:
+                stack.pop()
+        else:
+            root = node
+        if child_counts[index]:
+            stack.append([node, child_counts[index]])
+    if root is None or stack:
+        raise ValueError("Corrupted tree cache entry")
+    return root
+
+def load_cached_tree(path: str) -> Node:
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_tree(mapped)
+
+def store_cached_tree(path: str, tree: Node) -> None:
+    cache_dir = os.path.dirname(path) or '.'
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(encode_tree(tree))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def load_simplified_tree(mscz_path: str, cache_dir: Optional[str] = None, streaming: bool = False) -> Node:
+    if cache_dir is None:
+        return create_simplified_tree(mscz_path, streaming=streaming)
+    if not os.path.exists(mscz_path):
+        raise FileNotFoundError(f"File not found: {mscz_path}")
+    path = tree_cache_path(cache_dir, file_digest(mscz_path))
+    if os.path.exists(path):
+        try:
+            return load_cached_tree(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Warning: ignoring unreadable tree cache entry {path}: {e}")
+    tree = create_simplified_tree(mscz_path, streaming=streaming)
+    try:
+        store_cached_tree(path, tree)
+    except OSError as e:
+        logger.warning(f"Warning: could not write tree cache entry {path}: {e}")
+    return tree
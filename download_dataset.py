@@ -1,31 +1,115 @@
 import os
+import re
+import sys
 import json
 import shutil
-from huggingface_hub import hf_hub_download
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+from core.tree_cache import file_digest
 
 repo_id = "musegroup/omr_benchmark"
 
 pdf_dir = "./data/pdf"
 mscz_dir = "./data/mscz"
 dataset_dir = "./data/omr_benchmark"
-os.makedirs(pdf_dir, exist_ok=True)
-os.makedirs(mscz_dir, exist_ok=True)
-os.makedirs(dataset_dir, exist_ok=True)
-
-samples = None
-print("Downloading benchmark_dataset.json...")
-try:
-    downloaded_path = hf_hub_download(
-        repo_id=repo_id,
-        filename="benchmark_dataset.json",
-        repo_type="dataset"
-    )
-    shutil.copy(downloaded_path, os.path.join(dataset_dir, "benchmark_dataset.json"))
-    print(f"Dataset metadata saved to {dataset_dir}")
+manifest_path = os.path.join(dataset_dir, "download_manifest.json")
 
-    with open(downloaded_path, 'r') as f:
-        dataset_json = json.load(f)
+LINK_MODES = ('hardlink', 'symlink', 'copy')
+FILE_KINDS = ('pdf', 'mscz')
+MANIFEST_SAVE_INTERVAL = 50
+
+_SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+class HubSource:
+    def __init__(self, repo_id: str, revision: Optional[str] = None):
+        from huggingface_hub import hf_hub_download
+        self._hf_hub_download = hf_hub_download
+        self.repo_id = repo_id
+        self.revision = revision
+
+    def fetch(self, filename: str) -> str:
+        return self._hf_hub_download(repo_id=self.repo_id, filename=filename,
+                                     repo_type="dataset", revision=self.revision)
+
+    def expected_digest(self, path: str) -> Optional[str]:
+        blob_name = os.path.basename(os.path.realpath(path))
+        return blob_name if _SHA256_PATTERN.match(blob_name) else None
+
+class DirectorySource:
+    def __init__(self, root: str):
+        self.root = root
+
+    def fetch(self, filename: str) -> str:
+        path = os.path.join(self.root, filename)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{filename} not found in {self.root}")
+        return path
+
+    def expected_digest(self, path: str) -> Optional[str]:
+        return None
+
+def link_file(source_path: str, target_path: str, link_mode: str = 'hardlink') -> str:
+    if link_mode not in LINK_MODES:
+        raise ValueError(f"Unsupported link mode: {link_mode}")
+    source_path = os.path.realpath(source_path)
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    fd, temp_path = tempfile.mkstemp(dir=target_dir, suffix='.tmp')
+    os.close(fd)
+    os.remove(temp_path)
+    try:
+        if link_mode == 'hardlink':
+            try:
+                os.link(source_path, temp_path)
+            except OSError:
+                link_mode = 'copy'
+        elif link_mode == 'symlink':
+            os.symlink(source_path, temp_path)
+        if link_mode == 'copy':
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        raise
+    return link_mode
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable download manifest {path}: {e}")
+        return {}
 
+def save_manifest(path: str, manifest: Dict[str, Dict]) -> None:
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+def is_up_to_date(target_path: str, remote_filename: str, entry: Optional[Dict], verify: bool = False) -> bool:
+    if entry is None or entry.get('source') != remote_filename or not os.path.exists(target_path):
+        return False
+    if os.path.getsize(target_path) != entry.get('size'):
+        return False
+    return not verify or file_digest(target_path) == entry.get('sha256')
+
+def download_file(source, remote_filename: str, target_path: str, link_mode: str = 'hardlink') -> Dict:
+    downloaded_path = source.fetch(remote_filename)
+    digest = file_digest(downloaded_path)
+    expected = source.expected_digest(downloaded_path)
+    if expected is not None and digest != expected:
+        raise ValueError(f"checksum mismatch for {remote_filename}: expected {expected}, got {digest}")
+    used_mode = link_file(downloaded_path, target_path, link_mode)
+    return {'source': remote_filename, 'size': os.path.getsize(target_path), 'sha256': digest, 'link': used_mode}
+
+def load_samples(metadata_path: str) -> List[Dict]:
+    with open(metadata_path, 'r') as f:
+        dataset_json = json.load(f)
     samples = []
     for col_key in sorted(dataset_json.keys(), key=lambda x: int(x) if x.isdigit() else 0):
         sample_data = dataset_json[col_key]
@@ -35,47 +119,102 @@ try:
                 "pdf_image": sample_data["pdf_image"],
                 "score": sample_data["score"]
             })
-    print(f"Found {len(samples)} samples in dataset")
-except Exception as e:
-    print(f"  Error: Could not download benchmark_dataset.json: {e}")
-    exit(1)
-
-files_to_download = samples
-print(f"\nDownloading {len(files_to_download)} files...")
-
-for i, sample in enumerate(files_to_download):
-    sample_id = sample["id"]
-    pdf_file_path = sample["pdf_image"]
-    pdf_path = os.path.join(pdf_dir, f"score_file_{sample_id}.pdf")
+    return samples
+
+def plan_downloads(samples: List[Dict], kinds: Tuple[str, ...] = FILE_KINDS) -> List[Tuple[str, str, str]]:
+    downloads = []
+    for sample in samples:
+        sample_id = sample["id"]
+        if 'pdf' in kinds:
+            downloads.append((sample_id, sample["pdf_image"], os.path.join(pdf_dir, f"score_file_{sample_id}.pdf")))
+        if 'mscz' in kinds:
+            downloads.append((sample_id, sample["score"], os.path.join(mscz_dir, f"score_file_{sample_id}.mscz")))
+    return downloads
+
+def download_dataset(source, jobs: int = 8, kinds: Tuple[str, ...] = FILE_KINDS,
+                     link_mode: str = 'hardlink', verify: bool = False) -> int:
+    os.makedirs(dataset_dir, exist_ok=True)
+    if 'pdf' in kinds:
+        os.makedirs(pdf_dir, exist_ok=True)
+    if 'mscz' in kinds:
+        os.makedirs(mscz_dir, exist_ok=True)
+
+    print("Downloading benchmark_dataset.json...")
     try:
-        downloaded_path = hf_hub_download(
-            repo_id=repo_id,
-            filename=pdf_file_path,
-            repo_type="dataset"
-        )
-        with open(downloaded_path, "rb") as src:
-            with open(pdf_path, "wb") as dst:
-                dst.write(src.read())
+        metadata_path = os.path.join(dataset_dir, "benchmark_dataset.json")
+        link_file(source.fetch("benchmark_dataset.json"), metadata_path, 'copy')
+        print(f"Dataset metadata saved to {dataset_dir}")
+        samples = load_samples(metadata_path)
+        print(f"Found {len(samples)} samples in dataset")
     except Exception as e:
-        print(f"  Warning: Could not download PDF for sample {sample_id}: {e}")
+        print(f"  Error: Could not download benchmark_dataset.json: {e}")
+        return 1
 
-    score_file_path = sample["score"]
-    mscz_path = os.path.join(mscz_dir, f"score_file_{sample_id}.mscz")
+    manifest = load_manifest(manifest_path)
+    downloads = plan_downloads(samples, kinds)
+    pending = [(sample_id, remote, target) for sample_id, remote, target in downloads
+               if not is_up_to_date(target, remote, manifest.get(target), verify=verify)]
+    print(f"\n{len(downloads) - len(pending)}/{len(downloads)} files already present")
+    print(f"Downloading {len(pending)} files with {jobs} threads...")
+
+    failed = []
+    link_modes = set()
     try:
-        downloaded_path = hf_hub_download(
-            repo_id=repo_id,
-            filename=score_file_path,
-            repo_type="dataset"
-        )
-        with open(downloaded_path, "rb") as src:
-            with open(mscz_path, "wb") as dst:
-                dst.write(src.read())
-    except Exception as e:
-        print(f"  Warning: Could not download MuseScore file for sample {sample_id}: {e}")
-    
-    if (i + 1) % 10 == 0:
-        print(f"  Processed {i + 1}/{len(files_to_download)} files...")
-
-print(f"\nDownload complete!")
-print(f"  PDF files: {pdf_dir}")
-print(f"  MuseScore files: {mscz_dir}")
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(download_file, source, remote, target, link_mode): (sample_id, remote, target)
+                       for sample_id, remote, target in pending}
+            for completed, future in enumerate(as_completed(futures), 1):
+                sample_id, remote, target = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"  Warning: Could not download {remote} for sample {sample_id}: {e}")
+                    failed.append(target)
+                else:
+                    manifest[target] = entry
+                    link_modes.add(entry['link'])
+                if completed % MANIFEST_SAVE_INTERVAL == 0:
+                    save_manifest(manifest_path, manifest)
+                    print(f"  Processed {completed}/{len(pending)} files...")
+    finally:
+        save_manifest(manifest_path, manifest)
+
+    if link_mode == 'hardlink' and 'copy' in link_modes:
+        print("Note: some files could not be hard-linked into the download cache and were copied")
+    print(f"\nDownload complete!")
+    if 'pdf' in kinds:
+        print(f"  PDF files: {pdf_dir}")
+    if 'mscz' in kinds:
+        print(f"  MuseScore files: {mscz_dir}")
+    if failed:
+        print(f"  Failed: {len(failed)} files (run again to retry)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Download the OMR benchmark dataset from Hugging Face',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                       help='Number of concurrent downloads (default: 8)')
+    parser.add_argument('--only', choices=FILE_KINDS, default=None,
+                       help='Download only PDF or only MuseScore files')
+    parser.add_argument('--link', choices=LINK_MODES, default='hardlink',
+                       help='How files are placed in ./data: hard links into the download cache (default), '
+                            'symbolic links, or copies')
+    parser.add_argument('--verify', action='store_true',
+                       help='Re-hash files that are already present instead of trusting their recorded size')
+    parser.add_argument('--source-dir', default=None,
+                       help='Read files from a local directory with the layout of the Hugging Face repository '
+                            'instead of downloading them')
+    parser.add_argument('--revision', default=None,
+                       help='Dataset revision (branch, tag or commit) to download')
+    args = parser.parse_args()
+    if args.source_dir is not None:
+        source = DirectorySource(args.source_dir)
+    else:
+        source = HubSource(repo_id, revision=args.revision)
+    kinds = (args.only,) if args.only is not None else FILE_KINDS
+    sys.exit(download_dataset(source, jobs=args.jobs, kinds=kinds, link_mode=args.link, verify=args.verify))
@@ -14,7 +14,8 @@ from .sequence_metrics import (
 )
 from .chord_metrics import (
     calculate_chord_metrics,
-    get_measure_alignment_from_chords
+    get_measure_alignment_from_chords,
+    MeasureAlignmentContext
 )
 from .element_metrics import (
     calculate_element_metrics
@@ -33,6 +34,7 @@ __all__ = [
     'symbol_error_rate',
     'calculate_chord_metrics',
     'get_measure_alignment_from_chords',
+    'MeasureAlignmentContext',
     'calculate_element_metrics',
     'print_element_metrics',
     'print_metrics',
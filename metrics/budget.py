@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import pickle
+import time
+import traceback
+from typing import Any, Callable, Optional, Tuple
+from core.instrumentation import active_instrumentation, instrumentation
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class BudgetExceeded(Exception):
+    pass
+
+class _RemoteTraceback(Exception):
+    def __init__(self, text: str):
+        self.text = text
+
+    def __str__(self) -> str:
+        return self.text
+
+def _current_address_space() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _budgeted_call(connection, func: Callable, args: Tuple, memory_budget_mb: Optional[int]) -> None:
+    if memory_budget_mb is not None and resource is not None:
+        limit = _current_address_space() + memory_budget_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        with instrumentation() as recorder:
+            result = func(*args)
+    except MemoryError:
+        connection.send(('memory', None))
+    except Exception as e:
+        remote_traceback = traceback.format_exc()
+        try:
+            pickle.loads(pickle.dumps(e))
+            error = e
+        except Exception:
+            error = RuntimeError(f"{type(e).__name__}: {e}")
+        connection.send(('error', (error, remote_traceback)))
+    else:
+        connection.send(('ok', (result, recorder.as_dict())))
+    finally:
+        connection.close()
+
+def run_with_budget(func: Callable, args: Tuple = (),
+                    time_budget: Optional[float] = None,
+                    memory_budget_mb: Optional[int] = None) -> Any:
+    if time_budget is None and memory_budget_mb is None:
+        return func(*args)
+    start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+    context = multiprocessing.get_context(start_method)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_budgeted_call, args=(sender, func, args, memory_budget_mb))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(time_budget):
+            raise BudgetExceeded(f"time budget of {time_budget:g}s exceeded")
+        try:
+            status, payload = receiver.recv()
+        except EOFError:
+            process.join()
+            raise BudgetExceeded(f"computation exited with code {process.exitcode}")
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+    if status == 'memory':
+        raise BudgetExceeded(f"memory budget of {memory_budget_mb} MB exceeded")
+    if status == 'error':
+        error, remote_traceback = payload
+        raise error from _RemoteTraceback(remote_traceback)
+    result, snapshot = payload
+    recorder = active_instrumentation()
+    if recorder is not None:
+        recorder.merge(snapshot)
+    return result
+
+class PairBudget:
+    def __init__(self, time_budget: Optional[float] = None, memory_budget_mb: Optional[int] = None):
+        self.time_budget = time_budget
+        self.memory_budget_mb = memory_budget_mb
+        self._start = time.perf_counter()
+
+    def remaining(self) -> Optional[float]:
+        if self.time_budget is None:
+            return None
+        return max(self.time_budget - (time.perf_counter() - self._start), 0.0)
+
+    def run(self, func: Callable, args: Tuple = ()) -> Any:
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise BudgetExceeded(f"time budget of {self.time_budget:g}s exceeded")
+        try:
+            return run_with_budget(func, args, time_budget=remaining, memory_budget_mb=self.memory_budget_mb)
+        except BudgetExceeded:
+            if remaining is not None and self.remaining() <= 0:
+                raise BudgetExceeded(f"time budget of {self.time_budget:g}s exceeded") from None
+            raise
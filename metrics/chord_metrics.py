@@ -1,6 +1,8 @@
 from collections import defaultdict
-from typing import List, Dict, Tuple, Set, Optional
+from typing import List, Dict, Tuple, Set, Optional, Callable
 from core.score_tree import Node
+from core.instrumentation import timed
+from metrics.sequence_alignment import align_by_match_values, align_by_match_function
 import re
 
 def normalize_articulation(articulation: str) -> str:
@@ -127,46 +129,129 @@ def chord_similarity(chord1: Dict, chord2: Dict) -> float:
         total_weight += 0.1
     return score / total_weight if total_weight > 0 else 0.0
 
-def measure_similarity(gt_measure_id: int, pred_measure_id: int,
-                       staff_id: int,
-                       gt_by_measure: Dict, pred_by_measure: Dict) -> float:
-    gt_key = (staff_id, gt_measure_id)
-    pred_key = (staff_id, pred_measure_id)
-    gt_chords = gt_by_measure.get(gt_key, [])
-    pred_chords = pred_by_measure.get(pred_key, [])
-    if not gt_chords and not pred_chords:
+def chord_match_values(similarities: List[List[float]]) -> List[List[float]]:
+    match_score = 1.0
+    mismatch_penalty = -0.5
+    return [
+        [similarity * match_score + (1 - similarity) * mismatch_penalty for similarity in row]
+        for row in similarities
+    ]
+
+CHORD_GAP_PENALTY = -0.3
+
+def measure_similarity_from_chord_similarities(similarities: List[List[float]],
+                                               gt_count: int, pred_count: int) -> float:
+    if gt_count == 0 and pred_count == 0:
         return 1.0
-    if not gt_chords or not pred_chords:
+    if gt_count == 0 or pred_count == 0:
         return 0.0
 
-    gt_chords_sorted = sorted(gt_chords, key=lambda x: x['chord_id'])
-    pred_chords_sorted = sorted(pred_chords, key=lambda x: x['chord_id'])
-    count_ratio = min(len(gt_chords_sorted), len(pred_chords_sorted)) / max(len(gt_chords_sorted), len(pred_chords_sorted), 1)
+    count_ratio = min(gt_count, pred_count) / max(gt_count, pred_count, 1)
     count_score = count_ratio * 0.3
 
-    min_chords = min(len(gt_chords_sorted), len(pred_chords_sorted))
-    if min_chords == 0:
-        chord_score = 0.0
+    alignment = align_by_match_values(chord_match_values(similarities), gt_count, pred_count, CHORD_GAP_PENALTY)
+    total_similarity = 0.0
+    matched_pairs = 0
+    for gt_index, pred_index in alignment:
+        if gt_index is not None and pred_index is not None:
+            total_similarity += similarities[gt_index][pred_index]
+            matched_pairs += 1
+    if matched_pairs > 0:
+        chord_score = (total_similarity / matched_pairs) * 0.7
     else:
-        alignment = align_chords_in_measure(gt_chords_sorted, pred_chords_sorted)
-        total_similarity = 0.0
-        matched_pairs = 0
-        for gt_chord, pred_chord in alignment:
-            if gt_chord is not None and pred_chord is not None:
-                similarity = chord_similarity(gt_chord, pred_chord)
-                total_similarity += similarity
-                matched_pairs += 1
-        if matched_pairs > 0:
-            chord_score = (total_similarity / matched_pairs) * 0.7
-        else:
-            chord_score = 0.0
+        chord_score = 0.0
     return count_score + chord_score
 
+def sort_chords_by_id(chords: List[Dict]) -> List[Dict]:
+    return sorted(chords, key=lambda x: x['chord_id'])
+
+def measure_similarity(gt_measure_id: int, pred_measure_id: int,
+                       staff_id: int,
+                       gt_by_measure: Dict, pred_by_measure: Dict) -> float:
+    gt_key = (staff_id, gt_measure_id)
+    pred_key = (staff_id, pred_measure_id)
+    gt_chords_sorted = sort_chords_by_id(gt_by_measure.get(gt_key, []))
+    pred_chords_sorted = sort_chords_by_id(pred_by_measure.get(pred_key, []))
+    similarities = [[chord_similarity(gt_chord, pred_chord) for pred_chord in pred_chords_sorted]
+                    for gt_chord in gt_chords_sorted]
+    return measure_similarity_from_chord_similarities(similarities, len(gt_chords_sorted), len(pred_chords_sorted))
+
+def chord_signature(chord: Dict) -> Tuple:
+    return (
+        frozenset(chord.get('pitches', [])),
+        chord.get('duration'),
+        chord.get('has_dot', False),
+        frozenset(chord.get('spanners', [])),
+        frozenset(chord.get('articulations', []))
+    )
+
+class MeasureSimilarityCache:
+    def __init__(self):
+        self.signature_ids = {}
+        self.representatives = []
+        self.chord_similarities = {}
+        self.measure_similarities = {}
+
+    def encode_measure(self, chords: List[Dict]) -> Tuple[int, ...]:
+        encoded = []
+        for chord in sort_chords_by_id(chords):
+            signature = chord_signature(chord)
+            signature_id = self.signature_ids.get(signature)
+            if signature_id is None:
+                signature_id = len(self.representatives)
+                self.signature_ids[signature] = signature_id
+                self.representatives.append(chord)
+            encoded.append(signature_id)
+        return tuple(encoded)
+
+    def similarity(self, gt_signature_ids: Tuple[int, ...], pred_signature_ids: Tuple[int, ...]) -> float:
+        measure_key = (gt_signature_ids, pred_signature_ids)
+        cached = self.measure_similarities.get(measure_key)
+        if cached is not None:
+            return cached
+        similarities = []
+        for gt_signature_id in gt_signature_ids:
+            similarity_row = []
+            for pred_signature_id in pred_signature_ids:
+                chord_key = (gt_signature_id, pred_signature_id)
+                chord_sim = self.chord_similarities.get(chord_key)
+                if chord_sim is None:
+                    chord_sim = chord_similarity(self.representatives[gt_signature_id],
+                                                 self.representatives[pred_signature_id])
+                    self.chord_similarities[chord_key] = chord_sim
+                similarity_row.append(chord_sim)
+            similarities.append(similarity_row)
+        result = measure_similarity_from_chord_similarities(
+            similarities, len(gt_signature_ids), len(pred_signature_ids)
+        )
+        self.measure_similarities[measure_key] = result
+        return result
+
+def measure_similarity_function(staff_id: int,
+                                gt_measure_ids: List[int],
+                                pred_measure_ids: List[int],
+                                gt_by_measure: Dict,
+                                pred_by_measure: Dict,
+                                cache: Optional[MeasureSimilarityCache] = None) -> Callable[[int, int], float]:
+    if cache is None:
+        cache = MeasureSimilarityCache()
+    gt_encoded = [cache.encode_measure(gt_by_measure.get((staff_id, measure_id), []))
+                  for measure_id in gt_measure_ids]
+    pred_encoded = [cache.encode_measure(pred_by_measure.get((staff_id, measure_id), []))
+                    for measure_id in pred_measure_ids]
+
+    def similarity(gt_index: int, pred_index: int) -> float:
+        return cache.similarity(gt_encoded[gt_index], pred_encoded[pred_index])
+
+    return similarity
+
 def align_measures_in_staff(staff_id: int,
                             gt_measure_ids: List[int],
                             pred_measure_ids: List[int],
                             gt_by_measure: Dict,
-                            pred_by_measure: Dict) -> List[Tuple[Optional[int], Optional[int]]]:
+                            pred_by_measure: Dict,
+                            band: Optional[int] = None,
+                            similarity_cache: Optional[MeasureSimilarityCache] = None) -> List[Tuple[Optional[int], Optional[int]]]:
     n = len(gt_measure_ids)
     m = len(pred_measure_ids)
     if n == 0:
@@ -176,113 +261,124 @@ def align_measures_in_staff(staff_id: int,
     match_score = 1.0
     mismatch_penalty = -0.3
     gap_penalty = -0.2
-    dp = [[0.0] * (m + 1) for _ in range(n + 1)]
-    for i in range(1, n + 1):
-        dp[i][0] = dp[i-1][0] + gap_penalty
-    for j in range(1, m + 1):
-        dp[0][j] = dp[0][j-1] + gap_penalty
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            gt_measure_id = gt_measure_ids[i-1]
-            pred_measure_id = pred_measure_ids[j-1]
-            similarity = measure_similarity(
-                gt_measure_id, pred_measure_id, staff_id,
-                gt_by_measure, pred_by_measure
-            )
-            match_value = similarity * match_score + (1 - similarity) * mismatch_penalty
-            option_match = dp[i-1][j-1] + match_value
-            option_gap_pred = dp[i-1][j] + gap_penalty
-            option_gap_gt = dp[i][j-1] + gap_penalty
-            dp[i][j] = max(option_match, option_gap_pred, option_gap_gt)
-    alignment = []
-    i, j = n, m
-    while i > 0 or j > 0:
-        if i > 0 and j > 0:
-            gt_measure_id = gt_measure_ids[i-1]
-            pred_measure_id = pred_measure_ids[j-1]
-            similarity = measure_similarity(
-                gt_measure_id, pred_measure_id, staff_id,
-                gt_by_measure, pred_by_measure
-            )
-            match_value = similarity * match_score + (1 - similarity) * mismatch_penalty
-            if dp[i][j] == dp[i-1][j-1] + match_value:
-                alignment.append((gt_measure_id, pred_measure_id))
-                i -= 1
-                j -= 1
-            elif dp[i][j] == dp[i-1][j] + gap_penalty:
-                alignment.append((gt_measure_id, None))
-                i -= 1
-            else:
-                alignment.append((None, pred_measure_id))
-                j -= 1
-        elif i > 0:
-            alignment.append((gt_measure_ids[i-1], None))
-            i -= 1
-        else:
-            alignment.append((None, pred_measure_ids[j-1]))
-            j -= 1
-    alignment.reverse()
-    return alignment
+    similarity = measure_similarity_function(
+        staff_id, gt_measure_ids, pred_measure_ids,
+        gt_by_measure, pred_by_measure, similarity_cache
+    )
 
-def align_chords_in_measure(gt_chords: List[Dict], pred_chords: List[Dict]) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+    def match_value(i: int, j: int) -> float:
+        measure_sim = similarity(i, j)
+        return measure_sim * match_score + (1 - measure_sim) * mismatch_penalty
+
+    return [
+        (gt_measure_ids[i] if i is not None else None, pred_measure_ids[j] if j is not None else None)
+        for i, j in align_by_match_function(match_value, n, m, gap_penalty, band)
+    ]
+
+def align_chord_indices_in_measure(gt_chords: List[Dict], pred_chords: List[Dict]) -> List[Tuple[Optional[int], Optional[int]]]:
     n = len(gt_chords)
     m = len(pred_chords)
     if n == 0:
-        return [(None, pred_chord) for pred_chord in pred_chords]
+        return [(None, j) for j in range(m)]
     if m == 0:
-        return [(gt_chord, None) for gt_chord in gt_chords]
+        return [(i, None) for i in range(n)]
+    similarities = [[chord_similarity(gt_chord, pred_chord) for pred_chord in pred_chords]
+                    for gt_chord in gt_chords]
+    return list(align_by_match_values(chord_match_values(similarities), n, m, CHORD_GAP_PENALTY))
 
-    match_score = 1.0
-    mismatch_penalty = -0.5
-    gap_penalty = -0.3
-    dp = [[0.0] * (m + 1) for _ in range(n + 1)]
-
-    for i in range(1, n + 1):
-        dp[i][0] = dp[i-1][0] + gap_penalty
-
-    for j in range(1, m + 1):
-        dp[0][j] = dp[0][j-1] + gap_penalty
-
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            gt_chord = gt_chords[i-1]
-            pred_chord = pred_chords[j-1]
-            similarity = chord_similarity(gt_chord, pred_chord)
-            match_value = similarity * match_score + (1 - similarity) * mismatch_penalty
-            option_match = dp[i-1][j-1] + match_value
-            option_gap_pred = dp[i-1][j] + gap_penalty
-            option_gap_gt = dp[i][j-1] + gap_penalty
-            dp[i][j] = max(option_match, option_gap_pred, option_gap_gt)
-
-    alignment = []
-    i, j = n, m
-    while i > 0 or j > 0:
-        if i > 0 and j > 0:
-            gt_chord = gt_chords[i-1]
-            pred_chord = pred_chords[j-1]
-            similarity = chord_similarity(gt_chord, pred_chord)
-            match_value = similarity * match_score + (1 - similarity) * mismatch_penalty
-
-            if dp[i][j] == dp[i-1][j-1] + match_value:
-                alignment.append((gt_chord, pred_chord))
-                i -= 1
-                j -= 1
-            elif dp[i][j] == dp[i-1][j] + gap_penalty:
-                alignment.append((gt_chord, None))
-                i -= 1
-            else:
-                alignment.append((None, pred_chord))
-                j -= 1
-        elif i > 0:
-            alignment.append((gt_chords[i-1], None))
-            i -= 1
-        else:
-            alignment.append((None, pred_chords[j-1]))
-            j -= 1
-    alignment.reverse()
-    return alignment
+def _chords_from_indices(alignment: List[Tuple[Optional[int], Optional[int]]], gt_chords: List[Dict],
+                         pred_chords: List[Dict]) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+    return [(gt_chords[i] if i is not None else None, pred_chords[j] if j is not None else None)
+            for i, j in alignment]
 
-def match_chords_by_position(gt_chords: List[Dict], pred_chords: List[Dict], use_alignment: bool = True) -> Tuple[List[Tuple[Optional[Dict], Optional[Dict]]], Dict]:
+def align_chords_in_measure(gt_chords: List[Dict], pred_chords: List[Dict]) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+    return _chords_from_indices(align_chord_indices_in_measure(gt_chords, pred_chords), gt_chords, pred_chords)
+
+class MeasureAlignmentContext:
+    def __init__(self, gt_tree: Node, pred_tree: Node,
+                 gt_chords: Optional[List[Dict]] = None,
+                 gt_measures: Optional[List[Tuple[int, int]]] = None):
+        self.gt_tree = gt_tree
+        self.pred_tree = pred_tree
+        self.similarity_cache = MeasureSimilarityCache()
+        self._gt_chords = gt_chords
+        self._gt_measures = gt_measures
+        self._chords = None
+        self._measures = None
+        self._measure_alignments = {}
+        self._chord_alignments = {}
+        self._measure_mappings = {}
+
+    def chords(self) -> Tuple[List[Dict], List[Dict]]:
+        if self._chords is None:
+            with timed('chord_extraction'):
+                gt_chords = self._gt_chords if self._gt_chords is not None else extract_chords_with_attributes(self.gt_tree)
+                self._chords = (gt_chords, extract_chords_with_attributes(self.pred_tree))
+        return self._chords
+
+    def measures(self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        if self._measures is None:
+            gt_measures = self._gt_measures if self._gt_measures is not None else extract_all_measures_from_tree(self.gt_tree)
+            self._measures = (gt_measures, extract_all_measures_from_tree(self.pred_tree))
+        return self._measures
+
+    def align_measures(self, staff_id: int,
+                       gt_measure_ids: List[int],
+                       pred_measure_ids: List[int],
+                       gt_by_measure: Dict,
+                       pred_by_measure: Dict,
+                       band: Optional[int] = None) -> List[Tuple[Optional[int], Optional[int]]]:
+        key = (staff_id, tuple(gt_measure_ids), tuple(pred_measure_ids), band)
+        alignment = self._measure_alignments.get(key)
+        if alignment is None:
+            with timed('measure_alignment'):
+                alignment = align_measures_in_staff(
+                    staff_id, gt_measure_ids, pred_measure_ids,
+                    gt_by_measure, pred_by_measure,
+                    band=band, similarity_cache=self.similarity_cache
+                )
+            self._measure_alignments[key] = alignment
+        return alignment
+
+    def align_chords(self, staff_id: int,
+                     gt_measure_id: Optional[int],
+                     pred_measure_id: Optional[int],
+                     gt_chords: List[Dict],
+                     pred_chords: List[Dict]) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+        key = (staff_id, gt_measure_id, pred_measure_id)
+        alignment = self._chord_alignments.get(key)
+        if alignment is None:
+            with timed('chord_alignment'):
+                alignment = align_chord_indices_in_measure(gt_chords, pred_chords)
+            self._chord_alignments[key] = alignment
+        return _chords_from_indices(alignment, gt_chords, pred_chords)
+
+    def measure_mapping(self, band: Optional[int] = None) -> Dict[Tuple[int, int], Optional[int]]:
+        mapping = self._measure_mappings.get(band)
+        if mapping is None:
+            mapping = get_measure_alignment_from_chords(self.gt_tree, self.pred_tree,
+                                                        measure_band=band, context=self)
+            self._measure_mappings[band] = mapping
+        return mapping
+
+    def set_measure_mapping(self, mapping: Dict[Tuple[int, int], Optional[int]], band: Optional[int] = None) -> None:
+        self._measure_mappings[band] = mapping
+
+    def alignment_cache(self) -> Dict:
+        return {
+            'measure_alignments': self._measure_alignments,
+            'chord_alignments': self._chord_alignments,
+            'measure_mappings': self._measure_mappings,
+        }
+
+    def merge_alignment_cache(self, cache: Dict) -> None:
+        self._measure_alignments.update(cache['measure_alignments'])
+        self._chord_alignments.update(cache['chord_alignments'])
+        self._measure_mappings.update(cache['measure_mappings'])
+
+def match_chords_by_position(gt_chords: List[Dict], pred_chords: List[Dict], use_alignment: bool = True,
+                             measure_band: Optional[int] = None,
+                             context: Optional[MeasureAlignmentContext] = None) -> Tuple[List[Tuple[Optional[Dict], Optional[Dict]]], Dict]:
     if not use_alignment:
         gt_by_position = {}
         pred_by_position = {}
@@ -335,6 +431,7 @@ def match_chords_by_position(gt_chords: List[Dict], pred_chords: List[Dict], use
         gt_by_staff[staff_id] = sorted(set(gt_by_staff[staff_id]))
     for staff_id in pred_by_staff:
         pred_by_staff[staff_id] = sorted(set(pred_by_staff[staff_id]))
+    align_measures = context.align_measures if context is not None else align_measures_in_staff
     all_matches = []
     all_staffs = set(gt_by_staff.keys()) | set(pred_by_staff.keys())
     measure_stats = {
@@ -352,12 +449,13 @@ def match_chords_by_position(gt_chords: List[Dict], pred_chords: List[Dict], use
         pred_measure_ids = pred_by_staff.get(staff_id, [])
         measure_stats['gt_measures_count'] += len(gt_measure_ids)
         measure_stats['pred_measures_count'] += len(pred_measure_ids)
-        measure_alignment = align_measures_in_staff(
+        measure_alignment = align_measures(
             staff_id,
             gt_measure_ids,
             pred_measure_ids,
             gt_by_measure,
-            pred_by_measure
+            pred_by_measure,
+            band=measure_band
         )
         for gt_measure_id, pred_measure_id in measure_alignment:
             if gt_measure_id is not None and pred_measure_id is not None:
@@ -394,7 +492,11 @@ def match_chords_by_position(gt_chords: List[Dict], pred_chords: List[Dict], use
                 pred_measure_chords = []
             gt_measure_chords.sort(key=lambda x: x['chord_id'])
             pred_measure_chords.sort(key=lambda x: x['chord_id'])
-            chord_alignment = align_chords_in_measure(gt_measure_chords, pred_measure_chords)
+            if context is not None:
+                chord_alignment = context.align_chords(staff_id, gt_measure_id, pred_measure_id,
+                                                       gt_measure_chords, pred_measure_chords)
+            else:
+                chord_alignment = align_chords_in_measure(gt_measure_chords, pred_measure_chords)
             all_matches.extend(chord_alignment)
     return all_matches, measure_stats
 
@@ -501,11 +603,24 @@ def extract_all_measures_from_tree(node: Node, staff_id: Optional[int] = None, p
         measures.extend(extract_all_measures_from_tree(child, current_staff_id, current_part_id))
     return measures
 
-def get_measure_alignment_from_chords(gt_tree: Node, pred_tree: Node) -> Dict[Tuple[int, int], Optional[int]]:
-    gt_chords = extract_chords_with_attributes(gt_tree)
-    pred_chords = extract_chords_with_attributes(pred_tree)
-    gt_all_measures = extract_all_measures_from_tree(gt_tree)
-    pred_all_measures = extract_all_measures_from_tree(pred_tree)
+def positional_measure_mapping(gt_tree: Node, pred_tree: Node) -> Dict[Tuple[int, int], Optional[int]]:
+    pred_measures = set(extract_all_measures_from_tree(pred_tree))
+    return {
+        (staff_id, measure_id): measure_id if (staff_id, measure_id) in pred_measures else None
+        for staff_id, measure_id in extract_all_measures_from_tree(gt_tree)
+    }
+
+def get_measure_alignment_from_chords(gt_tree: Node, pred_tree: Node,
+                                      measure_band: Optional[int] = None,
+                                      context: Optional[MeasureAlignmentContext] = None) -> Dict[Tuple[int, int], Optional[int]]:
+    if context is not None:
+        gt_chords, pred_chords = context.chords()
+        gt_all_measures, pred_all_measures = context.measures()
+    else:
+        gt_chords = extract_chords_with_attributes(gt_tree)
+        pred_chords = extract_chords_with_attributes(pred_tree)
+        gt_all_measures = extract_all_measures_from_tree(gt_tree)
+        pred_all_measures = extract_all_measures_from_tree(pred_tree)
 
     gt_by_measure = defaultdict(list)
     pred_by_measure = defaultdict(list)
@@ -527,29 +642,39 @@ def get_measure_alignment_from_chords(gt_tree: Node, pred_tree: Node) -> Dict[Tu
     for staff_id in pred_by_staff:
         pred_by_staff[staff_id] = sorted(set(pred_by_staff[staff_id]))
 
+    align_measures = context.align_measures if context is not None else align_measures_in_staff
     measure_mapping = {}
     all_staffs = set(gt_by_staff.keys()) | set(pred_by_staff.keys())
     for staff_id in sorted(all_staffs):
         gt_measure_ids = gt_by_staff.get(staff_id, [])
         pred_measure_ids = pred_by_staff.get(staff_id, [])
-        measure_alignment = align_measures_in_staff(
+        measure_alignment = align_measures(
             staff_id,
             gt_measure_ids,
             pred_measure_ids,
             gt_by_measure,
-            pred_by_measure
+            pred_by_measure,
+            band=measure_band
         )
         for gt_measure_id, pred_measure_id in measure_alignment:
             if gt_measure_id is not None:
                 measure_mapping[(staff_id, gt_measure_id)] = pred_measure_id
     return measure_mapping
 
-def calculate_chord_metrics(gt_tree: Node, pred_tree: Node, use_alignment: bool = True) -> Dict:
-    gt_chords = extract_chords_with_attributes(gt_tree)
-    pred_chords = extract_chords_with_attributes(pred_tree)
+def calculate_chord_metrics(gt_tree: Node, pred_tree: Node, use_alignment: bool = True,
+                            measure_band: Optional[int] = None,
+                            context: Optional[MeasureAlignmentContext] = None) -> Dict:
+    if context is not None:
+        gt_chords, pred_chords = context.chords()
+    else:
+        gt_chords = extract_chords_with_attributes(gt_tree)
+        pred_chords = extract_chords_with_attributes(pred_tree)
     assign_chord_positions_in_measures(gt_chords)
     assign_chord_positions_in_measures(pred_chords)
-    chord_matches, measure_stats = match_chords_by_position(gt_chords, pred_chords, use_alignment=use_alignment)
+    chord_matches, measure_stats = match_chords_by_position(
+        gt_chords, pred_chords, use_alignment=use_alignment,
+        measure_band=measure_band, context=context
+    )
     metrics = {
         'pitch': {'correct': 0, 'total': 0, 'errors': []},
         'duration': {'correct': 0, 'total': 0, 'errors': []},
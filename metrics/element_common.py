@@ -1,110 +1,101 @@
+import weakref
 from collections import defaultdict
 from typing import List, Dict, Tuple, Optional, Callable
 from core.score_tree import Node
+from core.instrumentation import timed
+from metrics.sequence_alignment import align_by_match_function
 
-def extract_elements_with_attributes(node: Node,
-                                    element_type: str,
-                                    part_id: Optional[int] = None,
-                                    staff_id: Optional[int] = None,
-                                    measure_id: Optional[int] = None,
-                                    chord_id: Optional[int] = None,
-                                    inside_chord: bool = False,
-                                    inside_note: bool = False) -> List[Dict]:
-    elements = []
-    current_part_id = part_id
-    current_staff_id = staff_id
-    current_measure_id = measure_id
-    current_chord_id = chord_id
-    current_inside_chord = inside_chord
-    current_inside_note = inside_note
+INDEXED_ELEMENT_TYPES = ("Rest", "Tuplet", "Clef", "KeySig", "TimeSig", "Tempo", "Instrument", "Staff",
+                         "Dynamic", "Spanner", "Fermata", "Text", "Lyrics")
 
-    if node.label == "Part":
-        current_part_id = node.id
-    elif node.label == "Staff":
-        current_staff_id = node.id
-    elif node.label == "Measure":
-        current_measure_id = node.id
-        current_inside_chord = False
-        current_inside_note = False
-    elif node.label == "Chord":
-        current_chord_id = node.id
-        current_inside_chord = True
-        current_inside_note = False
-    elif node.label == "Note":
-        current_inside_note = True
+_element_indexes = weakref.WeakKeyDictionary()
 
-    if node.label == element_type:
-        if element_type in ["Spanner", "Fermata"]:
-            if current_inside_chord or current_inside_note:
-                pass
-            else:
-                element_info = {
-                    'part_id': current_part_id,
-                    'staff_id': current_staff_id,
-                    'measure_id': current_measure_id,
-                    'element_id': node.id,
-                }
-                if element_type == "Spanner":
-                    element_info['value'] = node.value
-                elif element_type == "Fermata":
-                    element_info['value'] = node.value
-                elements.append(element_info)
-        else:
+def collect_elements(root: Node,
+                     element_types: Tuple[str, ...],
+                     part_id: Optional[int] = None,
+                     staff_id: Optional[int] = None,
+                     measure_id: Optional[int] = None,
+                     chord_id: Optional[int] = None,
+                     inside_chord: bool = False,
+                     inside_note: bool = False) -> Dict[str, List[Dict]]:
+    elements_by_type = {element_type: [] for element_type in element_types}
+    stack = [(root, part_id, staff_id, measure_id, chord_id, inside_chord, inside_note)]
+    while stack:
+        node, part_id, staff_id, measure_id, chord_id, inside_chord, inside_note = stack.pop()
+        label = node.label
+        if label == "Part":
+            part_id = node.id
+        elif label == "Staff":
+            staff_id = node.id
+        elif label == "Measure":
+            measure_id = node.id
+            inside_chord = False
+            inside_note = False
+        elif label == "Chord":
+            chord_id = node.id
+            inside_chord = True
+            inside_note = False
+        elif label == "Note":
+            inside_note = True
+
+        elements = elements_by_type.get(label)
+        if elements is not None and not (label in ("Spanner", "Fermata") and (inside_chord or inside_note)):
             element_info = {
-                'part_id': current_part_id,
-                'staff_id': current_staff_id,
-                'measure_id': current_measure_id,
+                'part_id': part_id,
+                'staff_id': staff_id,
+                'measure_id': measure_id,
                 'element_id': node.id,
             }
-            if element_type == "Rest":
+            if label == "Rest":
                 element_info['value'] = None
                 for child in node.children:
                     if child.label == "Duration":
                         element_info['value'] = child.value
                         break
-            elif element_type == "Staff":
+            elif label == "Staff":
                 element_info['value'] = None
-            elif element_type == "Lyrics":
+            elif label == "Lyrics":
                 element_info['value'] = node.value
-                element_info['chord_id'] = current_chord_id
+                element_info['chord_id'] = chord_id
             else:
                 element_info['value'] = node.value
             elements.append(element_info)
-    for child in node.children:
-        elements.extend(extract_elements_with_attributes(
-            child, element_type, current_part_id, current_staff_id, current_measure_id,
-            current_chord_id, current_inside_chord, current_inside_note
-        ))
-    return elements
+        for child in reversed(node.children):
+            stack.append((child, part_id, staff_id, measure_id, chord_id, inside_chord, inside_note))
+    return elements_by_type
+
+def get_element_index(root: Node) -> Dict[str, List[Dict]]:
+    index = _element_indexes.get(root)
+    if index is None:
+        with timed('element_extraction'):
+            index = collect_elements(root, INDEXED_ELEMENT_TYPES)
+        _element_indexes[root] = index
+    return index
+
+def set_element_index(root: Node, index: Dict[str, List[Dict]]) -> None:
+    _element_indexes[root] = index
+
+def extract_elements_with_attributes(node: Node,
+                                    element_type: str,
+                                    part_id: Optional[int] = None,
+                                    staff_id: Optional[int] = None,
+                                    measure_id: Optional[int] = None,
+                                    chord_id: Optional[int] = None,
+                                    inside_chord: bool = False,
+                                    inside_note: bool = False) -> List[Dict]:
+    at_root = (part_id is None and staff_id is None and measure_id is None and chord_id is None
+               and not inside_chord and not inside_note)
+    if at_root and element_type in INDEXED_ELEMENT_TYPES:
+        return [dict(element) for element in get_element_index(node)[element_type]]
+    return collect_elements(
+        node, (element_type,), part_id, staff_id, measure_id, chord_id, inside_chord, inside_note
+    )[element_type]
 
 def extract_all_clefs(node: Node,
                       part_id: Optional[int] = None,
                       staff_id: Optional[int] = None,
                       measure_id: Optional[int] = None) -> List[Dict]:
-    elements = []
-    current_part_id = part_id
-    current_staff_id = staff_id
-    current_measure_id = measure_id
-    if node.label == "Part":
-        current_part_id = node.id
-    elif node.label == "Staff":
-        current_staff_id = node.id
-    elif node.label == "Measure":
-        current_measure_id = node.id
-    if node.label == "Clef":
-        element_info = {
-            'part_id': current_part_id,
-            'staff_id': current_staff_id,
-            'measure_id': current_measure_id,
-            'element_id': node.id,
-            'value': node.value
-        }
-        elements.append(element_info)
-    for child in node.children:
-        elements.extend(extract_all_clefs(
-            child, current_part_id, current_staff_id, current_measure_id
-        ))
-    return elements
+    return extract_elements_with_attributes(node, "Clef", part_id, staff_id, measure_id)
 
 def assign_element_positions_in_measures(elements: List[Dict], element_type: str = None) -> None:
     if element_type == "Lyrics":
@@ -158,7 +149,8 @@ def align_measures_in_staff_for_elements(staff_id: int,
                                         gt_measure_ids: List[int],
                                         pred_measure_ids: List[int],
                                         gt_by_measure: Dict,
-                                        pred_by_measure: Dict) -> List[Tuple[Optional[int], Optional[int]]]:
+                                        pred_by_measure: Dict,
+                                        band: Optional[int] = None) -> List[Tuple[Optional[int], Optional[int]]]:
     n = len(gt_measure_ids)
     m = len(pred_measure_ids)
     if n == 0:
@@ -168,53 +160,18 @@ def align_measures_in_staff_for_elements(staff_id: int,
     match_score = 1.0
     mismatch_penalty = -0.3
     gap_penalty = -0.2
-    dp = [[0.0] * (m + 1) for _ in range(n + 1)]
-    for i in range(1, n + 1):
-        dp[i][0] = dp[i-1][0] + gap_penalty
-    for j in range(1, m + 1):
-        dp[0][j] = dp[0][j-1] + gap_penalty
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            gt_measure_id = gt_measure_ids[i-1]
-            pred_measure_id = pred_measure_ids[j-1]
-            similarity = measure_similarity_for_elements(
-                gt_measure_id, pred_measure_id, staff_id,
-                gt_by_measure, pred_by_measure
-            )
-            match_value = similarity * match_score + (1 - similarity) * mismatch_penalty
-            option_match = dp[i-1][j-1] + match_value
-            option_gap_pred = dp[i-1][j] + gap_penalty
-            option_gap_gt = dp[i][j-1] + gap_penalty
-            dp[i][j] = max(option_match, option_gap_pred, option_gap_gt)
-    alignment = []
-    i, j = n, m
-    while i > 0 or j > 0:
-        if i > 0 and j > 0:
-            gt_measure_id = gt_measure_ids[i-1]
-            pred_measure_id = pred_measure_ids[j-1]
-            similarity = measure_similarity_for_elements(
-                gt_measure_id, pred_measure_id, staff_id,
-                gt_by_measure, pred_by_measure
-            )
-            match_value = similarity * match_score + (1 - similarity) * mismatch_penalty
-            if dp[i][j] == dp[i-1][j-1] + match_value:
-                alignment.append((gt_measure_id, pred_measure_id))
-                i -= 1
-                j -= 1
-            elif dp[i][j] == dp[i-1][j] + gap_penalty:
-                alignment.append((gt_measure_id, None))
-                i -= 1
-            else:
-                alignment.append((None, pred_measure_id))
-                j -= 1
-        elif i > 0:
-            alignment.append((gt_measure_ids[i-1], None))
-            i -= 1
-        else:
-            alignment.append((None, pred_measure_ids[j-1]))
-            j -= 1
-    alignment.reverse()
-    return alignment
+
+    def match_value(i: int, j: int) -> float:
+        similarity = measure_similarity_for_elements(
+            gt_measure_ids[i], pred_measure_ids[j], staff_id,
+            gt_by_measure, pred_by_measure
+        )
+        return similarity * match_score + (1 - similarity) * mismatch_penalty
+
+    return [
+        (gt_measure_ids[i] if i is not None else None, pred_measure_ids[j] if j is not None else None)
+        for i, j in align_by_match_function(match_value, n, m, gap_penalty, band)
+    ]
 
 def compare_element(gt_element: Dict, pred_element: Dict, element_type: str = None) -> Tuple[bool, Dict]:
     gt_value = gt_element.get('value')
@@ -232,7 +189,8 @@ def calculate_element_metrics_generic(
     pred_tree: Node,
     element_type: str,
     measure_mapping: Optional[Dict[Tuple[int, int], Optional[int]]] = None,
-    compare_func: Optional[Callable[[Dict, Dict], Tuple[bool, Dict]]] = None
+    compare_func: Optional[Callable[[Dict, Dict], Tuple[bool, Dict]]] = None,
+    measure_band: Optional[int] = None
 ) -> Dict:
     if compare_func is None:
         compare_func = compare_element
@@ -242,7 +200,8 @@ def calculate_element_metrics_generic(
     assign_element_positions_in_measures(gt_elements, element_type)
     assign_element_positions_in_measures(pred_elements, element_type)
     element_matches, measure_stats = match_elements_by_position(
-        gt_elements, pred_elements, element_type, use_alignment=True, measure_mapping=measure_mapping
+        gt_elements, pred_elements, element_type, use_alignment=True, measure_mapping=measure_mapping,
+        measure_band=measure_band
     )
     
     metrics = {
@@ -490,7 +449,7 @@ def match_elements_by_staff(gt_elements: List[Dict], pred_elements: List[Dict],
         'extra_measure_details': []
     }
 
-def match_elements_by_position(gt_elements: List[Dict], pred_elements: List[Dict], element_type: str = None, use_alignment: bool = True, measure_mapping: Dict[Tuple[int, int], Optional[int]] = None) -> Tuple[List[Tuple[Optional[Dict], Optional[Dict]]], Dict]:
+def match_elements_by_position(gt_elements: List[Dict], pred_elements: List[Dict], element_type: str = None, use_alignment: bool = True, measure_mapping: Dict[Tuple[int, int], Optional[int]] = None, measure_band: Optional[int] = None) -> Tuple[List[Tuple[Optional[Dict], Optional[Dict]]], Dict]:
     if element_type == "Lyrics" or element_type == "Instrument":
         use_alignment = False
     if not use_alignment:
@@ -649,7 +608,8 @@ def match_elements_by_position(gt_elements: List[Dict], pred_elements: List[Dict
                 gt_measure_ids,
                 pred_measure_ids,
                 gt_elements_by_measure,
-                pred_elements_by_measure
+                pred_elements_by_measure,
+                band=measure_band
             )
         for gt_measure_id, pred_measure_id in measure_alignment:
             if gt_measure_id is not None and pred_measure_id is not None:
@@ -1,5 +1,6 @@
 from typing import Dict, Optional, Tuple
 from core.score_tree import Node
+from metrics.chord_metrics import MeasureAlignmentContext
 from metrics.musical_structure_metrics import (
     calculate_rest_metrics,
     calculate_tuplet_metrics
@@ -23,15 +24,16 @@ from metrics.texts_metrics import (
 )
 from metrics.element_output import print_element_metrics
 
-def calculate_element_metrics(gt_tree: Node, pred_tree: Node, element_type: str, measure_mapping: Dict[Tuple[int, int], Optional[int]] = None) -> Dict:
+def calculate_element_metrics(gt_tree: Node, pred_tree: Node, element_type: str, measure_mapping: Dict[Tuple[int, int], Optional[int]] = None,
+                              context: Optional[MeasureAlignmentContext] = None, measure_band: Optional[int] = None) -> Dict:
     if element_type == "Text":
         return calculate_text_metrics_combined(gt_tree, pred_tree)
     elif element_type == "Lyrics":
-        return calculate_lyrics_metrics_combined(gt_tree, pred_tree, measure_mapping=measure_mapping)
+        return calculate_lyrics_metrics_combined(gt_tree, pred_tree, measure_mapping=measure_mapping, context=context)
     elif element_type == "Rest":
-        return calculate_rest_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping)
+        return calculate_rest_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping, measure_band=measure_band)
     elif element_type == "Tuplet":
-        return calculate_tuplet_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping)
+        return calculate_tuplet_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping, measure_band=measure_band)
     elif element_type == "Clef":
         return calculate_clef_metrics(gt_tree, pred_tree)
     elif element_type == "KeySig":
@@ -41,15 +43,15 @@ def calculate_element_metrics(gt_tree: Node, pred_tree: Node, element_type: str,
     elif element_type == "Tempo":
         return calculate_tempo_metrics(gt_tree, pred_tree)
     elif element_type == "Instrument":
-        return calculate_instrument_metrics(gt_tree, pred_tree)
+        return calculate_instrument_metrics(gt_tree, pred_tree, measure_band=measure_band)
     elif element_type == "Staff":
-        return calculate_staff_metrics(gt_tree, pred_tree)
+        return calculate_staff_metrics(gt_tree, pred_tree, measure_band=measure_band)
     elif element_type == "Dynamic":
-        return calculate_dynamic_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping)
+        return calculate_dynamic_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping, measure_band=measure_band)
     elif element_type == "Spanner":
-        return calculate_spanner_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping)
+        return calculate_spanner_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping, measure_band=measure_band)
     elif element_type == "Fermata":
-        return calculate_fermata_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping)
+        return calculate_fermata_metrics(gt_tree, pred_tree, measure_mapping=measure_mapping, measure_band=measure_band)
     else:
         raise ValueError(f"Unsupported element type: {element_type}")
 
@@ -0,0 +1,121 @@
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from core.score_tree import PARSER_VERSION, Node
+from core.tree_cache import decode_tree, encode_tree
+from metrics.chord_metrics import extract_all_measures_from_tree, extract_chords_with_attributes
+from metrics.element_common import collect_elements, INDEXED_ELEMENT_TYPES
+from metrics.sequence_metrics import TokenSequence, encode_score_tokens, encode_token_strings
+from metrics.tree_edit_distance import count_nodes
+
+BUNDLE_MAGIC = b'OMRB'
+BUNDLE_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHHQ')
+
+class GroundTruthFeatures:
+    def __init__(self, tree: Node, node_count: int, chords: List[Dict],
+                 elements: Dict[str, List[Dict]], tokens: TokenSequence,
+                 measures: List[Tuple[int, int]]):
+        self.tree = tree
+        self.node_count = node_count
+        self.chords = chords
+        self.elements = elements
+        self.tokens = tokens
+        self.measures = measures
+
+def build_ground_truth_features(tree: Node) -> GroundTruthFeatures:
+    return GroundTruthFeatures(
+        tree=tree,
+        node_count=count_nodes(tree),
+        chords=extract_chords_with_attributes(tree),
+        elements=collect_elements(tree, INDEXED_ELEMENT_TYPES),
+        tokens=encode_score_tokens(tree),
+        measures=extract_all_measures_from_tree(tree),
+    )
+
+def encode_ground_truth_features(features: GroundTruthFeatures) -> Dict:
+    return {
+        'tree': encode_tree(features.tree),
+        'node_count': features.node_count,
+        'chords': features.chords,
+        'elements': features.elements,
+        'tokens': features.tokens.tokens(),
+        'measures': features.measures,
+    }
+
+def decode_ground_truth_features(encoded: Dict) -> GroundTruthFeatures:
+    return GroundTruthFeatures(
+        tree=decode_tree(encoded['tree']),
+        node_count=encoded['node_count'],
+        chords=encoded['chords'],
+        elements=encoded['elements'],
+        tokens=encode_token_strings(encoded['tokens']),
+        measures=encoded['measures'],
+    )
+
+def write_ground_truth_bundle(path: str, entries: Dict[str, Tuple[str, Dict]]) -> None:
+    index = {}
+    blobs = []
+    offset = 0
+    for filename in sorted(entries):
+        digest, features = entries[filename]
+        blob = pickle.dumps(features, protocol=pickle.HIGHEST_PROTOCOL)
+        index[filename] = (digest, offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+    index_blob = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+
+    bundle_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(bundle_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=bundle_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, PARSER_VERSION, len(index_blob)))
+            file.write(index_blob)
+            for blob in blobs:
+                file.write(blob)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class GroundTruthBundle:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, parser_version, index_size = _HEADER.unpack_from(self._mapped, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"Not a ground truth bundle: {path}")
+        if format_version != BUNDLE_FORMAT_VERSION or parser_version != PARSER_VERSION:
+            raise ValueError(f"Ground truth bundle {path} was built with format {format_version}, "
+                             f"parser {parser_version}; expected format {BUNDLE_FORMAT_VERSION}, "
+                             f"parser {PARSER_VERSION}. Please run precompute.py again.")
+        self._index = pickle.loads(self._mapped[_HEADER.size:_HEADER.size + index_size])
+        self._data_start = _HEADER.size + index_size
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._index
+
+    def digest(self, filename: str) -> Optional[str]:
+        entry = self._index.get(filename)
+        return entry[0] if entry is not None else None
+
+    def get(self, filename: str, digest: Optional[str] = None) -> Optional[GroundTruthFeatures]:
+        entry = self._index.get(filename)
+        if entry is None or (digest is not None and entry[0] != digest):
+            return None
+        _, offset, size = entry
+        start = self._data_start + offset
+        return decode_ground_truth_features(pickle.loads(self._mapped[start:start + size]))
+
+    def close(self) -> None:
+        self._mapped.close()
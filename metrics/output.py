@@ -53,6 +53,16 @@ def _print_tree_metrics(results: Dict) -> None:
         return
     ted = results['tree_edit_distance']
     print(f"  TED: {ted['distance']} | Normalized Error: {ted['normalized_error']:.4f} | Accuracy: {ted['accuracy']:.4f}")
+    if ted.get('approximate'):
+        print(f"    Approximate: exact TED exceeded the budget ({ted['fallback_reason']})")
+    if 'tree_edit_distance_decomposed' in results:
+        decomposed = results['tree_edit_distance_decomposed']
+        print(f"  Measure-decomposed TED: {decomposed['distance']} | Normalized Error: {decomposed['normalized_error']:.4f} | "
+              f"Accuracy: {decomposed['accuracy']:.4f}")
+        print(f"    Skeleton: {decomposed['skeleton_distance']} | "
+              f"Matched measures: {decomposed['matched_measures_distance']} ({decomposed['matched_measures_count']}) | "
+              f"Missing measures: {decomposed['missing_measures_distance']} ({decomposed['missing_measures_count']}) | "
+              f"Extra measures: {decomposed['extra_measures_distance']} ({decomposed['extra_measures_count']})")
 
 def _print_sequence_metrics(results: Dict) -> None:
     if 'cer' not in results or 'ser' not in results:
@@ -74,6 +84,10 @@ def _print_chord_summary(metrics: Dict) -> None:
                   for attr in CHORD_ATTRIBUTES if attr in metrics]
     if accuracies:
         print(f"Chord attributes accuracies: {' | '.join(accuracies)}")
+    fallback = metrics.get('alignment_fallback')
+    if fallback:
+        mode = f"measure band {fallback['measure_band']}" if fallback['use_alignment'] else "position matching"
+        print(f"  Alignment fell back to {mode} ({fallback['reason']})")
 
 def _print_element_summary(metrics: Dict, element_type: str) -> None:
     summary = metrics['summary']
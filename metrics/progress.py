@@ -0,0 +1,103 @@
+import contextvars
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+from core.instrumentation import record_phase
+
+LOGGER_NAME = 'omr_benchmark'
+PROGRESS_LOGGER_NAME = f'{LOGGER_NAME}.progress'
+LOG_LEVELS = {
+    'quiet': logging.CRITICAL + 1,
+    'error': logging.ERROR,
+    'warning': logging.WARNING,
+    'info': logging.INFO,
+    'debug': logging.DEBUG,
+}
+
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+_progress_logger = logging.getLogger(PROGRESS_LOGGER_NAME)
+_progress_logger.propagate = False
+_progress_logger.setLevel(logging.CRITICAL + 1)
+_current_pair = contextvars.ContextVar('current_pair', default=None)
+_configuration = None
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+class JsonProgressFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'time': round(record.created, 6),
+            'pair': getattr(record, 'pair', None),
+            'phase': getattr(record, 'phase', record.getMessage()),
+            'elapsed': getattr(record, 'elapsed', None),
+        }
+        event.update(getattr(record, 'details', {}))
+        return json.dumps(event, default=str)
+
+def configure_logging(level: str = 'info', progress_path: Optional[str] = None) -> None:
+    global _configuration
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Unsupported log level: {level}")
+    _configuration = (level, progress_path)
+    package_logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(package_logger.handlers):
+        if not isinstance(handler, logging.NullHandler):
+            package_logger.removeHandler(handler)
+            handler.close()
+    package_logger.setLevel(LOG_LEVELS[level])
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    package_logger.addHandler(console)
+
+    for handler in list(_progress_logger.handlers):
+        _progress_logger.removeHandler(handler)
+        handler.close()
+    if progress_path is None:
+        _progress_logger.setLevel(logging.CRITICAL + 1)
+        return
+    if progress_path == '-':
+        progress_handler = logging.StreamHandler(sys.stdout)
+    else:
+        progress_handler = logging.FileHandler(progress_path, mode='a', encoding='utf-8')
+    progress_handler.setFormatter(JsonProgressFormatter())
+    _progress_logger.addHandler(progress_handler)
+    _progress_logger.setLevel(logging.INFO)
+
+def worker_logging_arguments() -> Optional[Tuple[str, Optional[str]]]:
+    if _configuration is None:
+        return None
+    level, progress_path = _configuration
+    if LOG_LEVELS[level] < logging.WARNING:
+        level = 'warning'
+    return level, progress_path
+
+def report_progress(phase: str, elapsed: Optional[float] = None, **details) -> None:
+    if elapsed is not None:
+        record_phase(phase, elapsed)
+    if _progress_logger.isEnabledFor(logging.INFO):
+        _progress_logger.info(phase, extra={
+            'pair': _current_pair.get(),
+            'phase': phase,
+            'elapsed': round(elapsed, 6) if elapsed is not None else None,
+            'details': details,
+        })
+
+@contextmanager
+def pair_context(pair_id: Optional[str]) -> Iterator[None]:
+    token = _current_pair.set(pair_id)
+    try:
+        yield
+    finally:
+        _current_pair.reset(token)
+
+@contextmanager
+def phase(name: str, **details) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report_progress(name, time.perf_counter() - start, **details)
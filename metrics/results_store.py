@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+from typing import Dict, Optional
+from core.score_tree import PARSER_VERSION
+
+RESULTS_STORE_VERSION = 1
+
+def metric_config_key(**config) -> str:
+    config = dict(config, parser_version=PARSER_VERSION, results_store_version=RESULTS_STORE_VERSION)
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+class ResultsStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pair_results ("
+            "gt_digest TEXT NOT NULL, "
+            "pred_digest TEXT NOT NULL, "
+            "config_key TEXT NOT NULL, "
+            "filename TEXT NOT NULL, "
+            "results BLOB NOT NULL, "
+            "PRIMARY KEY (gt_digest, pred_digest, config_key))"
+        )
+        self._connection.commit()
+
+    def get(self, gt_digest: str, pred_digest: str, config_key: str) -> Optional[Dict]:
+        row = self._connection.execute(
+            "SELECT results FROM pair_results WHERE gt_digest = ? AND pred_digest = ? AND config_key = ?",
+            (gt_digest, pred_digest, config_key)
+        ).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def contains(self, gt_digest: str, pred_digest: str, config_key: str) -> bool:
+        return self._connection.execute(
+            "SELECT 1 FROM pair_results WHERE gt_digest = ? AND pred_digest = ? AND config_key = ?",
+            (gt_digest, pred_digest, config_key)
+        ).fetchone() is not None
+
+    def put(self, gt_digest: str, pred_digest: str, config_key: str, filename: str, results: Dict) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO pair_results (gt_digest, pred_digest, config_key, filename, results) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (gt_digest, pred_digest, config_key, filename,
+             pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM pair_results").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+class ResultsJournal:
+    def __init__(self, path: str, config_key: str, resume: bool = False):
+        self.path = path
+        self.config_key = config_key
+        self.completed = {}
+        needs_newline = False
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    needs_newline = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get('config_key') == config_key:
+                        self.completed[entry['filename']] = entry
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if needs_newline:
+            self._file.write('\n')
+
+    def get(self, filename: str, gt_digest: str, pred_digest: str) -> Optional[Dict]:
+        entry = self.completed.get(filename)
+        if entry is None or entry.get('gt_digest') != gt_digest or entry.get('pred_digest') != pred_digest:
+            return None
+        return entry['metrics']
+
+    def record(self, filename: str, gt_digest: str, pred_digest: str, flat_metrics: Dict) -> None:
+        self._file.write(json.dumps({'filename': filename, 'gt_digest': gt_digest, 'pred_digest': pred_digest,
+                                     'config_key': self.config_key, 'metrics': flat_metrics}) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
@@ -68,14 +68,16 @@ def calculate_tempo_metrics(gt_tree: Node, pred_tree: Node) -> Dict:
         include_measure_stats=True
     )
 
-def calculate_instrument_metrics(gt_tree: Node, pred_tree: Node) -> Dict:
+def calculate_instrument_metrics(gt_tree: Node, pred_tree: Node, measure_band: Optional[int] = None) -> Dict:
     return calculate_element_metrics_generic(
         gt_tree, pred_tree, "Instrument",
-        compare_func=lambda gt, pred: compare_value_element(gt, pred, 'value', "Instrument")
+        compare_func=lambda gt, pred: compare_value_element(gt, pred, 'value', "Instrument"),
+        measure_band=measure_band
     )
 
-def calculate_staff_metrics(gt_tree: Node, pred_tree: Node) -> Dict:
+def calculate_staff_metrics(gt_tree: Node, pred_tree: Node, measure_band: Optional[int] = None) -> Dict:
     return calculate_element_metrics_generic(
         gt_tree, pred_tree, "Staff",
-        compare_func=compare_staff
+        compare_func=compare_staff,
+        measure_band=measure_band
     )
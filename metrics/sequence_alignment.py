@@ -0,0 +1,126 @@
+from typing import Callable, List, Optional, Tuple
+from core.instrumentation import count
+
+BANDED_ALIGNMENT_MAX_LENGTH_RATIO = 0.5
+
+def align_by_match_values(match_values: List[List[float]], n: int, m: int,
+                          gap_penalty: float) -> List[Tuple[Optional[int], Optional[int]]]:
+    count('alignments')
+    count('alignment_dp_cells', n * m)
+    dp = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        dp[i][0] = dp[i-1][0] + gap_penalty
+    for j in range(1, m + 1):
+        dp[0][j] = dp[0][j-1] + gap_penalty
+    for i in range(1, n + 1):
+        previous_row = dp[i-1]
+        current_row = dp[i]
+        match_row = match_values[i-1]
+        for j in range(1, m + 1):
+            option_match = previous_row[j-1] + match_row[j-1]
+            option_gap_pred = previous_row[j] + gap_penalty
+            option_gap_gt = current_row[j-1] + gap_penalty
+            current_row[j] = max(option_match, option_gap_pred, option_gap_gt)
+    alignment = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            if dp[i][j] == dp[i-1][j-1] + match_values[i-1][j-1]:
+                alignment.append((i-1, j-1))
+                i -= 1
+                j -= 1
+            elif dp[i][j] == dp[i-1][j] + gap_penalty:
+                alignment.append((i-1, None))
+                i -= 1
+            else:
+                alignment.append((None, j-1))
+                j -= 1
+        elif i > 0:
+            alignment.append((i-1, None))
+            i -= 1
+        else:
+            alignment.append((None, j-1))
+            j -= 1
+    alignment.reverse()
+    return alignment
+
+def _align_in_band(match_value: Callable[[int, int], float], n: int, m: int,
+                   gap_penalty: float, lower: int, upper: int) -> Tuple[List[Tuple[Optional[int], Optional[int]]], bool]:
+    negative_infinity = float('-inf')
+    starts = [max(0, i + lower) for i in range(n + 1)]
+    ends = [min(m, i + upper) for i in range(n + 1)]
+    count('alignments')
+    count('alignment_dp_cells', sum(ends[i] - starts[i] + 1 for i in range(1, n + 1)))
+
+    def get(i: int, j: int) -> float:
+        if starts[i] <= j <= ends[i]:
+            return rows[i][j - starts[i]]
+        return negative_infinity
+
+    first_row = [0.0] * (ends[0] + 1)
+    for j in range(1, ends[0] + 1):
+        first_row[j] = first_row[j-1] + gap_penalty
+    rows = [first_row]
+    for i in range(1, n + 1):
+        start, end = starts[i], ends[i]
+        previous_row = rows[i-1]
+        previous_start, previous_end = starts[i-1], ends[i-1]
+        row = [negative_infinity] * (end - start + 1)
+        for j in range(start, end + 1):
+            if j == 0:
+                row[0] = previous_row[0 - previous_start] + gap_penalty
+                continue
+            best = negative_infinity
+            if previous_start <= j - 1 <= previous_end:
+                best = previous_row[j - 1 - previous_start] + match_value(i-1, j-1)
+            if previous_start <= j <= previous_end:
+                best = max(best, previous_row[j - previous_start] + gap_penalty)
+            if j - 1 >= start:
+                best = max(best, row[j - 1 - start] + gap_penalty)
+            row[j - start] = best
+        rows.append(row)
+
+    alignment = []
+    touches_edge = False
+    i, j = n, m
+    while i > 0 or j > 0:
+        diagonal = j - i
+        if (diagonal == upper and i > 0) or (diagonal == lower and j > 0):
+            touches_edge = True
+        if i > 0 and j > 0:
+            current = get(i, j)
+            if current == get(i-1, j-1) + match_value(i-1, j-1):
+                alignment.append((i-1, j-1))
+                i -= 1
+                j -= 1
+            elif current == get(i-1, j) + gap_penalty:
+                alignment.append((i-1, None))
+                i -= 1
+            else:
+                alignment.append((None, j-1))
+                j -= 1
+        elif i > 0:
+            alignment.append((i-1, None))
+            i -= 1
+        else:
+            alignment.append((None, j-1))
+            j -= 1
+    alignment.reverse()
+    return alignment, touches_edge
+
+def align_by_match_function(match_value: Callable[[int, int], float], n: int, m: int,
+                            gap_penalty: float,
+                            band: Optional[int] = None) -> List[Tuple[Optional[int], Optional[int]]]:
+    if band is not None and abs(n - m) <= BANDED_ALIGNMENT_MAX_LENGTH_RATIO * max(n, m):
+        band = max(band, 1)
+        while True:
+            lower = min(0, m - n) - band
+            upper = max(0, m - n) + band
+            if lower <= -n and upper >= m:
+                break
+            alignment, touches_edge = _align_in_band(match_value, n, m, gap_penalty, lower, upper)
+            if not touches_edge:
+                return alignment
+            band *= 2
+    match_values = [[match_value(i, j) for j in range(m)] for i in range(n)]
+    return align_by_match_values(match_values, n, m, gap_penalty)
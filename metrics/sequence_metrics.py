@@ -1,5 +1,7 @@
-from typing import List, Dict, Tuple
+from array import array
+from typing import List, Dict, Optional, Tuple
 from core.score_tree import Node
+from core.instrumentation import count, timed
 from Levenshtein import distance as levenshtein_distance
 
 LABEL_SHORT_MAP = {
@@ -43,53 +45,111 @@ ARTICULATION_MAP = {'articStaccatoAbove': 'staccato', 'articStaccatoBelow': 'sta
 'articMarcatoAbove': 'marcato', 'articMarcatoBelow': 'marcato', 'articTenutoAbove': 'tenuto', 'articTenutoBelow': 'tenuto',
 'stringsUpBow': 'upbow', 'stringsDownBow': 'downbow', 'otherArticulations': 'other'}
 
+def node_token(label: str, value: Optional[str]) -> str:
+    token = LABEL_SHORT_MAP[label]
+    if value:
+        if label == 'Duration':
+            token += f"_{DURATION_MAP[str(value) if str(value) in DURATION_MAP else 'OtherDuration']}"
+        elif label == 'Note':
+            token += f"_{PITCH_MAP[str(value) if str(value) in PITCH_MAP else 'OtherPitch']}"
+        elif label == 'Accidental':
+            token += f"_{ACCIDENTAL_MAP[str(value) if str(value) in ACCIDENTAL_MAP else 'OtherAccidental']}"
+        elif label == 'Articulation':
+            token += f"_{ARTICULATION_MAP[str(value) if str(value) in ARTICULATION_MAP else 'otherArticulations']}"
+        else:
+            token += f"_{str(value)}"
+    return token
+
+class TokenVocabulary:
+    def __init__(self):
+        self.token_ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self._node_token_ids: Dict[Tuple[str, Optional[str]], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def token_id(self, token: str) -> int:
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.token_ids[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def node_token_id(self, label: str, value: Optional[str]) -> int:
+        key = (label, value)
+        token_id = self._node_token_ids.get(key)
+        if token_id is None:
+            token_id = self.token_id(node_token(label, value)) if label in LABEL_SHORT_MAP else -1
+            self._node_token_ids[key] = token_id
+        return token_id
+
+    def copy(self) -> 'TokenVocabulary':
+        vocabulary = TokenVocabulary()
+        vocabulary.token_ids = dict(self.token_ids)
+        vocabulary.tokens = list(self.tokens)
+        vocabulary._node_token_ids = dict(self._node_token_ids)
+        return vocabulary
+
+class TokenSequence:
+    def __init__(self, ids: array, vocabulary: TokenVocabulary):
+        self.ids = ids
+        self.vocabulary = vocabulary
+        self._tokens = None
+        self._text = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def tokens(self) -> List[str]:
+        if self._tokens is None:
+            vocabulary_tokens = self.vocabulary.tokens
+            self._tokens = [vocabulary_tokens[token_id] for token_id in self.ids]
+        return self._tokens
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = " ".join(self.tokens())
+        return self._text
+
+def encode_score_tokens(node: Node, vocabulary: Optional[TokenVocabulary] = None) -> TokenSequence:
+    vocabulary = vocabulary if vocabulary is not None else TokenVocabulary()
+    node_token_ids = vocabulary._node_token_ids
+    ids = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        token_id = node_token_ids.get((n.label, n.value))
+        if token_id is None:
+            token_id = vocabulary.node_token_id(n.label, n.value)
+        if token_id >= 0:
+            ids.append(token_id)
+        if n.children:
+            stack.extend(reversed(n.children))
+    return TokenSequence(array('i', ids), vocabulary)
+
+def encode_token_strings(tokens: List[str], vocabulary: Optional[TokenVocabulary] = None) -> TokenSequence:
+    vocabulary = vocabulary if vocabulary is not None else TokenVocabulary()
+    return TokenSequence(array('i', [vocabulary.token_id(token) for token in tokens]), vocabulary)
+
 def serialize_score_to_tokens(node: Node) -> List[str]:
-    tokens = []
-    
-    def traverse(n: Node, depth=0):
-        if n.label in LABEL_SHORT_MAP:
-            short_label = LABEL_SHORT_MAP[n.label]
-            token = short_label
-            if n.value:
-                if n.label == 'Duration':
-                    token += f"_{DURATION_MAP[str(n.value) if str(n.value) in DURATION_MAP else 'OtherDuration']}"
-                elif n.label == 'Note':
-                    token += f"_{PITCH_MAP[str(n.value) if str(n.value) in PITCH_MAP else 'OtherPitch']}"
-                elif n.label == 'Accidental':
-                    token += f"_{ACCIDENTAL_MAP[str(n.value) if str(n.value) in ACCIDENTAL_MAP else 'OtherAccidental']}"
-                elif n.label == 'Articulation':
-                    token += f"_{ARTICULATION_MAP[str(n.value) if str(n.value) in ARTICULATION_MAP else 'otherArticulations']}"
-                else:
-                    token += f"_{str(n.value)}"
-            tokens.append(token)
-        for child in n.children:
-            traverse(child, depth + 1)
-
-    traverse(node)
-    return tokens
-
-def list_edit_distance(seq1, seq2):
-    n, m = len(seq1), len(seq2)
-    if n > m:
-        seq1, seq2 = seq2, seq1
-        n, m = m, n
-    previous_row = list(range(n + 1))
-    for i in range(1, m + 1):
-        current_row = [i] + [0]*n
-        for j in range(1, n + 1):
-            insertions = previous_row[j] + 1
-            deletions = current_row[j - 1] + 1
-            substitutions = previous_row[j - 1] + (seq1[j - 1] != seq2[i - 1])
-            current_row[j] = min(insertions, deletions, substitutions)
-        previous_row = current_row
-    return previous_row[n]
-
-def _calculate_sequence_metrics(gt_tree: Node, pred_tree: Node) -> Tuple[Dict, Dict]:
-    gt_symbols = serialize_score_to_tokens(gt_tree)
-    pred_symbols = serialize_score_to_tokens(pred_tree)
-    
-    gt_string = " ".join(gt_symbols)
-    pred_string = " ".join(pred_symbols)
+    return encode_score_tokens(node).tokens()
+
+def _calculate_sequence_metrics(gt_tree: Node, pred_tree: Node,
+                                gt_tokens: Optional[TokenSequence] = None) -> Tuple[Dict, Dict]:
+    with timed('token_encoding'):
+        if gt_tokens is not None:
+            gt_symbols = gt_tokens
+            vocabulary = gt_tokens.vocabulary.copy()
+        else:
+            vocabulary = TokenVocabulary()
+            gt_symbols = encode_score_tokens(gt_tree, vocabulary)
+        pred_symbols = encode_score_tokens(pred_tree, vocabulary)
+        gt_string = gt_symbols.text()
+        pred_string = pred_symbols.text()
+    count('sequence_tokens', len(gt_symbols) + len(pred_symbols))
+    count('sequence_characters', len(gt_string) + len(pred_string))
     total_chars = max(len(gt_string), len(pred_string), 1)
     char_errors = levenshtein_distance(gt_string, pred_string)
     cer = char_errors / total_chars
@@ -102,7 +162,7 @@ def _calculate_sequence_metrics(gt_tree: Node, pred_tree: Node) -> Tuple[Dict, D
     }
 
     total_symbols = max(len(gt_symbols), len(pred_symbols), 1)
-    symbol_errors = list_edit_distance(gt_symbols, pred_symbols)
+    symbol_errors = levenshtein_distance(gt_symbols.ids, pred_symbols.ids)
     ser = symbol_errors / len(gt_symbols) if len(gt_symbols) > 0 else 0.0
     matches = len(gt_symbols) - symbol_errors
 
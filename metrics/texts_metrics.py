@@ -1,9 +1,11 @@
 from collections import defaultdict
 from typing import Dict, Tuple, Optional, List, Callable
 from core.score_tree import Node
+from core.instrumentation import timed
 from Levenshtein import distance as levenshtein_distance
 from metrics.element_common import extract_elements_with_attributes, match_elements_by_staff
-from metrics.chord_metrics import align_chords_in_measure, extract_chords_with_attributes
+from functools import partial
+from metrics.chord_metrics import align_chords_in_measure, extract_chords_with_attributes, MeasureAlignmentContext
 
 def calculate_combined_metrics(
     gt_tree: Node,
@@ -18,7 +20,8 @@ def calculate_combined_metrics(
     pred_elements = extract_elements_with_attributes(pred_tree, element_type)
     
     if align_func:
-        aligned_pairs = align_func(gt_elements, pred_elements, measure_mapping, gt_tree, pred_tree)
+        with timed(f'{element_type.lower()}_alignment'):
+            aligned_pairs = align_func(gt_elements, pred_elements, measure_mapping, gt_tree, pred_tree)
     else:
         def get_sort_key(elem):
             return (
@@ -176,9 +179,13 @@ def calculate_combined_metrics(
 def _align_lyrics_by_chords(gt_elements: List[Dict], pred_elements: List[Dict], 
                             measure_mapping: Optional[Dict[Tuple[int, int], Optional[int]]] = None,
                             gt_tree: Optional[Node] = None,
-                            pred_tree: Optional[Node] = None) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
-    gt_chords = extract_chords_with_attributes(gt_tree) if gt_tree else []
-    pred_chords = extract_chords_with_attributes(pred_tree) if pred_tree else []
+                            pred_tree: Optional[Node] = None,
+                            context: Optional[MeasureAlignmentContext] = None) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+    if context is not None:
+        gt_chords, pred_chords = context.chords()
+    else:
+        gt_chords = extract_chords_with_attributes(gt_tree) if gt_tree else []
+        pred_chords = extract_chords_with_attributes(pred_tree) if pred_tree else []
     gt_lyrics_by_measure = defaultdict(list)
     pred_lyrics_by_measure = defaultdict(list)
     gt_chords_by_measure = defaultdict(list)
@@ -230,7 +237,11 @@ def _align_lyrics_by_chords(gt_elements: List[Dict], pred_elements: List[Dict],
                 if pred_measure_id is not None:
                     gt_measure_chords = gt_chords_by_measure.get((staff_id, gt_measure_id), [])
                     pred_measure_chords = pred_chords_by_measure.get((staff_id, pred_measure_id), [])
-                    chord_alignment = align_chords_in_measure(gt_measure_chords, pred_measure_chords)
+                    if context is not None:
+                        chord_alignment = context.align_chords(staff_id, gt_measure_id, pred_measure_id,
+                                                               gt_measure_chords, pred_measure_chords)
+                    else:
+                        chord_alignment = align_chords_in_measure(gt_measure_chords, pred_measure_chords)
                     for gt_chord, pred_chord in chord_alignment:
                         gt_chord_id = gt_chord.get('chord_id') if gt_chord else None
                         pred_chord_id = pred_chord.get('chord_id') if pred_chord else None
@@ -276,10 +287,11 @@ def _align_lyrics_by_chords(gt_elements: List[Dict], pred_elements: List[Dict],
 def calculate_text_metrics_combined(gt_tree: Node, pred_tree: Node) -> Dict:
     return calculate_combined_metrics(gt_tree, pred_tree, "Text", include_individual=True, include_measure_stats=False)
 
-def calculate_lyrics_metrics_combined(gt_tree: Node, pred_tree: Node, measure_mapping: Optional[Dict[Tuple[int, int], Optional[int]]] = None) -> Dict:
+def calculate_lyrics_metrics_combined(gt_tree: Node, pred_tree: Node, measure_mapping: Optional[Dict[Tuple[int, int], Optional[int]]] = None,
+                                      context: Optional[MeasureAlignmentContext] = None) -> Dict:
     return calculate_combined_metrics(
         gt_tree, pred_tree, "Lyrics",
-        align_func=_align_lyrics_by_chords,
+        align_func=partial(_align_lyrics_by_chords, context=context),
         measure_mapping=measure_mapping,
         include_individual=True,
         include_measure_stats=False
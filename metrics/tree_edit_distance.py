@@ -1,7 +1,16 @@
 from apted import APTED, Config
-from collections import defaultdict
-from typing import Tuple, List
+from Levenshtein import distance as levenshtein_distance
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Tuple, List, Dict, Optional
 from core.score_tree import Node
+from metrics.chord_metrics import get_measure_alignment_from_chords
+from metrics.tree_edit_distance_numpy import postorder_tree, tree_edit_distance_numpy, zhang_shasha_distance
+from metrics.progress import get_logger
+
+TED_ENGINES = ('apted', 'numpy')
+
+logger = get_logger('tree_edit_distance')
 
 class AptNodeConfig(Config):
     def rename(self, node1, node2):
@@ -19,76 +28,96 @@ def convert_to_apted_node(node: Node) -> AptNode:
     )
 
 def count_nodes(node) -> int:
-    return 1 + sum(count_nodes(ch) for ch in node.children)
+    total = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        total += 1
+        stack.extend(current.children)
+    return total
 
-def approximate_ted_by_levels(tree1: AptNode, tree2: AptNode) -> int:
-    def get_nodes_by_level(node: AptNode, level=0, levels_dict=None):
-        if levels_dict is None:
-            levels_dict = defaultdict(list)
-        levels_dict[level].append(node)
-        for child in node.children:
-            get_nodes_by_level(child, level + 1, levels_dict)
-        return levels_dict
-    
-    def sequence_edit_distance_with_operations(seq1: List, seq2: List):
-        m, n = len(seq1), len(seq2)
-        dp = [[0] * (n + 1) for _ in range(m + 1)]
-        for i in range(m + 1):
-            dp[i][0] = i
-        for j in range(n + 1):
-            dp[0][j] = j
-        for i in range(1, m + 1):
-            for j in range(1, n + 1):
-                if seq1[i-1] == seq2[j-1]:
-                    dp[i][j] = dp[i-1][j-1]
-                else:
-                    dp[i][j] = 1 + min(
-                        dp[i-1][j],
-                        dp[i][j-1],
-                        dp[i-1][j-1]
-                    )
-        operations = []
-        i, j = m, n
-        while i > 0 or j > 0:
-            if i > 0 and j > 0 and seq1[i-1] == seq2[j-1]:
-                operations.append(('match', i-1, j-1, seq1[i-1]))
-                i -= 1
-                j -= 1
-            elif i > 0 and j > 0 and dp[i][j] == dp[i-1][j-1] + 1:
-                operations.append(('substitute', i-1, j-1, seq1[i-1], seq2[j-1]))
-                i -= 1
-                j -= 1
-            elif i > 0 and dp[i][j] == dp[i-1][j] + 1:
-                operations.append(('delete', i-1, seq1[i-1]))
-                i -= 1
+def labels_by_level(tree: Node) -> List[List[int]]:
+    levels = []
+    current = [tree]
+    while current:
+        levels.append([node.int_label for node in current])
+        current = [child for node in current for child in node.children]
+    return levels
+
+def sequence_edit_distance_with_operations(seq1: List, seq2: List):
+    m, n = len(seq1), len(seq2)
+    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    for i in range(m + 1):
+        dp[i][0] = i
+    for j in range(n + 1):
+        dp[0][j] = j
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if seq1[i-1] == seq2[j-1]:
+                dp[i][j] = dp[i-1][j-1]
             else:
-                operations.append(('insert', j-1, seq2[j-1]))
-                j -= 1
-        operations.reverse()
-        return dp[m][n], operations
-    
-    levels1 = get_nodes_by_level(tree1)
-    levels2 = get_nodes_by_level(tree2)
-    all_levels = set(levels1.keys()) | set(levels2.keys())
+                dp[i][j] = 1 + min(
+                    dp[i-1][j],
+                    dp[i][j-1],
+                    dp[i-1][j-1]
+                )
+    operations = []
+    i, j = m, n
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and seq1[i-1] == seq2[j-1]:
+            operations.append(('match', i-1, j-1, seq1[i-1]))
+            i -= 1
+            j -= 1
+        elif i > 0 and j > 0 and dp[i][j] == dp[i-1][j-1] + 1:
+            operations.append(('substitute', i-1, j-1, seq1[i-1], seq2[j-1]))
+            i -= 1
+            j -= 1
+        elif i > 0 and dp[i][j] == dp[i-1][j] + 1:
+            operations.append(('delete', i-1, seq1[i-1]))
+            i -= 1
+        else:
+            operations.append(('insert', j-1, seq2[j-1]))
+            j -= 1
+    operations.reverse()
+    return dp[m][n], operations
+
+def approximate_ted_by_levels(tree1: Node, tree2: Node, with_operations: bool = False):
+    levels1 = labels_by_level(tree1)
+    levels2 = labels_by_level(tree2)
     total_dist = 0
-    for level in sorted(all_levels):
-        seq1 = [node.name for node in levels1.get(level, [])]
-        seq2 = [node.name for node in levels2.get(level, [])]
-        level_dist, operations = sequence_edit_distance_with_operations(seq1, seq2)
+    operations_by_level = {}
+    for level in range(max(len(levels1), len(levels2))):
+        seq1 = levels1[level] if level < len(levels1) else []
+        seq2 = levels2[level] if level < len(levels2) else []
+        if with_operations:
+            level_dist, operations_by_level[level] = sequence_edit_distance_with_operations(seq1, seq2)
+        else:
+            level_dist = levenshtein_distance(seq1, seq2)
         total_dist += level_dist
+    if with_operations:
+        return total_dist, operations_by_level
     return total_dist
 
 def tree_edit_distance(ground_truth_tree: Node, predicted_tree: Node,
-                      approximate=False) -> Tuple[int, float, float]:
-    t1 = convert_to_apted_node(ground_truth_tree)
-    t2 = convert_to_apted_node(predicted_tree)
-
-    lenA = count_nodes(t1)
-    lenB = count_nodes(t2)
-    if approximate:
-        print(f"    Using approximate algorithm (sizes: {lenA}, {lenB})")
-        dist = approximate_ted_by_levels(t1, t2)
+                      approximate=False, engine='apted') -> Tuple[int, float, float]:
+    if engine not in TED_ENGINES:
+        raise ValueError(f"Unsupported TED engine: {engine}")
+    if engine == 'numpy' and not approximate:
+        postorder1 = postorder_tree(ground_truth_tree)
+        postorder2 = postorder_tree(predicted_tree)
+        lenA = postorder1.size
+        lenB = postorder2.size
+        dist = zhang_shasha_distance(postorder1, postorder2)
+    elif approximate:
+        lenA = count_nodes(ground_truth_tree)
+        lenB = count_nodes(predicted_tree)
+        logger.info(f"    Using approximate algorithm (sizes: {lenA}, {lenB})")
+        dist = approximate_ted_by_levels(ground_truth_tree, predicted_tree)
     else:
+        t1 = convert_to_apted_node(ground_truth_tree)
+        t2 = convert_to_apted_node(predicted_tree)
+        lenA = count_nodes(t1)
+        lenB = count_nodes(t2)
         apted = APTED(t1, t2, AptNodeConfig())
         dist = apted.compute_edit_distance()
     max_len = max(lenA, lenB)
@@ -117,18 +146,116 @@ def flatten_notes_in_tree(node: Node) -> Node:
         return new_node
     return create_flattened(node)
 
+def exact_tree_edit_distance(tree1: Node, tree2: Node, engine: str = 'apted') -> int:
+    if engine == 'numpy':
+        return tree_edit_distance_numpy(tree1, tree2)
+    return APTED(convert_to_apted_node(tree1), convert_to_apted_node(tree2), AptNodeConfig()).compute_edit_distance()
+
+def measure_skeleton(node: Node) -> Node:
+    skeleton = Node(node.label, node.id, [], node.value)
+    for child in node.children:
+        if child.label != "Measure":
+            skeleton.add_child(measure_skeleton(child))
+    return skeleton
+
+def collect_measures(root: Node) -> Dict[Tuple[int, int], Node]:
+    measures = {}
+    stack = [(root, None)]
+    while stack:
+        node, staff_id = stack.pop()
+        if node.label == "Staff":
+            staff_id = node.id
+        elif node.label == "Measure":
+            if staff_id is not None:
+                measures[(staff_id, node.id)] = node
+            continue
+        for child in node.children:
+            stack.append((child, staff_id))
+    return measures
+
+def measure_decomposed_ted(ground_truth_tree: Node, predicted_tree: Node,
+                           measure_mapping: Optional[Dict[Tuple[int, int], Optional[int]]] = None,
+                           engine: str = 'apted', jobs: int = 1) -> Dict:
+    if engine not in TED_ENGINES:
+        raise ValueError(f"Unsupported TED engine: {engine}")
+    if measure_mapping is None:
+        measure_mapping = get_measure_alignment_from_chords(ground_truth_tree, predicted_tree)
+    gt_measures = collect_measures(ground_truth_tree)
+    pred_measures = collect_measures(predicted_tree)
+
+    matched_pairs = []
+    missing_keys = []
+    matched_pred_keys = set()
+    for gt_key in sorted(gt_measures):
+        pred_measure_id = measure_mapping.get(gt_key)
+        pred_key = (gt_key[0], pred_measure_id)
+        if pred_measure_id is not None and pred_key in pred_measures and pred_key not in matched_pred_keys:
+            matched_pairs.append((gt_key, pred_key))
+            matched_pred_keys.add(pred_key)
+        else:
+            missing_keys.append(gt_key)
+    extra_keys = [pred_key for pred_key in sorted(pred_measures) if pred_key not in matched_pred_keys]
+
+    gt_subtrees = [gt_measures[gt_key] for gt_key, _ in matched_pairs]
+    pred_subtrees = [pred_measures[pred_key] for _, pred_key in matched_pairs]
+    if jobs > 1 and len(matched_pairs) > 1:
+        chunksize = max(1, len(matched_pairs) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            measure_distances = list(executor.map(
+                exact_tree_edit_distance, gt_subtrees, pred_subtrees, repeat(engine), chunksize=chunksize
+            ))
+    else:
+        measure_distances = [
+            exact_tree_edit_distance(gt_subtree, pred_subtree, engine)
+            for gt_subtree, pred_subtree in zip(gt_subtrees, pred_subtrees)
+        ]
+
+    skeleton_distance = exact_tree_edit_distance(
+        measure_skeleton(ground_truth_tree), measure_skeleton(predicted_tree), engine
+    )
+    matched_distance = sum(measure_distances)
+    missing_distance = sum(count_nodes(gt_measures[gt_key]) for gt_key in missing_keys)
+    extra_distance = sum(count_nodes(pred_measures[pred_key]) for pred_key in extra_keys)
+    dist = skeleton_distance + matched_distance + missing_distance + extra_distance
+
+    max_len = max(count_nodes(ground_truth_tree), count_nodes(predicted_tree))
+    error = dist / max_len if max_len > 0 else 0
+    return {
+        'distance': dist,
+        'normalized_error': error,
+        'accuracy': 1 - error,
+        'skeleton_distance': skeleton_distance,
+        'matched_measures_distance': matched_distance,
+        'missing_measures_distance': missing_distance,
+        'extra_measures_distance': extra_distance,
+        'matched_measures_count': len(matched_pairs),
+        'missing_measures_count': len(missing_keys),
+        'extra_measures_count': len(extra_keys),
+        'measure_distances': [
+            {
+                'staff_id': gt_key[0],
+                'gt_measure_id': gt_key[1],
+                'pred_measure_id': pred_key[1],
+                'distance': measure_distance
+            }
+            for (gt_key, pred_key), measure_distance in zip(matched_pairs, measure_distances)
+            if measure_distance > 0
+        ]
+    }
+
 def tree_edit_distance_normalized(ground_truth_tree: Node, predicted_tree: Node,
-                                  approximate=False) -> dict:
+                                  approximate=False, engine='apted') -> dict:
     gt_flat = flatten_notes_in_tree(ground_truth_tree)
     pred_flat = flatten_notes_in_tree(predicted_tree)
     ted, ted_error, ted_accuracy = tree_edit_distance(
         gt_flat, pred_flat,
-        approximate=approximate
+        approximate=approximate,
+        engine=engine
     )
     return {
         'tedn': ted,
         'normalized_error': ted_error,
         'accuracy': ted_accuracy,
-        'gt_node_count': count_nodes(convert_to_apted_node(gt_flat)),
-        'pred_node_count': count_nodes(convert_to_apted_node(pred_flat))
+        'gt_node_count': count_nodes(gt_flat),
+        'pred_node_count': count_nodes(pred_flat)
     }
@@ -0,0 +1,217 @@
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from core.score_tree import Node
+from core.instrumentation import count
+
+FOREST_BLOCK_SIZE = 1 << 23
+
+class PostorderTree:
+    def __init__(self, labels: np.ndarray, leftmost: np.ndarray):
+        self.labels = labels
+        self.leftmost = leftmost
+        self.size = len(labels)
+        last_with_leftmost = {}
+        for index, leftmost_index in enumerate(leftmost.tolist()):
+            last_with_leftmost[leftmost_index] = index
+        self.keyroots = sorted(last_with_leftmost.values())
+
+    def keyroot_work(self) -> int:
+        return sum(keyroot - int(self.leftmost[keyroot]) + 1 for keyroot in self.keyroots)
+
+    def keyroot_levels(self) -> Dict[int, int]:
+        keyroots = set(self.keyroots)
+        levels = {}
+        completed = []
+        for node, first in enumerate(self.leftmost.tolist()):
+            nested = -1
+            while completed and completed[-1][0] >= first:
+                nested = max(nested, completed.pop()[1])
+            if node in keyroots:
+                levels[node] = nested + 1
+                nested = levels[node]
+            completed.append((first, nested))
+        return levels
+
+def postorder_tree(root: Node) -> PostorderTree:
+    labels = []
+    leftmost = []
+    stack = [[root, 0, -1]]
+    while stack:
+        entry = stack[-1]
+        node, child_index = entry[0], entry[1]
+        if child_index < len(node.children):
+            entry[1] += 1
+            stack.append([node.children[child_index], 0, -1])
+            continue
+        stack.pop()
+        index = len(labels)
+        labels.append(node.int_label)
+        leftmost_index = entry[2] if entry[2] >= 0 else index
+        leftmost.append(leftmost_index)
+        if stack and stack[-1][2] < 0:
+            stack[-1][2] = leftmost_index
+    return PostorderTree(np.array(labels, dtype=np.int64), np.array(leftmost, dtype=np.int64))
+
+class _ForestSlice:
+    def __init__(self, layout: '_ForestLayout', block_start: int, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.offset = start - block_start
+        self.lookup_columns = layout.leftmost_columns[start:end] - block_start
+        self.nodes = layout.nodes[start:end]
+        self.starts = np.flatnonzero(layout.is_start[start:end])
+        self.base = layout.base[start:end]
+        path_positions = np.flatnonzero(layout.on_path[start:end])
+        self.path_positions = path_positions + self.offset
+        self.path_slice_positions = path_positions
+        self.path_nodes = self.nodes[path_positions]
+        self.path_labels = layout.labels[start + path_positions]
+
+class _ForestLayout:
+    def __init__(self, tree: PostorderTree, other_size: int):
+        leftmost = tree.leftmost.tolist()
+        levels = tree.keyroot_levels()
+        ordered = sorted(tree.keyroots, key=lambda keyroot: (levels[keyroot], keyroot))
+
+        nodes = []
+        columns = []
+        on_path = []
+        leftmost_columns = []
+        segment_ids = []
+        self.segment_starts = []
+        self.segment_levels = []
+        for segment_id, keyroot in enumerate(ordered):
+            start = len(nodes)
+            first = leftmost[keyroot]
+            self.segment_starts.append(start)
+            self.segment_levels.append(levels[keyroot])
+            nodes.append(0)
+            columns.append(0)
+            on_path.append(False)
+            leftmost_columns.append(start)
+            segment_ids.append(segment_id)
+            for node in range(first, keyroot + 1):
+                nodes.append(node)
+                columns.append(node - first + 1)
+                on_path.append(leftmost[node] == first)
+                leftmost_columns.append(start + leftmost[node] - first)
+                segment_ids.append(segment_id)
+        self.size = len(nodes)
+        self.segment_starts.append(self.size)
+        self.nodes = np.array(nodes, dtype=np.int64)
+        self.columns = np.array(columns, dtype=np.int64)
+        self.on_path = np.array(on_path, dtype=bool)
+        self.leftmost_columns = np.array(leftmost_columns, dtype=np.int64)
+        self.labels = tree.labels[self.nodes]
+        self.is_start = self.columns == 0
+        spread = tree.size + other_size + 3
+        segment_count = len(ordered)
+        self.dtype = np.int32 if (segment_count + 1) * spread < np.iinfo(np.int32).max // 2 else np.int64
+        self.columns = self.columns.astype(self.dtype)
+        self.base = self.columns + np.array(segment_ids, dtype=self.dtype) * self.dtype(spread)
+        self._plans = {}
+
+    def _slices(self, first_segment: int, last_segment: int) -> List[_ForestSlice]:
+        block_start = self.segment_starts[first_segment]
+        slices = []
+        slice_segment = first_segment
+        for segment_index in range(first_segment + 1, last_segment + 1):
+            if (segment_index == last_segment
+                    or self.segment_levels[segment_index] != self.segment_levels[slice_segment]):
+                slices.append(_ForestSlice(self, block_start, self.segment_starts[slice_segment],
+                                           self.segment_starts[segment_index]))
+                slice_segment = segment_index
+        return slices
+
+    def plan(self, rows: int) -> List[Tuple[int, int, _ForestSlice, List[_ForestSlice]]]:
+        width = max(FOREST_BLOCK_SIZE // max(rows, 1), 1)
+        segment_count = len(self.segment_starts) - 1
+        if segment_count and self.size <= width:
+            width = self.size
+        if width in self._plans:
+            return self._plans[width]
+        plan = []
+        first_segment = 0
+        for segment_index in range(1, segment_count + 1):
+            if (self.segment_starts[segment_index] - self.segment_starts[first_segment] > width
+                    and segment_index - 1 > first_segment):
+                plan.append(self._block(first_segment, segment_index - 1))
+                first_segment = segment_index - 1
+        plan.append(self._block(first_segment, segment_count))
+        self._plans[width] = plan
+        return plan
+
+    def _block(self, first_segment: int, last_segment: int) -> Tuple[int, int, _ForestSlice, List[_ForestSlice]]:
+        block_start = self.segment_starts[first_segment]
+        block_end = self.segment_starts[last_segment]
+        return (block_start, block_end, _ForestSlice(self, block_start, block_start, block_end),
+                self._slices(first_segment, last_segment))
+
+def _forest_row(previous: np.ndarray, lookup_row: np.ndarray, node_distances: np.ndarray,
+                row: int, node_label: int, forest_slice: _ForestSlice, on_path: bool) -> np.ndarray:
+    offset = forest_slice.offset
+    candidate = previous[offset:offset + forest_slice.end - forest_slice.start] + 1
+    subtree = lookup_row[forest_slice.lookup_columns]
+    subtree += node_distances[forest_slice.nodes]
+    if on_path:
+        subtree[forest_slice.path_slice_positions] = (previous[forest_slice.path_positions - 1]
+                                                      + (forest_slice.path_labels != node_label))
+    np.minimum(candidate, subtree, out=candidate)
+    candidate[forest_slice.starts] = row
+    candidate -= forest_slice.base
+    np.minimum.accumulate(candidate, out=candidate)
+    candidate += forest_slice.base
+    return candidate
+
+def _single_node_distances(tree: PostorderTree) -> Callable[[int], np.ndarray]:
+    sizes = np.arange(tree.size, dtype=np.int64) - tree.leftmost + 1
+    by_label = {}
+
+    def distances(label: int) -> np.ndarray:
+        result = by_label.get(label)
+        if result is None:
+            counts = np.concatenate(([0], np.cumsum(tree.labels == label)))
+            contains = counts[1:] - counts[tree.leftmost] > 0
+            result = (sizes - contains).astype(np.int32)
+            by_label[label] = result
+        return result
+
+    return distances
+
+def zhang_shasha_distance(tree1: PostorderTree, tree2: PostorderTree) -> int:
+    work1, work2 = tree1.keyroot_work(), tree2.keyroot_work()
+    count('ted_dp_cells', work1 * work2)
+    if work1 > work2:
+        tree1, tree2 = tree2, tree1
+    layout = _ForestLayout(tree2, tree1.size)
+    single_node_distances = _single_node_distances(tree2)
+    tree_distances = np.zeros((tree1.size, tree2.size), dtype=np.int32)
+    leftmost1 = tree1.leftmost.tolist()
+    labels1 = tree1.labels.tolist()
+    for keyroot in tree1.keyroots:
+        first = leftmost1[keyroot]
+        if first == keyroot:
+            tree_distances[keyroot] = single_node_distances(labels1[keyroot])
+            continue
+        rows = keyroot - first + 2
+        for block_start, block_end, block, slices in layout.plan(rows):
+            forest = np.empty((rows, block_end - block_start), dtype=layout.dtype)
+            forest[0] = layout.columns[block_start:block_end]
+            for row in range(1, rows):
+                node = first + row - 1
+                lookup_row = forest[leftmost1[node] - first]
+                node_distances = tree_distances[node]
+                if leftmost1[node] == first:
+                    for forest_slice in slices:
+                        forest[row, forest_slice.offset:forest_slice.offset + forest_slice.end - forest_slice.start] = _forest_row(
+                            forest[row - 1], lookup_row, node_distances, row, labels1[node], forest_slice, True
+                        )
+                        node_distances[forest_slice.path_nodes] = forest[row, forest_slice.path_positions]
+                else:
+                    forest[row] = _forest_row(
+                        forest[row - 1], lookup_row, node_distances, row, labels1[node], block, False
+                    )
+    return int(tree_distances[tree1.size - 1, tree2.size - 1])
+
+def tree_edit_distance_numpy(tree1: Node, tree2: Node) -> int:
+    return zhang_shasha_distance(postorder_tree(tree1), postorder_tree(tree2))
@@ -0,0 +1,105 @@
+import sys
+import argparse
+import traceback
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from core.score_tree import create_simplified_tree
+from core.tree_cache import file_digest
+from metrics.ground_truth_bundle import (
+    build_ground_truth_features,
+    encode_ground_truth_features,
+    write_ground_truth_bundle
+)
+from metrics.progress import LOG_LEVELS, configure_logging, get_logger
+from calculate_average_metrics import get_filenames_from_dataset
+
+DEFAULT_BUNDLE_PATH = "./data/omr_benchmark/ground_truth.bundle"
+
+logger = get_logger('precompute')
+
+def precompute_file(true_path: str, streaming_parser: bool = False) -> Tuple[Optional[Tuple[str, Dict]], Optional[str]]:
+    try:
+        tree = create_simplified_tree(true_path, streaming=streaming_parser)
+        return (file_digest(true_path), encode_ground_truth_features(build_ground_truth_features(tree))), None
+    except Exception as e:
+        return None, str(e)
+
+def precompute_ground_truth(true_dir: str, output_path: str = DEFAULT_BUNDLE_PATH,
+                            jobs: int = 1, streaming_parser: bool = False) -> int:
+    logger.info("="*80)
+    logger.info("PRECOMPUTING GROUND TRUTH FEATURES")
+    logger.info("="*80)
+    true_path = Path(true_dir)
+    if not true_path.exists():
+        raise FileNotFoundError(f"Folder {true_dir} not found")
+
+    true_files = {f.name: f for f in true_path.iterdir() if f.is_file() and f.suffix.lower() == '.mscz'}
+    filenames = [filename for filename in get_filenames_from_dataset() if filename in true_files]
+    if not filenames:
+        logger.warning(f"Warning: no dataset files found in {true_dir}")
+        return 0
+    logger.info(f"Found {len(filenames)} ground truth files")
+
+    entries = {}
+    failed_files = []
+    if jobs > 1:
+        logger.info(f"Processing with {jobs} worker processes")
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(precompute_file, str(true_files[filename]), streaming_parser)
+                       for filename in filenames]
+            results = (future.result() for future in futures)
+            for i, (filename, (entry, error)) in enumerate(zip(filenames, results), 1):
+                logger.info(f"[{i}/{len(filenames)}] {filename}")
+                if error is not None:
+                    logger.error(f"Error processing: {error}")
+                    failed_files.append((filename, error))
+                    continue
+                entries[filename] = entry
+    else:
+        for i, filename in enumerate(filenames, 1):
+            logger.info(f"[{i}/{len(filenames)}] {filename}")
+            entry, error = precompute_file(str(true_files[filename]), streaming_parser)
+            if error is not None:
+                logger.error(f"Error processing: {error}")
+                failed_files.append((filename, error))
+                continue
+            entries[filename] = entry
+
+    write_ground_truth_bundle(output_path, entries)
+    logger.info(f"\nSaved {len(entries)} entries to {output_path}")
+    if failed_files:
+        logger.info(f"Failed to process {len(failed_files)} files:")
+        for filename, error in failed_files:
+            logger.info(f"  - {filename}: {error}")
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Precompute ground truth trees, chords, elements, tokens and measures into a bundle '
+                    'for calculate_average_metrics.py --ground-truth-bundle',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('true_dir', help='Path to folder with ground truth files')
+    parser.add_argument('-o', '--output', dest='output_path', default=DEFAULT_BUNDLE_PATH,
+                       help=f'Path of the bundle file (default: {DEFAULT_BUNDLE_PATH})')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of worker processes (default: 1)')
+    parser.add_argument('--streaming-parser', action='store_true',
+                       help='Build score trees with the single-pass streaming parser')
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='info',
+                       help='Verbosity of progress messages: quiet, error, warning, info (default), debug')
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    try:
+        if not precompute_ground_truth(args.true_dir, args.output_path, jobs=args.jobs,
+                                       streaming_parser=args.streaming_parser):
+            sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\nInterrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\nError: {e}")
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from core.score_tree import create_simplified_tree
+from core.tree_cache import file_digest
+from calculate_metrics import calculate_all_metrics
+from metrics.tree_edit_distance import TED_ENGINES
+from metrics.ground_truth_bundle import GroundTruthFeatures, build_ground_truth_features
+from metrics.progress import LOG_LEVELS, configure_logging, get_logger, pair_context, worker_logging_arguments
+from calculate_average_metrics import close_ground_truth_bundles, open_ground_truth_bundle
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 128
+DEFAULT_MAX_REQUEST_MB = 64
+METRIC_GROUPS = ['all', 'tree', 'sequence', 'chord', 'musical_structure',
+                 'score_structure', 'performance_instructions', 'texts', 'other_elements']
+
+logger = get_logger('serve')
+
+class GroundTruthCache:
+    def __init__(self, true_dir: str, max_entries: int = DEFAULT_CACHE_SIZE,
+                 streaming_parser: bool = False, ground_truth_bundle: Optional[str] = None):
+        self.true_dir = Path(true_dir)
+        self.max_entries = max_entries
+        self.streaming_parser = streaming_parser
+        self.ground_truth_bundle = ground_truth_bundle
+        self._entries = OrderedDict()
+
+    def resolve(self, gt_id: str) -> Path:
+        if not gt_id or Path(gt_id).name != gt_id or gt_id in ('.', '..'):
+            raise ValueError(f"Invalid ground truth id: {gt_id!r}")
+        path = self.true_dir / gt_id
+        if not path.is_file():
+            raise FileNotFoundError(f"Ground truth {gt_id} not found in {self.true_dir}")
+        return path
+
+    def get(self, gt_id: str) -> Tuple[Path, GroundTruthFeatures, bool]:
+        path = self.resolve(gt_id)
+        stat = path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(gt_id)
+        if entry is not None and entry[0] == stamp:
+            self._entries.move_to_end(gt_id)
+            return path, entry[1], True
+
+        features = None
+        if self.ground_truth_bundle is not None:
+            features = open_ground_truth_bundle(self.ground_truth_bundle).get(gt_id, file_digest(str(path)))
+        if features is None:
+            features = build_ground_truth_features(create_simplified_tree(str(path), streaming=self.streaming_parser))
+        self._entries[gt_id] = (stamp, features)
+        self._entries.move_to_end(gt_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return path, features, False
+
+_cache = None
+_evaluation_options = {}
+
+def init_worker(logging_arguments: Optional[Tuple[str, Optional[str]]], true_dir: str, cache_size: int,
+                streaming_parser: bool, ground_truth_bundle: Optional[str], evaluation_options: Dict) -> None:
+    global _cache, _evaluation_options
+    if logging_arguments is not None:
+        configure_logging(*logging_arguments)
+    _cache = GroundTruthCache(true_dir, cache_size, streaming_parser=streaming_parser,
+                              ground_truth_bundle=ground_truth_bundle)
+    _evaluation_options = dict(evaluation_options, streaming_parser=streaming_parser)
+    Finalize(None, close_ground_truth_bundles, exitpriority=0)
+
+def evaluate_prediction(gt_id: str, predicted_bytes: bytes, metric_groups: List[str]) -> Tuple[Dict, bool]:
+    with pair_context(gt_id):
+        true_path, features, cached = _cache.get(gt_id)
+        fd, pred_path = tempfile.mkstemp(suffix='.mscz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(predicted_bytes)
+            results = calculate_all_metrics(
+                str(true_path),
+                pred_path,
+                metric_groups=metric_groups,
+                ground_truth_features=features,
+                **_evaluation_options
+            )
+        finally:
+            os.remove(pred_path)
+    return results, cached
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+class EvaluationRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'OMRBenchmark/1.0'
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, default=_json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if urlparse(self.path).path == '/health':
+            self._send_json(HTTPStatus.OK, {'status': 'ok', 'workers': self.server.jobs})
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != '/evaluate':
+            self._send_json(HTTPStatus.NOT_FOUND, {'error': f"Unknown path {url.path}"})
+            return
+        query = parse_qs(url.query)
+        gt_id = query.get('gt', [None])[0]
+        metric = query.get('metric', ['all'])[0]
+        if gt_id is None:
+            self._send_json(HTTPStatus.BAD_REQUEST, {'error': "Missing 'gt' query parameter"})
+            return
+        if metric not in METRIC_GROUPS:
+            self._send_json(HTTPStatus.BAD_REQUEST, {'error': f"Unsupported metric group: {metric}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self._send_json(HTTPStatus.LENGTH_REQUIRED, {'error': "Content-Length is required"})
+            return
+        if length > self.server.max_request_bytes:
+            self._send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            {'error': f"Request body larger than {self.server.max_request_bytes} bytes"})
+            return
+        predicted_bytes = self.rfile.read(length)
+
+        start = time.perf_counter()
+        shard = self.server.shard(gt_id)
+        executor = self.server.executors[shard]
+        try:
+            results, cached = executor.submit(evaluate_prediction, gt_id, predicted_bytes, [metric]).result()
+        except BrokenProcessPool as e:
+            logger.error(f"Worker {shard} stopped while evaluating {gt_id}: {e}; restarting it")
+            self.server.restart_worker(shard, executor)
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Worker stopped unexpectedly: {e}"})
+            return
+        except FileNotFoundError as e:
+            self._send_json(HTTPStatus.NOT_FOUND, {'error': str(e)})
+            return
+        except ValueError as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.error(f"Error evaluating {gt_id}: {e}")
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+            return
+        elapsed = time.perf_counter() - start
+        logger.info(f"{gt_id}: evaluated in {elapsed:.3f}s (ground truth {'cached' if cached else 'loaded'})")
+        self._send_json(HTTPStatus.OK, results, headers={
+            'X-Ground-Truth-Cache': 'hit' if cached else 'miss',
+            'X-Evaluation-Time': f'{elapsed:.6f}',
+        })
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+class EvaluationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], jobs: int, initargs: Tuple,
+                 max_request_bytes: int = DEFAULT_MAX_REQUEST_MB << 20):
+        self.executors = []
+        super().__init__(address, EvaluationRequestHandler)
+        self.jobs = jobs
+        self.initargs = initargs
+        self.max_request_bytes = max_request_bytes
+        self.executors = [self._start_worker() for _ in range(jobs)]
+        self._workers_lock = threading.Lock()
+
+    def _start_worker(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=self.initargs)
+
+    def shard(self, gt_id: str) -> int:
+        return zlib.crc32(gt_id.encode('utf-8')) % self.jobs
+
+    def restart_worker(self, shard: int, broken: ProcessPoolExecutor) -> None:
+        with self._workers_lock:
+            if self.executors[shard] is broken:
+                self.executors[shard] = self._start_worker()
+        broken.shutdown(wait=False)
+
+    def server_close(self) -> None:
+        super().server_close()
+        for executor in self.executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        close_ground_truth_bundles()
+
+def serve(true_dir: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, jobs: int = 1,
+          cache_size: int = DEFAULT_CACHE_SIZE, streaming_parser: bool = False,
+          ground_truth_bundle: Optional[str] = None, max_request_mb: int = DEFAULT_MAX_REQUEST_MB,
+          ted_approximate: bool = False, chord_use_alignment: bool = True,
+          measure_band: Optional[int] = None, ted_engine: str = 'apted',
+          ted_decomposed: bool = False, ted_jobs: int = 1,
+          time_budget: Optional[float] = None, memory_budget_mb: Optional[int] = None) -> None:
+    if not os.path.isdir(true_dir):
+        raise FileNotFoundError(f"Folder {true_dir} not found")
+    evaluation_options = {
+        'ted_approximate': ted_approximate,
+        'chord_use_alignment': chord_use_alignment,
+        'measure_band': measure_band,
+        'ted_engine': ted_engine,
+        'ted_decomposed': ted_decomposed,
+        'ted_jobs': ted_jobs,
+        'time_budget': time_budget,
+        'memory_budget_mb': memory_budget_mb,
+    }
+    initargs = (worker_logging_arguments(), true_dir, cache_size, streaming_parser,
+                ground_truth_bundle, evaluation_options)
+    server = EvaluationServer((host, port), jobs, initargs, max_request_bytes=max_request_mb << 20)
+    host, port = server.server_address[:2]
+    logger.info(f"Serving metrics for ground truth in {true_dir} on http://{host}:{port} "
+                f"with {jobs} worker processes (cache: {cache_size} scores per worker)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Serve OMR metrics over localhost HTTP, keeping parsed ground truth scores in memory',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('true_dir', help='Path to folder with ground truth files')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                       help=f'Address to listen on (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                       help=f'Port to listen on, 0 for any free port (default: {DEFAULT_PORT})')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of worker processes evaluating requests concurrently; each ground truth score '
+                            'is always evaluated by the same worker (default: 1)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                       help=f'Ground truth scores kept in memory by each worker (default: {DEFAULT_CACHE_SIZE})')
+    parser.add_argument('--ground-truth-bundle', default=None,
+                       help='Load ground truth features from a bundle written by precompute.py '
+                            'instead of parsing the scores')
+    parser.add_argument('--max-request-mb', type=int, default=DEFAULT_MAX_REQUEST_MB,
+                       help=f'Largest accepted prediction upload in MB (default: {DEFAULT_MAX_REQUEST_MB})')
+    parser.add_argument('--ted-approximate', action='store_true',
+                       help='Use approximate algorithm for large trees (much faster)')
+    parser.add_argument('--ted-engine', choices=list(TED_ENGINES), default='apted',
+                       help='Exact Tree Edit Distance implementation: apted (default) or numpy')
+    parser.add_argument('--ted-decomposed', action='store_true',
+                       help='Also compute exact TED per aligned measure')
+    parser.add_argument('--ted-jobs', type=int, default=1,
+                       help='Number of worker processes for per-measure TED (default: 1)')
+    parser.add_argument('--no-chord-alignment', action='store_true',
+                       help='Disable chord sequence alignment (use strict position matching)')
+    parser.add_argument('--streaming-parser', action='store_true',
+                       help='Build score trees with the single-pass streaming parser')
+    parser.add_argument('--measure-band', type=int, default=None,
+                       help='Restrict measure alignment to a diagonal band of this width')
+    parser.add_argument('--time-budget', type=float, default=None,
+                       help='Seconds allowed per pair for exact TED and chord alignment together before falling back')
+    parser.add_argument('--memory-budget', type=int, default=None,
+                       help='Additional memory in MB allowed for exact TED and for chord alignment')
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='info',
+                       help='Verbosity of progress messages: quiet, error, warning, info (default), debug')
+    parser.add_argument('--progress-json', default=None,
+                       help='Append machine-readable progress events (JSON lines) to this file, or "-" for stdout')
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.progress_json)
+    try:
+        serve(
+            args.true_dir,
+            host=args.host,
+            port=args.port,
+            jobs=args.jobs,
+            cache_size=args.cache_size,
+            streaming_parser=args.streaming_parser,
+            ground_truth_bundle=args.ground_truth_bundle,
+            max_request_mb=args.max_request_mb,
+            ted_approximate=args.ted_approximate,
+            chord_use_alignment=not args.no_chord_alignment,
+            measure_band=args.measure_band,
+            ted_engine=args.ted_engine,
+            ted_decomposed=args.ted_decomposed,
+            ted_jobs=args.ted_jobs,
+            time_budget=args.time_budget,
+            memory_budget_mb=args.memory_budget
+        )
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+    except Exception as e:
+        print(f"\nError: {e}")
+        sys.exit(1)
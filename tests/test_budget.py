@@ -0,0 +1,31 @@
+import time
+import pytest
+from metrics.budget import BudgetExceeded, PairBudget, run_with_budget
+
+def _fail(message: str) -> None:
+    raise ValueError(message)
+
+def _sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+@pytest.mark.parametrize('time_budget', [None, 10])
+def test_exceptions_are_raised_unchanged(time_budget):
+    with pytest.raises(ValueError, match="unsupported option"):
+        run_with_budget(_fail, ("unsupported option",), time_budget=time_budget)
+
+def test_result_is_returned_within_budget():
+    assert run_with_budget(_sleep, (0.01,), time_budget=10) == 0.01
+
+def test_time_budget_is_enforced():
+    with pytest.raises(BudgetExceeded):
+        run_with_budget(_sleep, (10,), time_budget=0.2)
+
+def test_pair_budget_is_shared_between_stages():
+    budget = PairBudget(time_budget=0.5)
+    assert budget.run(_sleep, (0.3,)) == 0.3
+    with pytest.raises(BudgetExceeded):
+        budget.run(_sleep, (0.3,))
+
+def test_pair_budget_without_limits_runs_in_process():
+    assert PairBudget().run(_sleep, (0.01,)) == 0.01
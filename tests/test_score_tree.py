@@ -0,0 +1,40 @@
+import pytest
+from benchmarks.synthetic_scores import generate_pair
+from core.score_tree import Node, create_simplified_tree
+
+SCORE_SIZES = [
+    (1, 1, 1, 0),
+    (4, 1, 4, 1),
+    (16, 2, 4, 2),
+    (32, 3, 6, 3),
+    (64, 4, 8, 4),
+]
+
+def assert_same_tree(expected: Node, actual: Node, path: str = "root") -> None:
+    assert actual.label == expected.label, f"{path}: label {actual.label!r} != {expected.label!r}"
+    assert actual.value == expected.value, f"{path}: value {actual.value!r} != {expected.value!r}"
+    assert actual.id == expected.id, f"{path}: id {actual.id!r} != {expected.id!r}"
+    assert [child.label for child in actual.children] == [child.label for child in expected.children], \
+        f"{path}: children differ"
+    for index, (expected_child, actual_child) in enumerate(zip(expected.children, actual.children)):
+        assert_same_tree(expected_child, actual_child, f"{path}/{expected_child.label}[{index}]")
+
+@pytest.fixture(params=SCORE_SIZES, ids=lambda size: "m{}_s{}_c{}_seed{}".format(*size))
+def score_pair(request, tmp_path):
+    measures, staves, chords_per_measure, seed = request.param
+    return generate_pair(str(tmp_path), measures, staves, chords_per_measure, seed=seed,
+                         measure_insertion_rate=0.1, measure_deletion_rate=0.1, pitch_substitution_rate=0.1)
+
+def test_streaming_builder_matches_dom_builder(score_pair):
+    for path in score_pair:
+        assert_same_tree(create_simplified_tree(path), create_simplified_tree(path, streaming=True))
+
+def test_streaming_builder_rejects_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        create_simplified_tree(str(tmp_path / "missing.mscz"), streaming=True)
+
+def test_streaming_builder_rejects_invalid_archive(tmp_path):
+    path = tmp_path / "invalid.mscz"
+    path.write_bytes(b"not a zip archive")
+    with pytest.raises(ValueError):
+        create_simplified_tree(str(path), streaming=True)
@@ -0,0 +1,15 @@
+from benchmarks.synthetic_scores import generate_pair
+from core.score_tree import create_simplified_tree
+from metrics.sequence_metrics import _calculate_sequence_metrics, encode_score_tokens
+
+def test_cached_ground_truth_tokens_give_same_metrics_and_stay_unchanged(tmp_path):
+    gt_path, pred_path = generate_pair(str(tmp_path), 16, 2, 4, seed=5, measure_insertion_rate=0.1,
+                                       measure_deletion_rate=0.1, pitch_substitution_rate=0.2)
+    gt_tree = create_simplified_tree(gt_path)
+    pred_tree = create_simplified_tree(pred_path)
+    gt_tokens = encode_score_tokens(gt_tree)
+    vocabulary_size = len(gt_tokens.vocabulary)
+
+    assert _calculate_sequence_metrics(gt_tree, pred_tree, gt_tokens=gt_tokens) == \
+        _calculate_sequence_metrics(gt_tree, pred_tree)
+    assert len(gt_tokens.vocabulary) == vocabulary_size
@@ -0,0 +1,30 @@
+import pytest
+from benchmarks.synthetic_scores import generate_pair
+from core.score_tree import create_simplified_tree
+from core.tree_cache import _HEADER, encode_tree, file_digest, load_simplified_tree, tree_cache_path
+
+def _corrupt_labels(entry: bytearray) -> None:
+    node_count, string_count = _HEADER.unpack_from(entry, 0)[3:5]
+    labels_start = _HEADER.size + 12 * node_count + 4 * (string_count + 1)
+    entry[labels_start] = 255
+
+def _corrupt_values(entry: bytearray) -> None:
+    node_count = _HEADER.unpack_from(entry, 0)[3]
+    values_start = _HEADER.size + 8 * node_count
+    entry[values_start:values_start + 4] = (10 ** 6).to_bytes(4, 'little')
+
+@pytest.mark.parametrize('corrupt', [_corrupt_labels, _corrupt_values])
+def test_corrupt_cache_entry_falls_back_to_parsing(tmp_path, corrupt):
+    gt_path, _ = generate_pair(str(tmp_path), 4, 1, 4, seed=1)
+    cache_dir = str(tmp_path / "cache")
+    expected = encode_tree(create_simplified_tree(gt_path))
+    load_simplified_tree(gt_path, cache_dir=cache_dir)
+    entry_path = tree_cache_path(cache_dir, file_digest(gt_path))
+    with open(entry_path, 'rb') as file:
+        entry = bytearray(file.read())
+    corrupt(entry)
+    with open(entry_path, 'wb') as file:
+        file.write(entry)
+
+    assert encode_tree(load_simplified_tree(gt_path, cache_dir=cache_dir)) == expected
+    assert encode_tree(load_simplified_tree(gt_path, cache_dir=cache_dir)) == expected